@@ -0,0 +1,196 @@
+"""Versioned JSON read API, mounted under /api/v1.
+
+``GET /api/v1/users/<username>/shelves/<sentiment>`` returns one page of a
+shelf, best book first, keyset-paginated on (position, id) so every page is
+an index range scan however deep it is. ``fields`` picks the book fields to
+return and ``limit`` the page size. Ratings come from the same formula as the
+profile page: the cursor carries the index the page starts at and the shelf
+version it was taken from, and only when the shelf has changed since is that
+index recounted.
+
+``GET /api/v1/books/<catalog_book_id>/similar`` and
+``GET /api/v1/users/<username>/suggestions`` serve recommendations.py:
+what readers who loved a catalog book also loved, and books for a user
+picked from their shelves, best first, ``limit`` of them.
+``GET /api/v1/books/<catalog_book_id>`` is a catalog book with its
+site-wide ratings, and ``GET /api/v1/leaderboard`` the best-rated books
+(see leaderboard.py). ``GET /api/v1/feed`` is a page of the signed-in
+user's activity feed, newest first; pass its ``next_cursor`` as ``before``
+for the next page (see feed.py).
+"""
+import base64
+
+from flask import Blueprint, abort, current_app, jsonify, request
+from flask_login import current_user, login_required
+from werkzeug.exceptions import HTTPException
+
+from compression import compress_response
+from feed import read_feed
+from leaderboard import book_details, top_books
+from models import db, Book, CatalogBook, Shelf, User
+from recommendations import similar_books, suggest
+from shelves import RATING_BANDS, rating_for, read_shelves
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+RECOMMENDATIONS_LIMIT = 10
+
+# Field name -> column it is read from; rank and rating are computed
+FIELDS = {
+    'id': Book.id,
+    'title': Book.title,
+    'author': Book.author,
+    'google_books_url': Book.google_books_url,
+    'rank': None,
+    'rating': None,
+}
+
+
+def encode_cursor(version, index, position, book_id):
+    return base64.urlsafe_b64encode(f'{version}:{index}:{position}:{book_id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        version, index, position, book_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return int(version), int(index), int(position), int(book_id)
+    except (ValueError, UnicodeDecodeError):
+        abort(400, description='Invalid cursor.')
+
+
+def parse_fields(value):
+    if not value:
+        return list(FIELDS)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown or not fields:
+        abort(400, description=f'Unknown fields: {", ".join(unknown)}. Available: {", ".join(FIELDS)}.')
+    return fields
+
+
+def parse_limit(value, default=DEFAULT_LIMIT):
+    try:
+        limit = int(value) if value else default
+    except ValueError:
+        abort(400, description='limit must be an integer.')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _after(position, book_id):
+    return db.or_(Book.position > position, db.and_(Book.position == position, Book.id > book_id))
+
+
+@api.route('/users/<username>/shelves/<sentiment>')
+@login_required
+def shelf(username, sentiment):
+    if sentiment not in RATING_BANDS:
+        abort(404, description=f'Unknown shelf: {sentiment}.')
+    fields = parse_fields(request.args.get('fields'))
+    limit = parse_limit(request.args.get('limit'))
+
+    user_id = db.session.query(User.id).filter_by(username=username).scalar()
+    if user_id is None:
+        abort(404, description=f'Unknown user: {username}.')
+    summary = db.session.query(Shelf.version, Shelf.book_count) \
+        .filter_by(user_id=user_id, sentiment=sentiment).first()
+    version, total = summary if summary else (0, 0)
+
+    columns = [Book.position, Book.id] + [FIELDS[field] for field in fields
+                                          if field != 'id' and FIELDS[field] is not None]
+    query = db.session.query(*columns).filter(Book.user_id == user_id, Book.sentiment == sentiment)
+    index = 0
+    cursor = request.args.get('cursor')
+    if cursor:
+        cursor_version, index, position, book_id = decode_cursor(cursor)
+        query = query.filter(_after(position, book_id))
+        if cursor_version != version:
+            # The shelf changed since the previous page: recount where this page starts
+            index = db.session.query(db.func.count(Book.id)).filter(
+                Book.user_id == user_id, Book.sentiment == sentiment,
+                db.not_(_after(position, book_id))).scalar()
+    rows = query.order_by(Book.position, Book.id).limit(limit + 1).all()
+
+    books = []
+    for offset, row in enumerate(rows[:limit]):
+        values = row._mapping
+        book = {}
+        for field in fields:
+            if field == 'rank':
+                book[field] = index + offset + 1
+            elif field == 'rating':
+                book[field] = rating_for(sentiment, index + offset, total)
+            else:
+                book[field] = values[field]
+        books.append(book)
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(version, index + limit, last.position, last.id)
+    return jsonify({'user': username, 'sentiment': sentiment, 'total': total, 'version': version,
+                    'books': books, 'next_cursor': next_cursor})
+
+
+@api.route('/books/<int:catalog_book_id>')
+@login_required
+def catalog_book(catalog_book_id):
+    details = book_details(catalog_book_id)
+    if details is None:
+        abort(404, description=f'Unknown book: {catalog_book_id}.')
+    entry, rating = details
+    return jsonify({'id': entry.id, 'title': entry.title, 'author': entry.author,
+                    'google_books_url': entry.google_books_url, 'cover_url': entry.cover_url,
+                    'ratings': rating._asdict() if rating else None})
+
+
+@api.route('/leaderboard')
+@login_required
+def leaderboard():
+    limit = parse_limit(request.args.get('limit'), current_app.config['LEADERBOARD_SIZE'])
+    return jsonify({'books': [book._asdict() for book in top_books(limit)]})
+
+
+@api.route('/books/<int:catalog_book_id>/similar')
+@login_required
+def similar(catalog_book_id):
+    if db.session.get(CatalogBook, catalog_book_id) is None:
+        abort(404, description=f'Unknown book: {catalog_book_id}.')
+    books = similar_books(catalog_book_id, parse_limit(request.args.get('limit'), RECOMMENDATIONS_LIMIT))
+    return jsonify({'book': catalog_book_id, 'similar': [book._asdict() for book in books]})
+
+
+@api.route('/users/<username>/suggestions')
+@login_required
+def suggestions(username):
+    user_id = db.session.query(User.id).filter_by(username=username).scalar()
+    if user_id is None:
+        abort(404, description=f'Unknown user: {username}.')
+    books = suggest(read_shelves(user_id), parse_limit(request.args.get('limit'), RECOMMENDATIONS_LIMIT))
+    return jsonify({'user': username, 'suggestions': [book._asdict() for book in books]})
+
+
+@api.route('/feed')
+@login_required
+def feed():
+    try:
+        before = int(request.args['before']) if request.args.get('before') else None
+    except ValueError:
+        abort(400, description='before must be an integer.')
+    items, next_cursor = read_feed(current_user.id, before,
+                                   parse_limit(request.args.get('limit'), current_app.config['FEED_PAGE_SIZE']))
+    return jsonify({'items': [dict(item._asdict(), created_at=item.created_at.isoformat()) for item in items],
+                    'next_cursor': next_cursor})
+
+
+@api.errorhandler(HTTPException)
+def json_error(exc):
+    response = jsonify({'error': exc.name, 'message': exc.description})
+    response.status_code = exc.code
+    return response
+
+
+@api.after_request
+def compress(response):
+    return compress_response(response, request.accept_encodings)
@@ -0,0 +1,277 @@
+"""``flask assets-build``: the files assets.py serves.
+
+Pages used to load the whole Tailwind build from jsDelivr, two font families
+from Google Fonts and the images straight from static/. The build makes one
+small stylesheet and a handful of small files out of them, in ``ASSETS_DIR``:
+
+- ``app.css``: the Tailwind build minus every rule that styles a class no
+  template mentions, followed by the fonts' ``@font-face`` rules
+- ``fonts/``: the woff2 files Google Fonts would serve, one per face and
+  unicode range, without hinting or discretionary OpenType features (browsers
+  still only fetch the ranges a page uses)
+- ``images/``: the logo scaled to the size it is shown at and the favicon cut
+  down to the icon sizes browsers ask for
+
+Every file is named after a digest of its content, so it can be cached for
+good, and gets gzip and brotli siblings when they are smaller.
+``manifest.json`` maps the logical names templates use to the built ones.
+
+Downloads are kept in ``ASSETS_SOURCES_DIR`` and reused by later builds.
+Pillow, fontTools and brotli are optional; without them images and fonts are
+copied as they are and only gzip siblings are written.
+"""
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+from urllib.parse import urlparse
+
+from compression import load_brotli
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:
+    font_subset = None
+
+# Keep in step with the fallback links in templates/layout.html
+TAILWIND_URL = 'https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css'
+FONTS_URL = ('https://fonts.googleapis.com/css2?family=EB+Garamond:ital,wght@0,400;0,700;1,400;1,700'
+             '&family=Playfair+Display:wght@400;700&display=swap')
+# Google Fonts picks the font format from the User-Agent; this one gets woff2
+FONTS_USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                    'Chrome/120.0.0.0 Safari/537.36')
+
+# The logo is shown at 64px (h-16 w-16); twice that covers high-density screens
+IMAGES = {'images/quilless.png': (128, 128), 'images/favicon.ico': None}
+ICON_SIZES = [(16, 16), (32, 32), (48, 48)]
+
+# Compressed siblings are only written when they save at least this much
+MIN_SAVING = 0.1
+
+# Tailwind's own default extractor: anything in a template that could be a class name
+_CANDIDATE = re.compile(r'[^<>"\'`\s]*[^<>"\'`\s:]')
+_SELECTOR_CLASS = re.compile(r'\.((?:\\.|[\w-])+)')
+_ESCAPE = re.compile(r'\\(.)')
+_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.S)
+_LICENSE = re.compile(r'/\*!.*?\*/', re.S)
+_FONT_FACE = re.compile(r'/\*\s*([\w-]+)\s*\*/\s*@font-face\s*{([^}]*)}')
+_FONT_URL = re.compile(r'url\((https://[^)]+)\)')
+
+
+def fetch_source(url, sources_dir, headers=None):
+    """``url``'s content, downloaded once into ``sources_dir``."""
+    path = os.path.join(sources_dir, hashlib.sha1(url.encode()).hexdigest()[:16]
+                        + os.path.splitext(urlparse(url).path)[1])
+    if not os.path.exists(path):
+        import requests
+        response = requests.get(url, headers=headers, timeout=30)
+        response.raise_for_status()
+        os.makedirs(sources_dir, exist_ok=True)
+        with open(path + '.part', 'wb') as f:
+            f.write(response.content)
+        os.replace(path + '.part', path)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def used_classes(template_dir):
+    candidates = set()
+    for root, _, files in os.walk(template_dir):
+        for name in files:
+            with open(os.path.join(root, name), encoding='utf-8') as f:
+                candidates.update(_CANDIDATE.findall(f.read()))
+    return candidates
+
+
+def _rules(css):
+    """(prelude, block) for each top-level rule of minified CSS; block is None for statements like @charset."""
+    start = 0
+    while start < len(css):
+        brace = css.find('{', start)
+        if brace < 0:
+            break
+        prelude = css[start:brace]
+        while ';' in prelude:
+            statement, prelude = prelude.split(';', 1)
+            yield statement.strip() + ';', None
+        depth, end = 1, brace + 1
+        while depth:
+            depth += {'{': 1, '}': -1}.get(css[end], 0)
+            end += 1
+        yield prelude.strip(), css[brace + 1:end - 1]
+        start = end
+
+
+def _split_selectors(prelude):
+    selectors, depth, start = [], 0, 0
+    for i, char in enumerate(prelude):
+        depth += {'(': 1, '[': 1, ')': -1, ']': -1}.get(char, 0)
+        if char == ',' and not depth:
+            selectors.append(prelude[start:i])
+            start = i + 1
+    return selectors + [prelude[start:]]
+
+
+def purge(css, used):
+    """``css`` without the rules, selectors and keyframes nothing in ``used`` can match."""
+    kept = []
+    for prelude, block in _rules(css):
+        if block is None:
+            kept.append(prelude)
+        elif prelude.startswith(('@media', '@supports')):
+            inner = purge(block, used)
+            if inner:
+                kept.append(f'{prelude}{{{inner}}}')
+        elif prelude.startswith('@keyframes'):
+            if 'animate-' + prelude.split()[1] in used:
+                kept.append(f'{prelude}{{{block}}}')
+        elif prelude.startswith('@'):
+            kept.append(f'{prelude}{{{block}}}')
+        else:
+            selectors = [selector for selector in _split_selectors(prelude)
+                         if all(_ESCAPE.sub(r'\1', name) in used for name in _SELECTOR_CLASS.findall(selector))]
+            if selectors:
+                kept.append(f'{",".join(selectors)}{{{block}}}')
+    return ''.join(kept)
+
+
+def strip_font(data):
+    """woff2 ``data`` without hinting or discretionary layout features; as it is without fontTools.
+
+    Every glyph in the font's cmap is kept. Book titles, authors and reviews
+    can be in any script, so which characters a page needs is not known at
+    build time; Google Fonts' split into unicode ranges already keeps
+    browsers from fetching faces a page has no use for.
+    """
+    if font_subset is None:
+        return data
+    logging.getLogger('fontTools').setLevel(logging.ERROR)  # one warning per table it has no use for
+    options = font_subset.Options()
+    options.flavor = 'woff2'
+    options.hinting = False
+    font = font_subset.load_font(io.BytesIO(data), options)
+    subsetter = font_subset.Subsetter(options)
+    subsetter.populate(unicodes=font.getBestCmap())
+    subsetter.subset(font)
+    out = io.BytesIO()
+    font_subset.save_font(font, out, options)
+    return out.getvalue()
+
+
+def recompress_image(data, size):
+    if Image is None:
+        return data
+    image = Image.open(io.BytesIO(data))
+    out = io.BytesIO()
+    if image.format == 'ICO':
+        image.save(out, format='ICO', sizes=ICON_SIZES)
+    else:
+        if size:
+            image.thumbnail(size, Image.LANCZOS)
+        image.save(out, format=image.format, optimize=True)
+    # Keep the original if it was already smaller
+    return min(out.getvalue(), data, key=len)
+
+
+class Build:
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.manifest = {}
+        self.report = []
+
+    def write(self, name, data, source_size):
+        """Write ``data`` as ``name`` with a content digest in its file name, plus compressed siblings."""
+        stem, extension = os.path.splitext(name)
+        built = f'{stem}.{hashlib.sha256(data).hexdigest()[:10]}{extension}'
+        path = os.path.join(self.out_dir, built)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        sizes = {}
+        brotli = load_brotli()
+        for suffix, compress in (('.gz', lambda data: gzip.compress(data, 9, mtime=0)),
+                                 ('.br', brotli and (lambda data: brotli.compress(data, quality=11)))):
+            if compress is None:
+                continue
+            compressed = compress(data)
+            if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+                sizes[suffix] = len(compressed)
+        self.manifest[name] = built
+        self.report.append((name, source_size, len(data), min(sizes.values(), default=len(data))))
+        return built
+
+
+def build_fonts(build, sources_dir):
+    """Self-hosted copies of the Google Fonts faces; returns their ``@font-face`` rules."""
+    css = fetch_source(FONTS_URL, sources_dir, {'User-Agent': FONTS_USER_AGENT}).decode()
+    rules = []
+    for unicode_subset, declarations in _FONT_FACE.findall(css):
+        properties = {key.strip(): value.strip()
+                      for key, value in (line.split(':', 1) for line in declarations.split(';') if ':' in line)}
+        family = properties['font-family'].strip('\'"').lower().replace(' ', '-')
+        name = f'fonts/{family}-{properties["font-weight"]}-{properties["font-style"]}-{unicode_subset}.woff2'
+        source = fetch_source(_FONT_URL.search(declarations).group(1), sources_dir)
+        built = build.write(name, strip_font(source), len(source))
+        # app.css sits at the top of the assets directory, so this relative URL finds the font
+        properties['src'] = f"url({built}) format('woff2')"
+        rule = ';'.join(f'{key}:{value}' for key, value in properties.items())
+        rules.append(f'@font-face{{{rule}}}')
+    return ''.join(rules)
+
+
+def build_assets(static_dir, template_dir, out_dir, sources_dir):
+    """Build everything into a fresh ``out_dir``. Returns (name, source bytes, built bytes, compressed bytes) rows.
+
+    The build happens in a temporary directory next to ``out_dir`` and only
+    replaces it once every file is written, so a failed download leaves the
+    previous build in place.
+    """
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.assets-', dir=parent)
+    try:
+        report = _build_into(staging, static_dir, template_dir, sources_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    os.chmod(staging, 0o755)  # mkdtemp makes it private to the build user
+    # os.replace will not replace a non-empty directory, so move the old build aside first
+    previous = None
+    if os.path.exists(out_dir):
+        previous = tempfile.mkdtemp(prefix='.assets-old-', dir=parent)
+        os.replace(out_dir, os.path.join(previous, 'build'))
+    os.replace(staging, out_dir)
+    if previous:
+        shutil.rmtree(previous, ignore_errors=True)
+    return report
+
+
+def _build_into(out_dir, static_dir, template_dir, sources_dir):
+    build = Build(out_dir)
+
+    font_faces = build_fonts(build, sources_dir)
+    tailwind = fetch_source(TAILWIND_URL, sources_dir).decode()
+    licenses = ''.join(_LICENSE.findall(tailwind))
+    stylesheet = licenses + purge(_COMMENT.sub('', _LICENSE.sub('', tailwind)), used_classes(template_dir)) + font_faces
+    build.write('app.css', stylesheet.encode(), len(tailwind.encode()))
+
+    for name, size in IMAGES.items():
+        with open(os.path.join(static_dir, name), 'rb') as f:
+            source = f.read()
+        build.write(name, recompress_image(source, size), len(source))
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(build.manifest, f, indent=2, sort_keys=True)
+    return build.report
@@ -0,0 +1,57 @@
+"""Serving the built static assets (see asset_build.py).
+
+Built files are named after their content, so ``/assets/<name>`` lets
+browsers keep them for a year without asking again (``immutable``), and
+picks the brotli or gzip file written next to each one by the build when the
+browser accepts it. ``asset_url`` gives templates the URL for a logical name
+such as ``app.css``, or None when no build has been made, so pages can fall
+back to the original files.
+"""
+import json
+import mimetypes
+import os
+
+from flask import Blueprint, abort, current_app, request, send_file, url_for
+from werkzeug.security import safe_join
+
+assets = Blueprint('assets', __name__)
+
+# Preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def read_manifest(assets_dir):
+    try:
+        with open(os.path.join(assets_dir, 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+@assets.record_once
+def load_manifest(state):
+    # Read once per process; a new build comes with a new deploy
+    state.app.extensions['assets'] = read_manifest(state.app.config['ASSETS_DIR'])
+
+
+@assets.app_template_global()
+def asset_url(name):
+    built = current_app.extensions['assets'].get(name)
+    return url_for('assets.serve', filename=built) if built else None
+
+
+@assets.route('/assets/<path:filename>')
+def serve(filename):
+    path = safe_join(current_app.config['ASSETS_DIR'], filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    encoding, suffix = next(((encoding, suffix) for encoding, suffix in ENCODINGS
+                             if request.accept_encodings[encoding] and os.path.isfile(path + suffix)), (None, ''))
+    response = send_file(path + suffix, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                         conditional=True, max_age=current_app.config['ASSETS_MAX_AGE'])
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,48 @@
+"""Initials avatars drawn here instead of fetched from a third party.
+
+An avatar depends on nothing but the username, so ``/avatar/<username>.svg``
+needs no query. Rendered bodies are kept in an LRU, and the route serves them
+with a strong ETag and as ``immutable``: browsers that have one never ask for
+it again, so a new drawing would need a new URL.
+"""
+import hashlib
+import re
+from functools import lru_cache
+from html import escape
+from urllib.parse import quote
+
+# Background colours, picked by a hash of the username; all dark enough for white initials
+PALETTE = ('#5A1A27', '#7B3F00', '#2F4F4F', '#355E3B', '#1F3A5F', '#4B3869', '#6B4226', '#8B3A3A')
+
+_WORD = re.compile(r'[^\W_]+')
+
+TEMPLATE = ('<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 64 64" width="64" height="64">'
+            '<title>{username}</title>'
+            '<circle cx="32" cy="32" r="32" fill="{color}"/>'
+            '<text x="50%" y="50%" dy=".35em" text-anchor="middle" fill="#FFF8E7" font-size="26" '
+            'font-family="\'Playfair Display\', Georgia, serif" font-weight="700">{initials}</text>'
+            '</svg>')
+
+
+def initials(username):
+    """Up to two letters: the first of each of the first two words, or the first two of a single word."""
+    words = _WORD.findall(username)
+    if len(words) >= 2:
+        letters = words[0][0] + words[1][0]
+    else:
+        letters = (words[0] if words else username)[:2]
+    return letters.upper()
+
+
+def avatar_path(username):
+    """The avatar's URL for ``username``, as stored in ``User.profile_image``; a "/" in it is escaped too."""
+    return f"/avatar/{quote(username, safe='')}.svg"
+
+
+@lru_cache(maxsize=4096)
+def render_avatar(username):
+    """(SVG body, strong ETag) for ``username``."""
+    digest = hashlib.sha1(username.encode()).digest()
+    body = TEMPLATE.format(username=escape(username), color=PALETTE[digest[0] % len(PALETTE)],
+                           initials=escape(initials(username))).encode()
+    return body, hashlib.sha1(body).hexdigest()[:16]
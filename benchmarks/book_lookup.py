@@ -0,0 +1,51 @@
+"""Measure BookLookup hit/miss latency and coalescing against FakeBooksAPI.
+
+    python -m benchmarks.book_lookup
+"""
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fake_books_api import FakeBooksAPI
+from book_lookup import BookLookup, parse_volumes
+
+
+def main(upstream_latency=0.05, repeats=10000, concurrency=32):
+    with FakeBooksAPI(latency=upstream_latency) as api:
+        def fetch(query):
+            response = requests.get(api.url, params={'q': query, 'maxResults': 5})
+            response.raise_for_status()
+            return parse_volumes(response.json())
+
+        lookup = BookLookup(fetch)
+
+        started = time.perf_counter()
+        lookup.search('Hannah Aren')
+        print(f'cold miss:      {1000 * (time.perf_counter() - started):8.3f} ms')
+
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            lookup.search('  hannah   AREN ')
+            timings.append(time.perf_counter() - started)
+        print(f'cache hit p50:  {1000 * statistics.median(timings):8.4f} ms')
+        print(f'cache hit max:  {1000 * max(timings):8.4f} ms')
+
+        started = time.perf_counter()
+        prefix_books = lookup.search('hannah arendt')
+        print(f'prefix hit:     {1000 * (time.perf_counter() - started):8.4f} ms '
+              f'({len(prefix_books)} books from cached "hannah aren")')
+        time.sleep(2 * upstream_latency)  # let the background refresh land
+
+        before = api.requests
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lookup.search, ['the human condition'] * concurrency))
+        print(f'{concurrency} concurrent identical misses -> {api.requests - before} upstream call(s)')
+
+        print('stats:', lookup.stats.snapshot())
+
+
+if __name__ == '__main__':
+    main()
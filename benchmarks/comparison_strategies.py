@@ -0,0 +1,73 @@
+"""Replay synthetic users placing books with each comparison strategy.
+
+Every simulated user reads books from a handful of favourite authors, whose
+books they rate alike, and their taste drifts over time, so recent books tend
+to land near each other. Each new book is ranked against the user's shelf
+with the strategy's probes answered by the book's hidden score. Reports
+comparisons and server round trips (the rate page plus one POST per
+comparison) per placement, and how far off the final spot is when the search
+may stop early:
+
+    python -m benchmarks.comparison_strategies [users] [books_per_user]
+"""
+import random
+import statistics
+import sys
+from collections import namedtuple
+
+from comparison import STRATEGIES
+
+SimBook = namedtuple('SimBook', 'id author score')
+
+TOLERANCES = (0, 2)
+
+
+def synthetic_user(rng, books):
+    authors = [f'author-{i}' for i in range(40)]
+    quality = {author: rng.gauss(0, 1) for author in authors}
+    favourites = rng.sample(authors, 8)
+    for book_id in range(books):
+        # Mostly favourite authors, taste drifting slowly over the years
+        author = rng.choice(favourites) if rng.random() < 0.7 else rng.choice(authors)
+        drift = 1.5 * book_id / books
+        yield SimBook(book_id, author, quality[author] + drift + rng.gauss(0, 0.4))
+
+
+def place(strategy, shelf, book, tolerance):
+    """Rank ``book`` against ``shelf`` (best first); returns (comparisons, index chosen)."""
+    state = {'lo': 0, 'hi': len(shelf)}
+    strategy.begin(state, lambda: [(entry.id, entry.author) for entry in shelf], book)
+    comparisons = 0
+    while state['hi'] - state['lo'] > tolerance:
+        comparisons += 1
+        strategy.record(state, book.score > shelf[state['next']].score)
+    return comparisons, (state['lo'] + state['hi']) // 2
+
+
+def simulate(strategy, tolerance, users, books_per_user, seed=7):
+    rng = random.Random(seed)
+    comparisons, errors = [], []
+    for _ in range(users):
+        shelf = []
+        for book in synthetic_user(rng, books_per_user):
+            count, index = place(strategy, shelf, book, tolerance)
+            true_index = sum(entry.score > book.score for entry in shelf)
+            comparisons.append(count)
+            errors.append(abs(index - true_index))
+            shelf.insert(true_index, book)
+    return statistics.mean(comparisons), statistics.mean(errors), max(errors)
+
+
+def main(users=200, books_per_user=150):
+    print(f'{users} users x {books_per_user} books')
+    print(f'{"strategy":>10} {"tolerance":>9} {"comparisons":>12} {"round trips":>12} {"mean error":>11} '
+          f'{"max error":>10}')
+    for tolerance in TOLERANCES:
+        for name, strategy in STRATEGIES.items():
+            comparisons, mean_error, max_error = simulate(strategy, tolerance, users, books_per_user)
+            print(f'{name:>10} {tolerance:>9} {comparisons:>12.2f} {comparisons + 1:>12.2f} {mean_error:>11.2f} '
+                  f'{max_error:>10}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,102 @@
+"""Local stand-in for the Google Books volumes endpoint.
+
+Point ``GOOGLE_BOOKS_API_URL`` at ``FakeBooksAPI.url`` to exercise the lookup
+layer without touching the network::
+
+    with FakeBooksAPI(latency=0.05) as api:
+        app.config['GOOGLE_BOOKS_API_URL'] = api.url
+"""
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CATALOG = [
+    ('The Human Condition', 'Hannah Arendt'),
+    ('The Origins of Totalitarianism', 'Hannah Arendt'),
+    ('Eichmann in Jerusalem', 'Hannah Arendt'),
+    ('Between Past and Future', 'Hannah Arendt'),
+    ('Middlemarch', 'George Eliot'),
+    ('Silas Marner', 'George Eliot'),
+    ('Mrs Dalloway', 'Virginia Woolf'),
+    ('To the Lighthouse', 'Virginia Woolf'),
+]
+
+
+def _volumes(query, max_results):
+    terms = query.lower().split()
+    matches = [(title, author) for title, author in CATALOG
+               if any(term in f'{title} {author}'.lower() for term in terms)]
+    matches += [(f'{query.title()} Volume {i + 1}', f'{query.title()} Author')
+                for i in range(max_results - len(matches))]
+    return [
+        {'volumeInfo': {
+            'title': title,
+            'authors': [author],
+            'infoLink': f'https://books.example/{title.replace(" ", "+")}',
+            'industryIdentifiers': [{'type': 'ISBN_13', 'identifier': f'978{zlib.crc32(title.encode()):010d}'}],
+            'imageLinks': {'thumbnail': f'https://books.example/covers/{title.replace(" ", "+")}.jpg'},
+        }}
+        for title, author in matches[:max_results]
+    ]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        api = self.server.api
+        params = parse_qs(urlparse(self.path).query)
+        query = params.get('q', [''])[0]
+        max_results = int(params.get('maxResults', ['5'])[0])
+        with api.lock:
+            api.requests += 1
+            api.queries.append(query)
+        if api.latency:
+            time.sleep(api.latency)
+
+        if api.status != 200:
+            body = b'{"error": "unavailable"}'
+        else:
+            body = json.dumps({'items': _volumes(query, max_results)}).encode()
+        self.send_response(api.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class FakeBooksAPI:
+    def __init__(self, latency=0.0, status=200):
+        self.latency = latency
+        self.status = status
+        self.requests = 0
+        self.queries = []
+        self.lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.api = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/books/v1/volumes'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
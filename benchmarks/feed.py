@@ -0,0 +1,128 @@
+"""Fan-out on write against fan-out on read, for an account with 10,000 followers.
+
+Seeds a popular reader followed by ``followers`` readers, each of whom also
+follows ``FOLLOWS`` of ``AUTHORS`` ordinary readers whose past activity has
+already been fanned out into their timelines. The popular reader then ranks
+``posts`` books with their activity copied to every follower, and ``posts``
+more after being switched to ``fan_out_on_read``, and the benchmark reports
+for each:
+
+- rows written per activity (the activity itself plus its timeline entries)
+  and the time the ``fan_out_activity`` job takes
+- latency of the first page of a follower's feed, and of the third
+
+followed by the time ``trim_timelines`` takes to cut every timeline back to
+``FEED_TIMELINE_SIZE``.
+
+    python -m benchmarks.feed [followers] [posts]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['JOBS_WORKERS'] = '0'
+
+from app import create_app  # noqa: E402
+from feed import fan_out_activity, read_feed, trim_timelines  # noqa: E402
+from models import db, Activity, Follow, TimelineEntry, User  # noqa: E402
+
+AUTHORS = 500
+FOLLOWS = 20
+PAST_ACTIVITIES = 5000
+SAMPLES = 1000
+
+
+def post(actor_id, n):
+    activity = Activity(actor_id=actor_id, verb='ranked', title=f'Book {n}', author=f'Author {n % 100}',
+                        sentiment='beloved', rank=1 + n % 10, fanned_out=False, created_at=datetime.utcnow())
+    db.session.add(activity)
+    db.session.flush()
+    return activity.id
+
+
+def seed(followers):
+    """User 1 is followed by users 2 .. followers + 1; the ordinary readers come after them."""
+    popular = 1
+    authors = range(followers + 2, followers + 2 + AUTHORS)
+    db.session.bulk_insert_mappings(User, [{'id': user_id, 'username': f'reader_{user_id}', 'session_version': 0}
+                                           for user_id in range(1, followers + 2 + AUTHORS)])
+    now = datetime.utcnow()
+    follows = []
+    for follower in range(2, followers + 2):
+        follows.append({'follower_id': follower, 'followee_id': popular, 'created_at': now})
+        follows.extend({'follower_id': follower, 'followee_id': author, 'created_at': now}
+                       for author in random.sample(authors, FOLLOWS))
+    db.session.bulk_insert_mappings(Follow, follows)
+    for n in range(PAST_ACTIVITIES):
+        fan_out_activity(post(random.choice(authors), n))
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+    return popular
+
+
+def latencies(function, arguments):
+    times = []
+    for argument in arguments:
+        started = time.perf_counter()
+        function(argument)
+        times.append((time.perf_counter() - started) * 1000)
+    times.sort()
+    return f'p50 {statistics.median(times):.2f} ms, p99 {times[int(len(times) * 0.99)]:.2f} ms'
+
+
+def third_page_cursor(user_id):
+    _, cursor = read_feed(user_id)
+    return read_feed(user_id, cursor)[1]
+
+
+def report(mode, popular, posts, sample):
+    copied = []
+    times = []
+    for n in range(posts):
+        activity_id = post(popular, n)
+        started = time.perf_counter()
+        copied.append(fan_out_activity(activity_id))
+        db.session.commit()
+        times.append((time.perf_counter() - started) * 1000)
+    print(f'{mode}: {1 + statistics.mean(copied):,.0f} rows written per activity, '
+          f'fan-out job p50 {statistics.median(times):.2f} ms')
+    print(f'  first page: {latencies(read_feed, sample)}')
+    cursors = {user_id: third_page_cursor(user_id) for user_id in sample}
+    print(f'  third page: {latencies(lambda user_id: read_feed(user_id, cursors[user_id]), sample)}')
+
+
+def main(followers=10_000, posts=50):
+    followers, posts = int(followers), int(posts)
+    random.seed(25)
+    app = create_app({'FEED_FANOUT_LIMIT': followers, 'FEED_TIMELINE_SIZE': 200, 'FEED_TRIM_INTERVAL': 0})
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        popular = seed(followers)
+        print(f'{followers:,} followers, {db.session.query(db.func.count(Follow.follower_id)).scalar():,} follows, '
+              f'{db.session.query(db.func.count(TimelineEntry.user_id)).scalar():,} timeline entries, '
+              f'seeded in {time.perf_counter() - started:.1f}s')
+        sample = random.sample(range(2, followers + 2), min(SAMPLES, followers))
+
+        report('fan-out on write', popular, posts, sample)
+        app.config['FEED_FANOUT_LIMIT'] = followers - 1
+        report('fan-out on read', popular, posts, sample)
+        assert db.session.get(User, popular).fan_out_on_read
+
+        first, _ = read_feed(sample[0], limit=posts)
+        assert all(item.username == 'reader_1' for item in first), 'the latest activity is the popular reader\'s'
+
+        started = time.perf_counter()
+        trimmed = trim_timelines()
+        db.session.commit()
+        print(f'trim to {app.config["FEED_TIMELINE_SIZE"]} entries: {trimmed:,} removed '
+              f'in {time.perf_counter() - started:.2f}s')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
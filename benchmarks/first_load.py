@@ -0,0 +1,83 @@
+"""Bytes a browser with an empty cache downloads for a page, before and after `flask assets-build`.
+
+Builds the assets into a temporary directory (downloading the sources into
+``ASSETS_SOURCES_DIR`` unless an earlier build left them there), then loads
+the page through the test client both ways:
+
+- before: the CDN stylesheets, counted as served with brotli, plus the Latin
+  font files Google Fonts points to and the images as static/ serves them
+- after: everything from /assets with ``Accept-Encoding: br, gzip``, plus the
+  Latin font files app.css points to
+
+Fonts are counted for every face declared, though a page only fetches the
+faces it actually uses:
+
+    python -m benchmarks.first_load [path]
+"""
+import os
+import re
+import sys
+import tempfile
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['JOBS_WORKERS'] = '0'
+
+from app import create_app  # noqa: E402
+from asset_build import FONTS_USER_AGENT, FONTS_URL, build_assets, fetch_source  # noqa: E402
+from compression import compress, has_brotli  # noqa: E402
+from models import db  # noqa: E402
+
+LINKED = re.compile(r'<(?:link|img)\b[^>]*?(?:href|src)="([^"]+)"')
+LATIN_FONT = re.compile(r'/\*\s*latin\s*\*/[^}]*?url\(([^)]+)\)')
+ACCEPT = {'Accept-Encoding': 'br, gzip'}
+
+
+def wire_size(data):
+    return len(compress(data, 'br' if has_brotli() else 'gzip'))
+
+
+def load(app, path):
+    """{url: bytes} for the page at ``path`` and what it links to."""
+    client = app.test_client()
+    page = client.get(path, headers=ACCEPT)
+    sizes = {path: len(page.data)}
+    sources_dir = app.config['ASSETS_SOURCES_DIR']
+    for url in LINKED.findall(page.get_data(as_text=True)):
+        url = url.replace('&amp;', '&')
+        if url == FONTS_URL:
+            css = fetch_source(url, sources_dir, {'User-Agent': FONTS_USER_AGENT})
+            sizes[url] = wire_size(css)
+            for font in LATIN_FONT.findall(css.decode()):
+                sizes[font] = len(fetch_source(font, sources_dir))
+        elif url.startswith('https://'):
+            sizes[url] = wire_size(fetch_source(url, sources_dir))
+        elif url.startswith(('/static/', '/assets/')):
+            response = client.get(url, headers=ACCEPT)
+            sizes[url] = len(response.data)
+            if url.endswith('.css'):
+                css = response.data if 'Content-Encoding' not in response.headers else client.get(url).data
+                for font in re.findall(r'url\(([^)]+-latin\.[^)]+)\)', css.decode()):
+                    sizes[font] = len(client.get(f'/assets/{font}').data)
+    return sizes
+
+
+def main(path='/login'):
+    before_app = create_app({'ASSETS_DIR': tempfile.mkdtemp()})
+    with before_app.app_context():
+        db.create_all()
+    before = load(before_app, path)
+
+    assets_dir = os.path.join(tempfile.mkdtemp(), 'dist')
+    build_assets(before_app.static_folder, os.path.join(before_app.root_path, 'templates'), assets_dir,
+                 before_app.config['ASSETS_SOURCES_DIR'])
+    after = load(create_app({'ASSETS_DIR': assets_dir}), path)
+
+    for name, sizes in (('before', before), ('after', after)):
+        print(f'{name}: {sum(sizes.values()):,} bytes in {len(sizes)} requests')
+        for url, size in sorted(sizes.items(), key=lambda item: -item[1]):
+            print(f'  {size:>9,}  {url[:90]}')
+    print(f'{sum(before.values()) / sum(after.values()):.1f}x fewer bytes')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
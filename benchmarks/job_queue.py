@@ -0,0 +1,69 @@
+"""add_book latency with an empty vs a deep background job queue.
+
+Enrichment runs in the in-process worker threads against a slow fake Google
+Books while requests keep arriving; the request path only inserts a job row.
+Both runs add to an equally sized shelf, so only the queue differs:
+
+    python -m benchmarks.job_queue
+"""
+import os
+import statistics
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ.setdefault('JOBS_WORKERS', '2')
+
+from benchmarks.fake_books_api import FakeBooksAPI  # noqa: E402
+from app import create_app  # noqa: E402
+from extensions import job_queue  # noqa: E402
+from jobs import enqueue  # noqa: E402
+from models import db, Book, User  # noqa: E402
+
+app = create_app()
+
+
+def add_books(client, count, sentiment):
+    timings = []
+    for i in range(count):
+        started = time.perf_counter()
+        client.post('/add_book', data={'title': f'{sentiment} {i}', 'author': 'Someone', 'sentiment': sentiment,
+                                       'google_books_url': ''})
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def main(requests=200, backlog=5000):
+    with FakeBooksAPI(latency=0.2) as api:
+        app.config['GOOGLE_BOOKS_API_URL'] = api.url
+        with app.app_context():
+            db.create_all()
+            user = User(username='reader', profile_image='')
+            user.set_password('pw')
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+        client = app.test_client()
+        client.post('/login', data={'username': 'reader', 'password': 'pw'})
+
+        p50, p99 = add_books(client, requests, 'beloved')
+        print(f'{"empty queue":>22}: add_book p50 {1000 * p50:6.2f} ms  p99 {1000 * p99:6.2f} ms')
+
+        with app.app_context():
+            db.session.bulk_insert_mappings(Book, [
+                {'title': f'Backlog {i}', 'author': 'Someone Else', 'sentiment': 'disliked', 'position': i,
+                 'user_id': user_id, 'google_books_url': None} for i in range(backlog)])
+            for (book_id,) in db.session.query(Book.id).filter(Book.title.startswith('Backlog')):
+                enqueue('enrich_book', {'book_id': book_id})
+            db.session.commit()
+        p50, p99 = add_books(client, requests, 'tolerated')
+        with app.app_context():
+            pending = job_queue.depth()
+        print(f'{backlog} jobs queued: add_book p50 {1000 * p50:6.2f} ms  p99 {1000 * p99:6.2f} ms  '
+              f'({pending} still pending, {api.requests} Google calls so far)')
+        job_queue.stop(timeout=5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Keeping site-wide book ratings up to date, and reading them back.
+
+Seeds readers with rated shelves drawn from a shared pool of titles through
+``refresh_shelf``, then makes random shelf changes (adds, moves, deletes),
+each followed by ``refresh_shelf`` as the views do, and reports:
+
+- the time a change takes with and without updating the aggregates, and
+  how many aggregate rows each one writes
+- whether the incrementally kept aggregates still equal a full rebuild
+  (exits non-zero if not)
+- leaderboard and book lookups read from the aggregates, against ranking
+  the books from every shelf summary on demand
+
+    python -m benchmarks.leaderboard [readers] [changes]
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['JOBS_WORKERS'] = '0'
+
+from sqlalchemy import event  # noqa: E402
+
+import shelves  # noqa: E402
+from app import create_app  # noqa: E402
+from catalog import catalog_key  # noqa: E402
+from leaderboard import book_details, rebuild_aggregates, top_books  # noqa: E402
+from models import db, Book, BookAggregate, CatalogBook, Shelf, User  # noqa: E402
+from ordering import GAP, append_position, place_book  # noqa: E402
+
+TITLES = 5000
+BOOKS_PER_READER = 30
+
+
+def seed(readers):
+    db.session.bulk_insert_mappings(CatalogBook, [
+        {'key': catalog_key(f'Book {i}', f'Author {i % 500}'), 'title': f'Book {i}', 'author': f'Author {i % 500}',
+         'search_text': f'book {i} author {i % 500}', 'times_added': 1} for i in range(TITLES)])
+    for reader in range(readers):
+        user = User(username=f'reader_{reader}', profile_image='')
+        db.session.add(user)
+        db.session.flush()
+        titles = random.sample(range(TITLES), BOOKS_PER_READER)
+        db.session.bulk_insert_mappings(Book, [
+            {'title': f'Book {i}', 'author': f'Author {i % 500}', 'sentiment': shelves.SENTIMENTS[n % 3],
+             'position': (n // 3 + 1) * GAP, 'user_id': user.id} for n, i in enumerate(titles)])
+        for sentiment in shelves.SENTIMENTS:
+            shelves.refresh_shelf(user.id, sentiment)
+    db.session.commit()
+
+
+def change(readers):
+    """One random add, move or delete on a random shelf, committed with its refresh_shelf."""
+    user_id = random.randint(1, readers)
+    sentiment = random.choice(shelves.SENTIMENTS)
+    books = Book.query.filter_by(user_id=user_id, sentiment=sentiment).all()
+    kind = random.choice(('add', 'move', 'delete') if len(books) > 2 else ('add',))
+    if kind == 'add':
+        i = random.randrange(TITLES)
+        db.session.add(Book(title=f'Book {i}', author=f'Author {i % 500}', sentiment=sentiment, user_id=user_id,
+                            position=append_position(user_id, sentiment)))
+    elif kind == 'move':
+        book, anchor = random.sample(books, 2)
+        place_book(book, anchor, above=random.random() < 0.5)
+    else:
+        db.session.delete(random.choice(books))
+    shelves.refresh_shelf(user_id, sentiment)
+    db.session.commit()
+
+
+def snapshot():
+    return {row.key: (row.readers, round(row.rating_sum, 4), row.beloved) for row in BookAggregate.query}
+
+
+def on_demand(limit=50):
+    """The leaderboard computed from every shelf summary, as it would be without the aggregates."""
+    totals = {}
+    for sentiment, entries in db.session.query(Shelf.sentiment, Shelf.entries):
+        for _, title, author, _, rating in json.loads(entries):
+            total = totals.setdefault(catalog_key(title, author), [0, 0])
+            total[0] += rating
+            total[1] += 1
+    return sorted(totals, key=lambda key: -(totals[key][0] + 5.75 * 5) / (totals[key][1] + 5))[:limit]
+
+
+def median_ms(function, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def main(readers=2000, changes=500):
+    readers, changes = int(readers), int(changes)
+    random.seed(24)
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed(readers)
+        print(f'{readers:,} readers, {Book.query.count():,} books on shelves, {BookAggregate.query.count():,} rated')
+
+        written = []
+
+        def count_rows(conn, cursor, statement, parameters, context, executemany):
+            if 'book_aggregate' in statement and not statement.lstrip().upper().startswith('SELECT'):
+                written.append(len(parameters) if executemany else 1)
+
+        event.listen(db.engine, 'before_cursor_execute', count_rows)
+        with_aggregates = median_ms(lambda: change(readers), changes)
+        event.remove(db.engine, 'before_cursor_execute', count_rows)
+        record = shelves.record_shelf_change
+        shelves.record_shelf_change = lambda *args: None
+        without = median_ms(lambda: change(readers), changes)
+        shelves.record_shelf_change = record
+        print(f'shelf change: {without:.2f} ms without aggregates, {with_aggregates:.2f} ms with, '
+              f'{sum(written) / changes:.1f} aggregate rows written per change')
+
+        # The changes made without aggregates left them behind: rebuild, then check that changes keep them in step
+        rebuild_aggregates()
+        for _ in range(changes):
+            change(readers)
+        incremental = snapshot()
+        started = time.perf_counter()
+        rebuilt = rebuild_aggregates()
+        print(f'full rebuild: {rebuilt:,} books in {time.perf_counter() - started:.2f}s')
+        matches = incremental == snapshot()
+        print(f'after {changes} more changes, incremental aggregates match the rebuild: {matches}')
+
+        print(f'leaderboard: {median_ms(top_books, 50):.2f} ms from the aggregates, '
+              f'{median_ms(on_demand, 3):.0f} ms computed from the shelves')
+        ids = [random.randint(1, TITLES) for _ in range(200)]
+        print(f'book details: {median_ms(lambda: book_details(ids.pop()), 200):.2f} ms')
+    if not matches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,78 @@
+"""Bulk import of a generated Goodreads export, then an export/import round trip.
+
+Reports wall time and peak Python memory (tracemalloc) for each step:
+
+    python -m benchmarks.library_import [rows]
+"""
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from app import create_app  # noqa: E402
+from library_io import export_library, import_library  # noqa: E402
+from models import db, User  # noqa: E402
+from shelves import SENTIMENTS, load_shelves  # noqa: E402
+
+app = create_app()
+
+GOODREADS_HEADER = ['Book Id', 'Title', 'Author', 'Author l-f', 'Additional Authors', 'ISBN', 'ISBN13', 'My Rating',
+                    'Average Rating', 'Publisher', 'Binding', 'Number of Pages', 'Year Published',
+                    'Original Publication Year', 'Date Read', 'Date Added', 'Bookshelves',
+                    'Bookshelves with positions', 'Exclusive Shelf', 'My Review', 'Spoiler', 'Private Notes',
+                    'Read Count', 'Owned Copies']
+
+
+def goodreads_export(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(GOODREADS_HEADER)
+        for i in range(rows):
+            shelf = 'to-read' if i % 20 == 0 else 'read'
+            writer.writerow([i, f'Book {i}', f'Author {i % 500}', '', '', f'="{i:010d}"', '', random.randint(0, 5),
+                             '3.9', 'Publisher', 'Paperback', 300, 2001, 1999, '', '2020/01/01', '', '', shelf,
+                             'A review ' * 20, '', '', 1, 0])
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main(rows=10000):
+    path = os.path.join(tempfile.mkdtemp(), 'goodreads_library_export.csv')
+    goodreads_export(path, rows)
+    with app.app_context():
+        db.create_all()
+        first, second = User(username='mover', profile_image=''), User(username='copy', profile_image='')
+        db.session.add_all([first, second])
+        db.session.commit()
+
+        with open(path, 'rb') as f:
+            result, elapsed, peak = measure(import_library, first.id, f)
+        print(f'import {rows} Goodreads rows ({os.path.getsize(path) / 1e6:.1f} MB): {result.imported} books '
+              f'in {elapsed:.2f}s, peak {peak / 1e6:.1f} MB  {result.shelves}')
+
+        exported, elapsed, peak = measure(lambda: ''.join(export_library(first.id)))
+        print(f'export: {len(exported) / 1e6:.1f} MB in {elapsed:.2f}s, peak {peak / 1e6:.1f} MB')
+
+        import_library(second.id, io.BytesIO(exported.encode()))
+        original, copy = load_shelves(first.id), load_shelves(second.id)
+        assert all([(e.title, e.rating) for e in original[s]] == [(e.title, e.rating) for e in copy[s]]
+                   for s in SENTIMENTS), 'round trip changed the shelves'
+        print('round trip keeps every shelf and its order')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,123 @@
+"""A burst of logins against a real gunicorn, and what it does to page loads.
+
+Starts the Procfile's gunicorn (``gunicorn.conf.py``) on a throwaway SQLite
+database, then has ``clients`` threads log in over and over while one more
+thread keeps loading the home page. Runs once hashing in the request threads
+with no limit (how it used to work) and once with the defaults from
+passwords.py, and reports logins per second, logins turned away with a 503
+and home page latency:
+
+    python -m benchmarks.login_storm [clients] [seconds]
+"""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+USERS = 20
+MODES = {
+    'inline, unbounded': {'PASSWORD_HASH_WORKERS': '0', 'PASSWORD_HASH_MAX_PENDING': '1000'},
+    'pool, bounded': {},
+}
+
+
+def seed(database_url):
+    os.environ['DATABASE_URL'] = database_url
+    from app import create_app
+    from models import db, User
+    app = create_app({'PASSWORD_HASH_WORKERS': 0, 'JOBS_WORKERS': 0})
+    with app.app_context():
+        db.create_all()
+        for i in range(USERS):
+            user = User(username=f'reader{i}', profile_image='')
+            user.set_password('correct horse')
+            db.session.add(user)
+        db.session.commit()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url, settings):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, JOBS_WORKERS='0', **settings)
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{port}',
+                               'app:create_app()'], env=env, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            requests.get(url, timeout=1)
+            return server, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+def storm(url, clients, seconds):
+    stop = threading.Event()
+    outcomes = {'ok': 0, 'busy': 0, 'other': 0}
+    page_times = []
+    lock = threading.Lock()
+
+    def log_in(i):
+        session = requests.Session()
+        while not stop.is_set():
+            try:
+                response = session.post(f'{url}/login', allow_redirects=False, timeout=10,
+                                        data={'username': f'reader{i % USERS}', 'password': 'correct horse'})
+            except (requests.ConnectionError, requests.Timeout):
+                response = None
+            status = response.status_code if response is not None else None
+            outcome = 'ok' if status == 302 else 'busy' if status == 503 else 'other'
+            with lock:
+                outcomes[outcome] += 1
+            if outcome == 'busy':
+                stop.wait(float(response.headers['Retry-After']))  # as someone trying again would
+
+    def load_pages():
+        while not stop.is_set():
+            started = time.perf_counter()
+            requests.get(url, timeout=30)
+            page_times.append(time.perf_counter() - started)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=log_in, args=(i,)) for i in range(clients)]
+    threads.append(threading.Thread(target=load_pages))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return outcomes, page_times
+
+
+def main(clients=16, seconds=8):
+    database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    seed(database_url)
+    for name, settings in MODES.items():
+        server, url = start_server(database_url, settings)
+        try:
+            outcomes, page_times = storm(url, clients, seconds)
+        finally:
+            server.terminate()
+            server.wait()
+        page_times.sort()
+        print(f'{name}: {outcomes["ok"] / seconds:.1f} logins/s, {outcomes["busy"]} turned away (503), '
+              f'{outcomes["other"]} failed; home page p50 {statistics.median(page_times) * 1000:.0f} ms, '
+              f'p95 {page_times[int(len(page_times) * 0.95)] * 1000:.0f} ms, max {page_times[-1] * 1000:.0f} ms '
+              f'over {len(page_times)} loads')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,107 @@
+"""Rows written per shelf operation: dense renumbering vs sparse position keys.
+
+    python -m benchmarks.ordering_writes
+"""
+import os
+import random
+import tempfile
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from sqlalchemy import event  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db, Book, User  # noqa: E402
+from ordering import GAP, place_book  # noqa: E402
+
+app = create_app()
+
+
+class RowCounter:
+    def __init__(self):
+        self.rows = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')):
+            self.rows += max(cursor.rowcount, 0)
+
+
+def legacy_insert(new_book, insert_position):
+    for book in Book.query.filter(Book.user_id == new_book.user_id, Book.sentiment == new_book.sentiment,
+                                  Book.position >= insert_position).all():
+        book.position += 1
+    new_book.position = insert_position
+
+
+def legacy_reposition(book, new_position):
+    old_position = book.position
+    for other in Book.query.filter(
+            Book.user_id == book.user_id, Book.sentiment == book.sentiment,
+            ((Book.position >= new_position) & (Book.position < old_position)) |
+            ((Book.position <= new_position) & (Book.position > old_position))).all():
+        other.position += -1 if old_position < new_position else 1
+    book.position = new_position
+
+
+def legacy_delete(book):
+    db.session.delete(book)
+    for other in Book.query.filter(Book.user_id == book.user_id, Book.sentiment == book.sentiment,
+                                   Book.position > book.position).all():
+        other.position -= 1
+
+
+def new_shelf(username, size, spacing):
+    user = User(username=username, profile_image='')
+    db.session.add(user)
+    db.session.flush()
+    db.session.bulk_insert_mappings(Book, [
+        {'title': f'Book {i}', 'author': 'Author', 'sentiment': 'beloved', 'position': (i + 1) * spacing,
+         'user_id': user.id} for i in range(size)])
+    db.session.commit()
+    return user.id
+
+
+def shelf(user_id):
+    return Book.query.filter_by(user_id=user_id, sentiment='beloved').order_by(Book.position).all()
+
+
+def run(counter, label, operation, user_id, count):
+    counter.rows = 0
+    for _ in range(count):
+        operation(shelf(user_id))
+        db.session.commit()
+    print(f'  {label:<8} {counter.rows / count:8.1f} rows written per operation')
+
+
+def main(shelf_size=1000, operations=100):
+    rng = random.Random(7)
+    with app.app_context():
+        db.create_all()
+        counter = RowCounter()
+        event.listen(db.engine, 'after_cursor_execute', counter)
+
+        def new_book(user_id):
+            book = Book(title='New', author='Author', sentiment='beloved', position=0, user_id=user_id)
+            db.session.add(book)
+            db.session.commit()
+            return book
+
+        dense = new_shelf('dense', shelf_size, 1)
+        print(f'dense positions ({shelf_size}-book shelf)')
+        run(counter, 'insert', lambda books: legacy_insert(new_book(dense), rng.randint(1, len(books))),
+            dense, operations)
+        run(counter, 'rerank', lambda books: legacy_reposition(rng.choice(books), rng.randint(1, len(books))),
+            dense, operations)
+        run(counter, 'delete', lambda books: legacy_delete(rng.choice(books)), dense, operations)
+
+        sparse = new_shelf('sparse', shelf_size, GAP)
+        print(f'sparse positions ({shelf_size}-book shelf)')
+        run(counter, 'insert', lambda books: place_book(new_book(sparse), rng.choice(books), rng.random() < 0.5),
+            sparse, operations)
+        run(counter, 'rerank', lambda books: place_book(rng.choice(books), rng.choice(books), rng.random() < 0.5),
+            sparse, operations)
+        run(counter, 'delete', lambda books: db.session.delete(rng.choice(books)), sparse, operations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Profile shelf loading: the old three-query O(n^2) rating pass vs load_shelves() vs the
+materialized summaries read by read_shelves().
+
+Seeds a throwaway SQLite database with 10k books for one user:
+
+    python -m benchmarks.profile_loading
+"""
+import os
+import random
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from app import create_app  # noqa: E402
+from models import db, Book, User  # noqa: E402
+from shelves import SENTIMENTS, load_shelves, read_shelves, refresh_shelf  # noqa: E402
+
+app = create_app()
+
+
+def legacy_profile(user_id):
+    beloved_books = Book.query.filter_by(user_id=user_id, sentiment='beloved').order_by(Book.position).all()
+    tolerated_books = Book.query.filter_by(user_id=user_id, sentiment='tolerated').order_by(Book.position).all()
+    disliked_books = Book.query.filter_by(user_id=user_id, sentiment='disliked').order_by(Book.position).all()
+
+    for i, book in enumerate(beloved_books + tolerated_books + disliked_books):
+        if book.sentiment == 'beloved':
+            base, max_rating = 7.5, 10
+        elif book.sentiment == 'tolerated':
+            base, max_rating = 4.5, 7
+        else:
+            base, max_rating = 1, 4
+        category_books = beloved_books if book in beloved_books else \
+            tolerated_books if book in tolerated_books else \
+            disliked_books
+        category_position = category_books.index(book)
+        category_total = len(category_books)
+        book.rating = round(base + ((max_rating - base) * (1 - (category_position / (category_total - 1 or 1)))), 1)
+        book.global_position = i + 1
+    return beloved_books, tolerated_books, disliked_books
+
+
+def seed(books_per_user):
+    user = User(username='reader', profile_image='')
+    db.session.add(user)
+    db.session.flush()
+    rows = [{'title': f'Book {i}', 'author': f'Author {i % 300}', 'sentiment': random.choice(SENTIMENTS),
+             'position': i, 'user_id': user.id, 'google_books_url': ''} for i in range(books_per_user)]
+    db.session.bulk_insert_mappings(Book, rows)
+    for sentiment in SENTIMENTS:
+        refresh_shelf(user.id, sentiment)
+    db.session.commit()
+    return user.id
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main(books_per_user=10000):
+    with app.app_context():
+        db.create_all()
+        user_id = seed(books_per_user)
+
+        legacy, legacy_seconds = timed(legacy_profile, user_id)
+        db.session.expunge_all()
+        shelves, shelves_seconds = timed(load_shelves, user_id)
+        db.session.expunge_all()
+        summaries, summaries_seconds = timed(read_shelves, user_id)
+
+        assert [(b.id, b.rating, b.global_position) for shelf in legacy for b in shelf] == \
+               [(e.id, e.rating, e.global_position) for s in SENTIMENTS for e in shelves[s]]
+        assert summaries == shelves
+        print(f'{books_per_user} books: legacy {1000 * legacy_seconds:9.1f} ms   '
+              f'load_shelves {1000 * shelves_seconds:7.1f} ms   '
+              f'read_shelves {1000 * summaries_seconds:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Serving /profile/<username>: cold render vs cached shelf fragments vs 304.
+
+Seeds a throwaway SQLite database with one user owning 3000 books and times
+repeat views by another user through the test client:
+
+    python -m benchmarks.profile_serving
+"""
+import os
+import random
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from app import create_app  # noqa: E402
+from models import db, Book, User  # noqa: E402
+from ordering import GAP  # noqa: E402
+from shelves import SENTIMENTS, refresh_shelf  # noqa: E402
+
+app = create_app()
+
+
+def seed(books):
+    owner = User(username='popular', profile_image='')
+    viewer = User(username='viewer', profile_image='')
+    viewer.set_password('pw')
+    db.session.add_all([owner, viewer])
+    db.session.flush()
+    db.session.bulk_insert_mappings(Book, [
+        {'title': f'Book {i}', 'author': f'Author {i % 300}', 'sentiment': random.choice(SENTIMENTS),
+         'position': (i + 1) * GAP, 'user_id': owner.id, 'google_books_url': f'https://books.example/{i}'}
+        for i in range(books)])
+    for sentiment in SENTIMENTS:
+        refresh_shelf(owner.id, sentiment)
+    db.session.commit()
+
+
+def timed(client, requests, headers=None, before=None):
+    started = time.perf_counter()
+    for _ in range(requests):
+        if before:
+            before()
+        response = client.get('/profile/popular', headers=headers or {})
+    return response, (time.perf_counter() - started) / requests
+
+
+def main(books=3000, requests=50):
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        seed(books)
+    client = app.test_client()
+    client.post('/login', data={'username': 'viewer', 'password': 'pw'})
+
+    response, cold = timed(client, requests, before=app.extensions['literatus']['profile_cache'].clear)
+    _, fragments = timed(client, requests)
+    etag = response.headers['ETag']
+    response, revalidated = timed(client, requests, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    print(f'{books} books: cold render {1000 * cold:7.2f} ms   cached fragments {1000 * fragments:7.2f} ms   '
+          f'304 {1000 * revalidated:6.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
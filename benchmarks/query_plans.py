@@ -0,0 +1,146 @@
+"""Query-plan regression check for the shelf hot path.
+
+Drives the shelf, user-search, leaderboard and feed routes through the test client against a seeded SQLite
+database, captures every SELECT they issue and runs ``EXPLAIN QUERY PLAN`` on
+each. Exits non-zero if any of them scans the ``book``, ``user``, ``follow``,
+``activity`` or ``timeline_entry`` table instead of searching an index, or
+reads ``book_aggregate`` other than through one:
+
+    python -m benchmarks.query_plans
+"""
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'plans.db')
+
+from sqlalchemy import event  # noqa: E402
+
+from api import encode_cursor  # noqa: E402
+from app import create_app  # noqa: E402
+from feed import fan_out_activity  # noqa: E402
+from models import db, Activity, Book, Follow, TimelineEntry, User  # noqa: E402
+from ordering import GAP  # noqa: E402
+
+app = create_app()
+
+FULL_SCAN = re.compile(r'\bSCAN (TABLE )?("?)(book|user|follow|activity|timeline_entry)\2\b'
+                       r'|\bSCAN (TABLE )?book_aggregate\b(?! USING (COVERING )?INDEX)')
+
+# Readers with no books of their own, whose activity fills the feed tables the way a busy site's would
+ACTORS = 2000
+ACTIVITIES = 10_000
+
+
+def seed(users=30, books_per_user=200):
+    for u in range(users):
+        user = User(username=f'reader{u}', profile_image='')
+        user.set_password('password')
+        db.session.add(user)
+        db.session.flush()
+        db.session.bulk_insert_mappings(Book, [
+            {'title': f'Book {i}', 'author': f'Author {i % 40}', 'sentiment': ('beloved', 'tolerated', 'disliked')[i % 3],
+             'position': (i // 3 + 1) * GAP, 'user_id': user.id} for i in range(books_per_user)])
+    db.session.bulk_insert_mappings(User, [{'username': f'actor{a}', 'session_version': 0} for a in range(ACTORS)])
+    # reader0 follows readers 1-5 and is sent their activity, except for reader2's, which it reads on demand;
+    # everyone else follows reader0
+    now = datetime.utcnow()
+    db.session.bulk_insert_mappings(Follow, [{'follower_id': 1, 'followee_id': u, 'created_at': now} for u in range(2, 7)]
+                                    + [{'follower_id': u, 'followee_id': 1, 'created_at': now} for u in range(2, users + 1)])
+    db.session.get(User, 3).fan_out_on_read = True
+    actor_ids = [2 + i % (users + ACTORS - 1) for i in range(ACTIVITIES)]
+    db.session.bulk_insert_mappings(Activity, [
+        {'id': i + 1, 'actor_id': actor, 'verb': 'ranked', 'title': f'Book {i}', 'author': f'Author {i % 40}',
+         'sentiment': 'beloved', 'rank': 1, 'fanned_out': actor != 3, 'created_at': now}
+        for i, actor in enumerate(actor_ids)])
+    db.session.bulk_insert_mappings(TimelineEntry, [{'user_id': 1, 'activity_id': i + 1, 'actor_id': actor}
+                                                    for i, actor in enumerate(actor_ids) if actor in (2, 4, 5, 6)])
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+
+
+def compared_id(response):
+    return re.search(rb'name="compared_book_id" value="(\d+)"', response.data).group(1)
+
+
+def exercise(client):
+    """The routes whose queries must stay on indexes."""
+    client.post('/login', data={'username': 'reader0', 'password': 'password'})
+    client.get('/profile/reader0')
+    client.get('/profile/reader1')
+    # Prefix matches only: the substring tier runs on Postgres, where the trigram index serves it
+    client.get('/search_users?query=Reader')
+
+    page = client.get('/api/v1/users/reader1/shelves/beloved?limit=20').json
+    client.get('/api/v1/users/reader1/shelves/beloved', query_string={'cursor': page['next_cursor']})
+    # A cursor from an older shelf version makes the API recount the page's starting index
+    last = Book.query.filter_by(user_id=2, sentiment='beloved').order_by(Book.position).offset(19).first()
+    client.get('/api/v1/users/reader1/shelves/beloved',
+               query_string={'cursor': encode_cursor(-1, 20, last.position, last.id)})
+
+    response = client.post('/add_book', data={'title': 'New', 'author': 'Someone', 'sentiment': 'beloved'})
+    response = client.get(response.location)
+    while b'compared_book_id' in response.data:
+        response = client.post('/compare_books', data={'compared_book_id': compared_id(response), 'preference': 1})
+
+    book = Book.query.filter_by(user_id=1, sentiment='tolerated').order_by(Book.position).first()
+    response = client.get(f'/initiate_rerank/{book.id}')
+    while b'compared_book_id' in response.data:
+        response = client.post('/rerank_book', data={'compared_book_id': compared_id(response), 'preference': 0})
+
+    client.post(f'/delete_book/{book.id}')
+
+    # The profile's "Rank selected books" form, with two books ticked on one shelf
+    picked = Book.query.filter_by(user_id=1, sentiment='disliked').order_by(Book.position.desc()).limit(2).all()
+    response = client.post('/rank_batch', data={'book_id': [picked_book.id for picked_book in picked]})
+    while b'compared_book_id' in response.data:
+        response = client.post('/rank_batch/compare', data={'compared_book_id': compared_id(response), 'preference': 1})
+
+    client.get('/leaderboard')
+    client.get('/api/v1/books/1')
+
+    fan_out_activity(ACTIVITIES + 1)  # reader0's first ranking above
+    db.session.commit()
+    page = client.get('/api/v1/feed').json
+    client.get('/feed', query_string={'before': page['next_cursor']})
+    client.post('/follow/reader7')
+    client.post('/unfollow/reader7')
+
+
+def main():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        db.create_all()
+        seed()
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        exercise(app.test_client())
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+        failures = []
+        seen = set()
+        with db.engine.connect() as conn:
+            for statement, parameters in statements:
+                if statement in seen:
+                    continue
+                seen.add(statement)
+                plan = [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+                if any(FULL_SCAN.search(step) for step in plan):
+                    failures.append((statement, plan))
+
+    print(f'checked {len(seen)} distinct queries')
+    for statement, plan in failures:
+        print('\nFULL SCAN:', ' '.join(statement.split()))
+        for step in plan:
+            print('   ', step)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""Building and serving book recommendations on a synthetic 100,000-reader, 1,000,000-rating library.
+
+Readers each favour a genre or two out of ``GENRES`` and shelve about ten
+books, mostly from their favourites and by popularity within a genre
+(Zipf), loving most of what they pick there and tolerating or disliking
+the rest. The shelf summaries and catalog are written straight into a
+temporary SQLite database, then the benchmark reports:
+
+- build time of each step of `flask recommendations-build`, and of the whole
+- peak memory the build allocated (tracemalloc, which also sees NumPy's arrays)
+- latency of "also loved" lists and of a reader's suggestions, called
+  directly and through the JSON API
+- how often a reader's top suggestion is from one of their favourite genres
+
+    python -m benchmarks.recommendations [readers] [ratings]
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['JOBS_WORKERS'] = '0'
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+
+import numpy as np  # noqa: E402
+
+from app import create_app  # noqa: E402
+from catalog import catalog_key  # noqa: E402
+from models import db, BookSimilarity, CatalogBook, Shelf, User  # noqa: E402
+from recommendation_build import build_similarities, load_ratings, rating_matrix, top_neighbors  # noqa: E402
+from recommendations import similar_books, suggest  # noqa: E402
+from shelves import SENTIMENTS, rating_for, read_shelves  # noqa: E402
+
+GENRES = 50
+BOOKS = 25_000
+SAMPLES = 1000
+
+
+def seed(readers, ratings, rng):
+    """Write readers, their shelf summaries and the catalog. Returns (genre of each book, favourite genres of each reader)."""
+    genre_of = rng.integers(0, GENRES, BOOKS)
+    by_genre = [np.flatnonzero(genre_of == genre) for genre in range(GENRES)]
+    favourites = [rng.choice(GENRES, size=rng.integers(1, 3), replace=False) for _ in range(readers)]
+    counts = np.maximum(1, rng.poisson(ratings / readers, readers))
+
+    db.session.bulk_insert_mappings(CatalogBook, [
+        {'id': book + 1, 'key': catalog_key(f'Book {book}', f'Author {book % 5000}'), 'title': f'Book {book}',
+         'author': f'Author {book % 5000}', 'search_text': f'book {book} author {book % 5000}', 'times_added': 1}
+        for book in range(BOOKS)])
+    db.session.bulk_insert_mappings(User, [{'id': reader + 1, 'username': f'reader_{reader}', 'session_version': 0}
+                                           for reader in range(readers)])
+
+    updated_at = datetime.utcnow()
+    shelves = []
+    for reader in range(readers):
+        picked = {}
+        while len(picked) < counts[reader]:
+            in_favourite = rng.random() < 0.8
+            genre = rng.choice(favourites[reader]) if in_favourite else rng.integers(GENRES)
+            books = by_genre[genre]
+            book = int(books[(rng.zipf(1.3) - 1) % len(books)])
+            loved = in_favourite and rng.random() < 0.85
+            picked.setdefault(book, 'beloved' if loved else SENTIMENTS[1 + (rng.random() < 0.5)])
+        for sentiment in SENTIMENTS:
+            books = [book for book, shelf in picked.items() if shelf == sentiment]
+            if books:
+                entries = [[0, f'Book {book}', f'Author {book % 5000}', None, rating_for(sentiment, i, len(books))]
+                           for i, book in enumerate(books)]
+                shelves.append({'user_id': reader + 1, 'sentiment': sentiment, 'version': 1,
+                                'book_count': len(books), 'entries': json.dumps(entries),
+                                'updated_at': updated_at})
+        if len(shelves) >= 10_000:
+            db.session.execute(Shelf.__table__.insert(), shelves)
+            shelves = []
+    db.session.execute(Shelf.__table__.insert(), shelves)
+    db.session.commit()
+    return genre_of, favourites
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def latencies(function, arguments):
+    times = []
+    for argument in arguments:
+        started = time.perf_counter()
+        function(argument)
+        times.append((time.perf_counter() - started) * 1000)
+    times.sort()
+    return f'p50 {statistics.median(times):.2f} ms, p99 {times[int(len(times) * 0.99)]:.2f} ms'
+
+
+def main(readers=100_000, ratings=1_000_000):
+    readers, ratings = int(readers), int(ratings)
+    rng = np.random.default_rng(23)
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        (genre_of, favourites), seconds = timed(seed, readers, ratings, rng)
+        print(f'seeded {readers:,} readers, {db.session.query(db.func.count(Shelf.user_id)).scalar():,} shelves '
+              f'in {seconds:.1f}s')
+
+        config = app.config
+        (loaded, seconds) = timed(load_ratings)
+        print(f'load ratings:    {seconds:6.2f}s  {len(loaded[0]):,} ratings')
+        (matrix, book_ids), seconds = timed(rating_matrix, *loaded)
+        print(f'rating matrix:   {seconds:6.2f}s  {matrix.shape[0]:,} x {matrix.shape[1]:,}, {matrix.nnz:,} non-zero')
+        neighbors, seconds = timed(lambda: sum(1 for _ in top_neighbors(
+            matrix, k=config['RECOMMENDATIONS_NEIGHBORS'], min_common=config['RECOMMENDATIONS_MIN_COMMON'],
+            shrinkage=config['RECOMMENDATIONS_SHRINKAGE'], block_products=config['RECOMMENDATIONS_BLOCK_PRODUCTS'])))
+        print(f'top neighbors:   {seconds:6.2f}s  {neighbors:,} books with neighbors')
+        print(f'naive reader pairs avoided: {readers * (readers - 1) // 2:,}')
+
+        listed, seconds = timed(build_similarities, config)
+        print(f'whole build:     {seconds:6.2f}s  {listed:,} lists written')
+        # Again, traced: tracing slows Python code down too much to time it at the same time
+        tracemalloc.start()
+        build_similarities(config)
+        print(f'peak memory allocated by the build: {tracemalloc.get_traced_memory()[1] / 2**20:.0f} MiB')
+        tracemalloc.stop()
+
+        with app.test_request_context():
+            books = [int(book) for book in rng.choice(book_ids, SAMPLES)]
+            sample = [int(reader) for reader in rng.integers(1, readers + 1, SAMPLES)]
+            print(f'also loved:      {latencies(similar_books, books)}')
+            print(f'suggestions:     {latencies(lambda user_id: suggest(read_shelves(user_id)), sample)}')
+            hits = 0
+            for user_id in sample:
+                top = suggest(read_shelves(user_id), limit=1)
+                hits += bool(top) and genre_of[top[0].id - 1] in favourites[user_id - 1]
+            print(f'top suggestion in a favourite genre for {hits / SAMPLES:.0%} of readers')
+        assert db.session.query(db.func.count(BookSimilarity.catalog_book_id)).scalar() == listed
+
+    client = app.test_client()
+    client.post('/register', data={'username': 'viewer', 'password': 'pw'})
+    client.post('/login', data={'username': 'viewer', 'password': 'pw'})
+    print(f'API similar:     {latencies(lambda book: client.get(f"/api/v1/books/{book}/similar"), books[:200])}')
+    print(f'API suggestions: '
+          f'{latencies(lambda user_id: client.get(f"/api/v1/users/reader_{user_id - 1}/suggestions"), sample[:200])}')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,68 @@
+"""A /search_users page of 50 users: what it makes the browser fetch, and what avatars cost.
+
+Lists every URL the page links to that is not served by the app itself, and
+times /avatar/<username>.svg rendered, from the LRU, and revalidated with
+If-None-Match. Run after `flask assets-build` (or with ``ASSETS_DIR``
+pointing at a build) to also leave the CDN stylesheets out; exits non-zero
+if the page still needs another site:
+
+    python -m benchmarks.search_avatars
+"""
+import os
+import re
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['JOBS_WORKERS'] = '0'
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+
+from app import create_app  # noqa: E402
+from avatars import render_avatar  # noqa: E402
+from models import db, User  # noqa: E402
+
+USERS = 50
+LINKED = re.compile(r'<(?:link|img|script)\b[^>]*?(?:href|src)="([^"]+)"')
+
+
+def timed(function, repeat=200):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    app = create_app({'USER_SEARCH_PAGE_SIZE': USERS})
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()
+    client.post('/register', data={'username': 'viewer', 'password': 'pw'})
+    for i in range(USERS):
+        client.post('/register', data={'username': f'reader_{i}', 'password': 'pw'})
+    client.post('/login', data={'username': 'viewer', 'password': 'pw'})
+
+    page = client.get('/search_users?query=reader').get_data(as_text=True)
+    linked = LINKED.findall(page)
+    avatars = [url for url in linked if url.startswith('/avatar/')]
+    outside = [url for url in linked if re.match(r'(https?:)?//', url)]
+    print(f'{len(avatars)} avatars on the page, {len(outside)} URLs on other sites')
+    for url in outside:
+        print(f'  {url[:100]}')
+
+    with app.app_context():
+        stored = {image for (image,) in db.session.query(User.profile_image)}
+    print(f'stored profile images all local: {all(image.startswith("/avatar/") for image in stored)}')
+
+    response, rendered = timed(lambda: (render_avatar.cache_clear(), client.get(avatars[0]))[1])
+    _, cached = timed(lambda: client.get(avatars[0]))
+    revalidated, revalidate = timed(lambda: client.get(avatars[0], headers={'If-None-Match': response.headers['ETag']}))
+    print(f'avatar: {len(response.data)} bytes, rendered {rendered:.2f} ms, from the LRU {cached:.2f} ms, '
+          f'{revalidated.status_code} on revalidation {revalidate:.2f} ms; {response.headers["Cache-Control"]}')
+    if outside or len(avatars) != USERS:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
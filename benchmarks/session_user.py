@@ -0,0 +1,98 @@
+"""SQL statements per logged-in page view, with and without the identity cache.
+
+``IDENTITY_CACHE_TTL=0`` makes every request resolve its user from the
+database again, as ``load_user`` used to. Also checks that changing a
+password, or bumping ``session_version`` directly, ends the sessions made
+before it at once, with the user still cached:
+
+    python -m benchmarks.session_user [requests]
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['JOBS_WORKERS'] = '0'
+
+from sqlalchemy import event  # noqa: E402
+
+from app import create_app  # noqa: E402
+from extensions import identities  # noqa: E402
+from models import db, User  # noqa: E402
+
+PAGES = ('/', '/import', '/profile/reader')
+
+
+def count_statements(engine):
+    counter = {'statements': 0}
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count(*args):
+        counter['statements'] += 1
+    return counter
+
+
+def measure(ttl, requests):
+    app = create_app({'IDENTITY_CACHE_TTL': ttl})
+    with app.app_context():
+        db.create_all()
+        if not User.query.count():
+            user = User(username='reader', profile_image='')
+            user.set_password('pw')
+            db.session.add(user)
+            db.session.commit()
+        counter = count_statements(db.engine)
+    client = app.test_client()
+    client.post('/login', data={'username': 'reader', 'password': 'pw'})
+    results = {}
+    for page in PAGES:
+        assert client.get(page).status_code == 200, page
+        counter['statements'] = 0
+        started = time.perf_counter()
+        for _ in range(requests):
+            client.get(page)
+        elapsed = time.perf_counter() - started
+        results[page] = (counter['statements'] / requests, elapsed / requests * 1000)
+    return app, client, results
+
+
+def change_ends_session(app, change):
+    """Log in afresh, make sure the user is cached, apply ``change`` to them and commit."""
+    client = app.test_client()
+    client.post('/login', data={'username': 'reader', 'password': 'pw'})
+    assert client.get('/import').status_code == 200
+    with app.app_context():
+        user = User.query.filter_by(username='reader').one()
+        assert identities.load(user.get_id()) is not None
+        change(user)
+        db.session.commit()
+    return client.get('/import').status_code == 302
+
+
+def bump_session_version(user):
+    user.session_version += 1
+
+
+def change_password(user):
+    # Back to the same password, so the next check can still log in
+    user.set_password('pw')
+
+
+def main(requests=200):
+    for ttl in (0, 30):
+        app, client, results = measure(ttl, requests)
+        print(f'IDENTITY_CACHE_TTL={ttl}:')
+        for page, (statements, ms) in results.items():
+            print(f'  {page:18} {statements:4.1f} statements, {ms:5.2f} ms per view')
+    failed = False
+    for name, change in (('a password change', change_password), ('a session_version bump', bump_session_version)):
+        ended = change_ends_session(app, change)
+        failed = failed or not ended
+        print(f'old session after {name}: {"logged out" if ended else "STILL LOGGED IN"}')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,121 @@
+"""Several processes adding, ranking, reranking and deleting books on one shelf at once.
+
+Each worker process is its own client (like a separate gunicorn worker or
+browser tab) logged in as the same user, answering comparisons by a score
+hidden in every book's title. All of them hit one throwaway SQLite database.
+Afterwards the shelf must still be consistent:
+
+- no two books share a position, so their ranks are exactly 1..n
+- the materialized summary matches the live shelf
+- every add and delete that reported success is reflected
+
+    python -m benchmarks.shelf_concurrency [workers] [operations_per_worker]
+"""
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['JOBS_WORKERS'] = '0'
+# Hash in the worker processes themselves: multiprocessing joins a worker's children
+# before the hash pool's own exit handler could stop them
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+
+from app import create_app  # noqa: E402
+from models import db, Book, Shelf, User  # noqa: E402
+from shelves import shelf_entries  # noqa: E402
+
+app = create_app()
+
+SENTIMENT = 'beloved'
+COMPARED = re.compile(rb'name="compared_book_id" value="(\d+)"')
+
+
+def score(book_id):
+    book = db.session.get(Book, book_id)
+    return float(book.title.split()[1]) if book else 0.0
+
+
+def answer(client, response, path, subject_score):
+    """Answer comparisons until the ranking ends. Returns the number of comparisons."""
+    comparisons = 0
+    while response.status_code == 200 and (match := COMPARED.search(response.data)):
+        compared_id = int(match.group(1))
+        with app.app_context():
+            preference = 1 if subject_score > score(compared_id) else 2
+        response = client.post(path, data={'compared_book_id': compared_id, 'preference': preference})
+        comparisons += 1
+    return comparisons
+
+
+def run_worker(seed, operations):
+    with app.app_context():
+        db.engine.dispose()  # connections inherited from the parent are not ours to use
+    rng = random.Random(seed)
+    client = app.test_client()
+    client.post('/login', data={'username': 'reader', 'password': 'pw'})
+    added = deleted = comparisons = 0
+    for _ in range(operations):
+        with app.app_context():
+            book_ids = [book_id for (book_id,) in db.session.query(Book.id).filter_by(sentiment=SENTIMENT)]
+        roll = rng.random()
+        if roll < 0.6 or len(book_ids) < 3:
+            subject_score = rng.random()
+            response = client.post('/add_book', data={'title': f'Book {subject_score:.9f}', 'author': 'Someone',
+                                                      'sentiment': SENTIMENT, 'google_books_url': ''})
+            added += 1
+            comparisons += answer(client, client.get(response.location), '/compare_books', subject_score)
+        elif roll < 0.85:
+            book_id = rng.choice(book_ids)
+            with app.app_context():
+                subject_score = score(book_id)
+            comparisons += answer(client, client.get(f'/initiate_rerank/{book_id}'), '/rerank_book', subject_score)
+        else:
+            response = client.post(f'/delete_book/{rng.choice(book_ids)}')
+            deleted += response.status_code == 302
+    with client.session_transaction() as session:
+        restarts = sum('started over' in message for _, message in session.get('_flashes', []))
+    return added, deleted, comparisons, restarts
+
+
+def check():
+    rows = db.session.query(Book.id, Book.position).filter_by(sentiment=SENTIMENT).order_by(Book.position).all()
+    positions = [position for _, position in rows]
+    duplicates = len(positions) - len(set(positions))
+    summary = db.session.get(Shelf, (User.query.one().id, SENTIMENT))
+    consistent = (summary.book_count == len(rows)
+                  and json.loads(summary.entries) == shelf_entries(summary.user_id, SENTIMENT))
+    return len(rows), duplicates, consistent
+
+
+def main(workers=4, operations=60):
+    with app.app_context():
+        db.create_all()
+        user = User(username='reader', profile_image='')
+        user.set_password('pw')
+        db.session.add(user)
+        db.session.commit()
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(run_worker, range(workers), [operations] * workers))
+    elapsed = time.perf_counter() - started
+    added, deleted, comparisons, restarts = map(sum, zip(*results))
+
+    with app.app_context():
+        books, duplicates, consistent = check()
+    print(f'{workers} workers x {operations} operations in {elapsed:.1f}s: {added} added, {deleted} deleted, '
+          f'{comparisons} comparisons, {restarts} rankings restarted after a conflict')
+    print(f'{books} books on the shelf (expected {added - deleted}), {duplicates} duplicate positions, '
+          f'summary {"consistent" if consistent else "INCONSISTENT"}')
+    if books != added - deleted or duplicates or not consistent:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
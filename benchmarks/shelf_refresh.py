@@ -0,0 +1,88 @@
+"""What ``refresh_shelf`` adds to a shelf change, by shelf size.
+
+Times moving a random book on a shelf, then adding and deleting one, with
+and without refreshing the shelf's summary in the same transaction. Then
+checks that the summary kept up by those refreshes matches one rebuilt from
+the books:
+
+    python -m benchmarks.shelf_refresh [operations]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['JOBS_WORKERS'] = '0'
+
+from app import create_app  # noqa: E402
+from models import db, Book, Shelf, User  # noqa: E402
+from ordering import GAP, append_position, place_book  # noqa: E402
+from shelves import refresh_shelf, shelf_entries  # noqa: E402
+
+SIZES = (100, 1000, 5000)
+
+
+def new_shelf(size):
+    user = User(username=f'reader{size}', profile_image='')
+    db.session.add(user)
+    db.session.flush()
+    db.session.bulk_insert_mappings(Book, [
+        {'title': f'Book {i}', 'author': f'Author {i % 50}', 'sentiment': 'beloved', 'position': (i + 1) * GAP,
+         'user_id': user.id} for i in range(size)])
+    refresh_shelf(user.id, 'beloved')
+    db.session.commit()
+    return user.id
+
+
+def timed(operation, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        operation()
+        db.session.commit()
+    return (time.perf_counter() - started) / count * 1000
+
+
+def main(operations=50):
+    operations = int(operations)
+    rng = random.Random(11)
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        for size in SIZES:
+            user_id = new_shelf(size)
+            books = Book.query.filter_by(user_id=user_id).all()
+
+            def move(refresh):
+                place_book(rng.choice(books), rng.choice(books), rng.random() < 0.5)
+                if refresh:
+                    refresh_shelf(user_id, 'beloved')
+
+            def add_and_delete(refresh):
+                book = Book(title='New', author='Someone', sentiment='beloved', user_id=user_id,
+                            position=append_position(user_id, 'beloved'))
+                db.session.add(book)
+                if refresh:
+                    refresh_shelf(user_id, 'beloved')
+                db.session.commit()
+                db.session.delete(book)
+                if refresh:
+                    refresh_shelf(user_id, 'beloved')
+
+            moved, moved_refreshed = timed(lambda: move(False), operations), timed(lambda: move(True), operations)
+            added = timed(lambda: add_and_delete(False), operations) / 2
+            added_refreshed = timed(lambda: add_and_delete(True), operations) / 2
+            print(f'{size:5,}-book shelf: move {moved:6.2f} ms, {moved_refreshed:6.2f} ms with the refresh; '
+                  f'add or delete {added:6.2f} ms, {added_refreshed:6.2f} ms with it')
+
+            summary = json.loads(db.session.query(Shelf.entries).filter_by(user_id=user_id).scalar())
+            if summary != shelf_entries(user_id, 'beloved'):
+                print(f'FAIL: the {size:,}-book summary differs from a rebuild')
+                sys.exit(1)
+        print('every summary matches a rebuild')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
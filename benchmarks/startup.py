@@ -0,0 +1,88 @@
+"""Cold start: import time, building the app and serving its first request.
+
+Every run is a fresh interpreter, like a new dyno or gunicorn worker:
+
+- ``python -X importtime -c 'import app'``, reporting the costliest imports
+- ``create_app()`` and a first ``GET /`` through the test client
+
+Doubles as a regression check: exits non-zero if serving a request imported
+any of ``LAZY_MODULES`` or if the median time to first request is over
+``STARTUP_BUDGET_MS``:
+
+    python -m benchmarks.startup [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Only needed by `flask db` and `flask assets-build` or on the first Google Books call
+LAZY_MODULES = ('alembic', 'flask_migrate', 'requests', 'PIL', 'fontTools', 'brotli', 'numpy', 'scipy')
+STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 1500))
+
+FIRST_REQUEST = f'''
+import sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+built = time.perf_counter()
+status = app.test_client().get('/').status_code
+served = time.perf_counter()
+print(status, imported - started, built - started, served - started,
+      ','.join(name for name in {LAZY_MODULES!r} if name in sys.modules))
+'''
+
+
+def run(args):
+    env = dict(os.environ, JOBS_WORKERS='0',
+               DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    result = subprocess.run([sys.executable, *args], capture_output=True, text=True, env=env, check=True)
+    return result
+
+
+def slowest_imports(count=8):
+    """(cumulative microseconds, module) for the costliest top-level imports of ``import app``."""
+    stderr = run(['-X', 'importtime', '-c', 'import app']).stderr
+    children = []
+    for line in stderr.splitlines()[1:]:
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # A module is listed after everything it imported
+        if depth == 0:
+            if name.strip() == 'app':
+                total, imports = int(cumulative), children
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative), name.strip()))
+    return total, sorted(imports, reverse=True)[:count]
+
+
+def main(runs=5):
+    total, imports = slowest_imports()
+    print(f'import app: {total / 1000:.0f} ms, costliest imports:')
+    for cumulative, name in imports:
+        print(f'  {cumulative / 1000:7.1f} ms  {name}')
+
+    timings = []
+    for _ in range(runs):
+        status, imported, built, served, *loaded = run(['-c', FIRST_REQUEST]).stdout.split()
+        assert status == '200', status
+        timings.append((float(imported), float(built), float(served)))
+    imported, built, served = (statistics.median(column) * 1000 for column in zip(*timings))
+    print(f'median of {runs}: imported {imported:.0f} ms, app built {built:.0f} ms, first response {served:.0f} ms')
+
+    failures = []
+    if loaded:
+        failures.append(f'serving a request imported {loaded[0]}')
+    if served > STARTUP_BUDGET_MS:
+        failures.append(f'first response after {served:.0f} ms, budget {STARTUP_BUDGET_MS:.0f} ms')
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,79 @@
+"""p50/p99 latency of Google Books calls with and without connection pooling.
+
+Runs against the local FakeBooksAPI, so the numbers isolate connection setup
+and client overhead rather than Google's own latency:
+
+    python -m benchmarks.upstream_pooling
+"""
+import asyncio
+import statistics
+import time
+
+import requests
+
+from benchmarks.fake_books_api import FakeBooksAPI
+from upstream import AsyncGoogleBooksClient, GoogleBooksClient
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    return 1000 * statistics.median(timings), 1000 * p99
+
+
+def report(label, timings):
+    p50, p99 = percentiles(timings)
+    print(f'{label:<28} p50 {p50:7.3f} ms   p99 {p99:7.3f} ms')
+
+
+def unpooled(url, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        requests.get(url, params={'q': query, 'maxResults': 5}).json()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def pooled(url, queries):
+    client = GoogleBooksClient(url)
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        client.search(query)
+        timings.append(time.perf_counter() - started)
+    client.close()
+    return timings
+
+
+async def async_fanout(url, queries):
+    async with AsyncGoogleBooksClient(url) as client:
+        async def timed(query):
+            started = time.perf_counter()
+            await client.search(query)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(timed(query) for query in queries))
+        return timings, time.perf_counter() - started
+
+
+def main(requests_per_run=500, fanout=200, upstream_latency=0.02):
+    queries = [f'book {i}' for i in range(requests_per_run)]
+    with FakeBooksAPI() as api:
+        report('requests.get (no pool)', unpooled(api.url, queries))
+        report('GoogleBooksClient (pooled)', pooled(api.url, queries))
+
+    with FakeBooksAPI(latency=upstream_latency) as api:
+        try:
+            timings, wall = asyncio.run(async_fanout(api.url, queries[:fanout]))
+        except RuntimeError as exc:
+            print(f'async client skipped: {exc}')
+            return
+        report(f'async, {fanout} in flight', timings)
+        print(f'{fanout} lookups at {1000 * upstream_latency:.0f} ms upstream latency '
+              f'finished in {1000 * wall:.0f} ms wall time')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Cached, coalescing Google Books lookup used by /search_books.
+
+The search box on the home page fires a request per keystroke, so most
+queries are repeats or extensions of a query we have just answered.
+``BookLookup`` keeps normalized queries in a TTL+LRU cache, lets identical
+concurrent queries share a single upstream call, and answers a query from a
+cached shorter prefix while the full query is fetched in the background.
+"""
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+_WORD = re.compile(r'\w+')
+
+
+def normalize_query(query):
+    return _WHITESPACE.sub(' ', (query or '').strip().lower())
+
+
+def parse_volumes(data):
+    books = []
+    for item in data.get('items', []):
+        volume_info = item.get('volumeInfo', {})
+        authors = volume_info.get('authors') or ['Unknown Author']
+        books.append({
+            "title": volume_info.get('title', 'Unknown Title'),
+            "author": authors[0],
+            "google_books_url": volume_info.get('infoLink', ''),
+        })
+    return books
+
+
+def _isbn(volume_info):
+    identifiers = {identifier.get('type'): identifier.get('identifier')
+                   for identifier in volume_info.get('industryIdentifiers', [])}
+    return identifiers.get('ISBN_13') or identifiers.get('ISBN_10')
+
+
+def parse_volume_details(data):
+    """Like ``parse_volumes`` but with the metadata kept for enrichment: all authors, ISBN and cover."""
+    volumes = []
+    for item in data.get('items', []):
+        volume_info = item.get('volumeInfo', {})
+        images = volume_info.get('imageLinks', {})
+        volumes.append({
+            "title": volume_info.get('title', 'Unknown Title'),
+            "author": ', '.join(volume_info.get('authors') or ['Unknown Author']),
+            "google_books_url": volume_info.get('infoLink', ''),
+            "isbn": _isbn(volume_info),
+            "cover_url": images.get('thumbnail') or images.get('smallThumbnail'),
+        })
+    return volumes
+
+
+def _matches(book, terms):
+    words = _WORD.findall(f"{book['title']} {book['author']}".lower())
+    return all(any(word.startswith(term) for word in words) for term in terms)
+
+
+class LookupStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.prefix_hits = 0
+            self.misses = 0
+            self.coalesced = 0
+            self.errors = 0
+            self.hit_seconds = 0.0
+            self.upstream_calls = 0
+            self.upstream_seconds = 0.0
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self):
+        with self._lock:
+            served = self.hits + self.prefix_hits
+            return {
+                'hits': self.hits,
+                'prefix_hits': self.prefix_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'upstream_calls': self.upstream_calls,
+                'avg_hit_ms': 1000 * self.hit_seconds / served if served else 0.0,
+                'avg_upstream_ms': 1000 * self.upstream_seconds / self.upstream_calls if self.upstream_calls else 0.0,
+            }
+
+
+class _InflightCall:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BookLookup:
+    def __init__(self, fetch, maxsize=2048, ttl=600, min_prefix=3, background_workers=2):
+        self._fetch = fetch
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._min_prefix = min_prefix
+        self._background_workers = background_workers
+        self._executor = None
+        self.stats = LookupStats()
+
+    def search(self, query):
+        key = normalize_query(query)
+        if not key:
+            return []
+
+        started = time.perf_counter()
+        books = self._cache.get(key)
+        if books is not None:
+            self.stats.incr('hits')
+            self.stats.incr('hit_seconds', time.perf_counter() - started)
+            return books
+
+        books = self._from_prefix(key)
+        if books:
+            self.stats.incr('prefix_hits')
+            self.stats.incr('hit_seconds', time.perf_counter() - started)
+            self._load_in_background(key)
+            return books
+
+        self.stats.incr('misses')
+        try:
+            return self._load(key)
+        except Exception:
+            self.stats.incr('errors')
+            logger.warning('Google Books lookup failed for %r', key, exc_info=True)
+            return self._cache.get_stale(key, [])
+
+    def cached(self, query):
+        return self._cache.get(normalize_query(query))
+
+    def clear(self):
+        self._cache.clear()
+
+    def _from_prefix(self, key):
+        terms = key.split(' ')
+        for end in range(len(key) - 1, self._min_prefix - 1, -1):
+            books = self._cache.get(key[:end].rstrip())
+            if books is not None:
+                return [book for book in books if _matches(book, terms)]
+        return None
+
+    def _load(self, key):
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _InflightCall()
+
+        if not leader:
+            self.stats.incr('coalesced')
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            started = time.perf_counter()
+            try:
+                call.result = self._fetch(key)
+            finally:
+                self.stats.incr('upstream_calls')
+                self.stats.incr('upstream_seconds', time.perf_counter() - started)
+            self._cache.set(key, call.result)
+            return call.result
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.event.set()
+
+    def _load_in_background(self, key):
+        with self._lock:
+            if key in self._inflight:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._background_workers,
+                                                    thread_name_prefix='book-lookup')
+        self._executor.submit(self._refresh, key)
+
+    def _refresh(self, key):
+        try:
+            self._load(key)
+        except Exception:
+            self.stats.incr('errors')
+            logger.warning('Background Google Books lookup failed for %r', key, exc_info=True)
@@ -0,0 +1,140 @@
+"""Local book catalog that /search_books consults before Google.
+
+Every book a user adds is folded into ``CatalogBook`` (deduplicated by a
+normalized title/author key), so popular titles are answered from our own
+full-text index and search keeps working when Google is unreachable.
+"""
+import importlib
+import re
+
+from sqlalchemy import func, text
+
+from models import db, Book, CatalogBook
+
+_NON_WORD = re.compile(r'[^\w\s]')
+_WHITESPACE = re.compile(r'\s+')
+_WORD = re.compile(r'\w+')
+
+
+def _normalize(value):
+    return _WHITESPACE.sub(' ', _NON_WORD.sub(' ', (value or '').lower())).strip()
+
+
+def catalog_key(title, author):
+    return f'{_normalize(title)}|{_normalize(author)}'
+
+
+def _upsert():
+    """INSERT ... ON CONFLICT (key) that adds to an existing entry's ``times_added`` and fills in its link.
+
+    Two users adding the same new book at once then both count it, instead
+    of the second failing on the unique key.
+    """
+    table = CatalogBook.__table__
+    # SQLite's and Postgres's INSERT ... ON CONFLICT, as in leaderboard.apply_deltas
+    statement = importlib.import_module(f'sqlalchemy.dialects.{db.engine.dialect.name}').insert(table)
+    added = statement.excluded
+    return statement.on_conflict_do_update(index_elements=[table.c.key], set_={
+        'times_added': table.c.times_added + added.times_added,
+        'google_books_url': func.coalesce(table.c.google_books_url, added.google_books_url),
+    })
+
+
+def _row(key, title, author, google_books_url, times_added):
+    return {'key': key, 'title': title, 'author': author, 'google_books_url': google_books_url or None,
+            'search_text': f'{_normalize(title)} {_normalize(author)}', 'times_added': times_added}
+
+
+def record_book(title, author, google_books_url=None, times_added=1):
+    """Add a book to the catalog or bump its popularity, and return its entry. The caller commits."""
+    key = catalog_key(title, author)
+    entry_id = db.session.execute(_upsert().returning(CatalogBook.__table__.c.id),
+                                  _row(key, title, author, google_books_url, times_added)).scalar_one()
+    return db.session.get(CatalogBook, entry_id, populate_existing=True)
+
+
+def record_books(books):
+    """``record_book`` for many (title, author, google_books_url) at once, in one statement. The caller commits."""
+    added = {}
+    for title, author, google_books_url in books:
+        key = catalog_key(title, author)
+        entry = added.get(key)
+        if entry is None:
+            added[key] = [title, author, google_books_url or None, 1]
+        else:
+            entry[2] = entry[2] or google_books_url or None
+            entry[3] += 1
+    if not added:
+        return
+    # In key order, so imports sharing books lock them in the same order instead of deadlocking on Postgres
+    db.session.execute(_upsert(), [_row(key, *entry) for key, entry in sorted(added.items())])
+
+
+def backfill_catalog():
+    """Rebuild catalog popularity from every row in ``book``. Returns the number of catalog entries."""
+    books = {}
+    rows = db.session.query(Book.title, Book.author, Book.google_books_url).yield_per(1000)
+    for title, author, google_books_url in rows:
+        key = catalog_key(title, author)
+        entry = books.get(key)
+        if entry is None:
+            books[key] = [title, author, google_books_url, 1]
+        else:
+            entry[2] = entry[2] or google_books_url
+            entry[3] += 1
+
+    existing = {entry.key: entry for entry in CatalogBook.query.all()}
+    for key, (title, author, google_books_url, count) in books.items():
+        entry = existing.get(key)
+        if entry is None:
+            db.session.add(CatalogBook(key=key, title=title, author=author, google_books_url=google_books_url,
+                                       search_text=f'{_normalize(title)} {_normalize(author)}',
+                                       times_added=count))
+        else:
+            entry.google_books_url = entry.google_books_url or google_books_url
+            entry.times_added = count
+    db.session.commit()
+    return len(existing.keys() | books.keys())
+
+
+def _as_result(row):
+    return {"title": row.title, "author": row.author, "google_books_url": row.google_books_url or ''}
+
+
+def search_catalog(query, limit=5):
+    terms = _WORD.findall(query.lower())
+    if not terms:
+        return []
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        # Every term is a prefix match so results keep up with the user typing.
+        match = ' '.join(f'"{term}"*' for term in terms)
+        rows = db.session.execute(text(
+            "SELECT c.title, c.author, c.google_books_url FROM catalog_book_fts "
+            "JOIN catalog_book c ON c.id = catalog_book_fts.rowid "
+            "WHERE catalog_book_fts MATCH :match "
+            "ORDER BY bm25(catalog_book_fts), c.times_added DESC LIMIT :limit"
+        ), {'match': match, 'limit': limit})
+    elif dialect == 'postgresql':
+        rows = db.session.execute(text(
+            "SELECT title, author, google_books_url FROM catalog_book "
+            "WHERE search_text % :query OR search_text LIKE :prefix "
+            "ORDER BY similarity(search_text, :query) DESC, times_added DESC LIMIT :limit"
+        ), {'query': ' '.join(terms), 'prefix': ' '.join(terms) + '%', 'limit': limit})
+    else:
+        rows = CatalogBook.query.filter(*[CatalogBook.search_text.contains(term) for term in terms]) \
+            .order_by(CatalogBook.times_added.desc()).limit(limit)
+    return [_as_result(row) for row in rows]
+
+
+def merge_results(local, remote, limit=5):
+    """Local matches first, then Google results that are not already listed."""
+    seen = {catalog_key(book['title'], book['author']) for book in local}
+    merged = list(local)
+    for book in remote:
+        key = catalog_key(book['title'], book['author'])
+        if key not in seen:
+            seen.add(key)
+            merged.append(book)
+    return merged[:limit]
@@ -0,0 +1,76 @@
+"""``flask`` commands for maintenance and background work."""
+import json
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from catalog import backfill_catalog
+from extensions import job_queue
+from jobs import enqueue
+from leaderboard import rebuild_aggregates
+from models import db
+
+
+@click.command('catalog-backfill')
+@with_appcontext
+def catalog_backfill_command():
+    """Build the local book catalog from every book users have added."""
+    click.echo(f'Catalog holds {backfill_catalog()} books.')
+
+
+@click.command('leaderboard-rebuild')
+@with_appcontext
+def leaderboard_rebuild_command():
+    """Recompute every book's site-wide ratings from the shelves, to repair them."""
+    click.echo(f'Leaderboard holds {rebuild_aggregates()} books.')
+
+
+@click.command('assets-build')
+@with_appcontext
+def assets_build_command():
+    """Purge, recompress and fingerprint the static assets into ASSETS_DIR."""
+    # Imported here so web processes never load Pillow or fontTools
+    from asset_build import build_assets
+    app = current_app
+    report = build_assets(app.static_folder, os.path.join(app.root_path, app.template_folder),
+                          app.config['ASSETS_DIR'], app.config['ASSETS_SOURCES_DIR'])
+    for name, source, built, compressed in report:
+        click.echo(f'{name:48} {source:>10,} -> {built:>9,} bytes, {compressed:>9,} compressed')
+    click.echo(f'Built {len(report)} assets into {app.config["ASSETS_DIR"]}.')
+
+
+@click.command('recommendations-build')
+@with_appcontext
+def recommendations_build_command():
+    """Recompute the similar-books lists that suggestions are made from."""
+    # Imported here so web processes never load NumPy or SciPy
+    from recommendation_build import build_similarities
+    count = build_similarities(current_app.config)
+    click.echo(f'Listed similar books for {count} books.')
+
+
+@click.command('jobs-work')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of waiting for more.')
+@with_appcontext
+def jobs_work_command(burst):
+    """Run background jobs until interrupted."""
+    job_queue.work(burst=burst)
+
+
+@click.command('jobs-enqueue')
+@click.argument('kind')
+@click.argument('payload', default='{}')
+@with_appcontext
+def jobs_enqueue_command(kind, payload):
+    """Queue a job, e.g. `flask jobs-enqueue backfill_google_urls`, `build_recommendations` or `trim_timelines`."""
+    if kind not in job_queue.handlers:
+        raise click.BadParameter(f'choose from {", ".join(sorted(job_queue.handlers))}', param_hint='KIND')
+    job = enqueue(kind, json.loads(payload))
+    db.session.commit()
+    click.echo(f'Queued {kind} job {job.id}.')
+
+
+COMMANDS = (assets_build_command, catalog_backfill_command, jobs_work_command, jobs_enqueue_command,
+            leaderboard_rebuild_command, recommendations_build_command)
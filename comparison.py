@@ -0,0 +1,140 @@
+"""Strategies for choosing which book to compare a new book against next.
+
+A ranking narrows a half-open range [lo, hi) of shelf indexes the book may
+land at; a strategy decides which index to probe next (``state['next']``)
+and how an answer narrows the range. Strategies keep everything in the
+ranking's JSON state so a ranking can resume in any worker.
+
+``BinarySearch`` always probes the middle: about log2(n) comparisons.
+``PriorSearch`` instead splits the probability mass of where the book is
+likely to land. Half of that mass is spread evenly over the shelf and half
+sits around anchor books named by its priors, decaying geometrically with the
+distance from them, so a good prior saves comparisons while a useless one
+costs at most about one more than bisecting. Priors:
+
+- ``author_prior``: the user's other books by the same author
+- ``history_prior``: the user's most recently added books, for users whose
+  new reads tend to land in the same part of the shelf
+
+The ``adaptive`` strategy uses both.
+"""
+PRIOR_SHARE = 0.5
+DECAY = 0.8
+MAX_ANCHORS = 32
+
+
+def _midpoint(state):
+    return (state['lo'] + state['hi']) // 2
+
+
+def _narrow(state, preferred):
+    """Apply an answer about the book at ``state['next']``; ``preferred`` means the new book won."""
+    if preferred:
+        state['hi'] = state['next']
+    else:
+        state['lo'] = state['next'] + 1
+
+
+class BinarySearch:
+    name = 'binary'
+
+    def begin(self, state, shelf, subject):
+        """Set up a search over [state['lo'], state['hi']).
+
+        ``shelf()`` returns the shelf's (id, author) pairs in order, without the
+        book being ranked; ``subject`` is that book.
+        """
+        state['next'] = _midpoint(state)
+
+    def record(self, state, preferred):
+        _narrow(state, preferred)
+        state['next'] = _midpoint(state)
+
+
+def author_prior(shelf, subject):
+    author = (subject.author or '').strip().lower()
+    return [index for index, (_, entry_author) in enumerate(shelf) if (entry_author or '').strip().lower() == author]
+
+
+def history_prior(shelf, subject, recent=5):
+    return sorted(range(len(shelf)), key=lambda index: shelf[index][0])[-recent:]
+
+
+def _anchor_mass(anchor, last, decay):
+    """Unnormalized mass an anchor puts on insertion points 0..``last``.
+
+    The two points either side of the anchor book get 1 each, the next ones
+    out ``decay``, then ``decay ** 2`` and so on.
+    """
+    if last < 0:
+        return 0.0
+    upper = min(last, anchor)
+    mass = (decay ** (anchor - upper) - decay ** (anchor + 1)) / (1 - decay)
+    if last > anchor:
+        mass += (1 - decay ** (last - anchor)) / (1 - decay)
+    return mass
+
+
+class PriorSearch(BinarySearch):
+    def __init__(self, name, priors, prior_share=PRIOR_SHARE, decay=DECAY):
+        self.name = name
+        self.priors = priors
+        self.prior_share = prior_share
+        self.decay = decay
+
+    def begin(self, state, shelf, subject):
+        entries = shelf()
+        anchors = sorted({anchor for prior in self.priors for anchor in prior(entries, subject)
+                          if 0 <= anchor < state['hi']})
+        if not anchors:
+            return super().begin(state, shelf, subject)
+        state['anchors'] = anchors[:MAX_ANCHORS]
+        state['size'] = state['hi']
+        state['next'] = self._split(state)
+
+    def record(self, state, preferred):
+        if 'anchors' not in state:
+            return super().record(state, preferred)
+        _narrow(state, preferred)
+        if state['lo'] < state['hi']:
+            state['next'] = self._split(state)
+
+    def _mass(self, state, last):
+        """Probability that the book belongs at one of insertion points 0..``last``."""
+        anchors, size = state['anchors'], state['size']
+        uniform = (1 - self.prior_share) * (last + 1) / (size + 1)
+        prior = sum(_anchor_mass(anchor, last, self.decay) / _anchor_mass(anchor, size, self.decay)
+                    for anchor in anchors) * self.prior_share / len(anchors)
+        return uniform + prior
+
+    def _split(self, state):
+        """The index in [lo, hi) whose comparison splits the remaining mass most evenly."""
+        lo, hi = state['lo'], state['hi']
+        below = self._mass(state, lo - 1)
+        target = (below + self._mass(state, hi)) / 2
+        # Smallest index whose prefix mass reaches the target, by bisection since mass only grows
+        left, right = lo, hi - 1
+        while left < right:
+            middle = (left + right) // 2
+            if self._mass(state, middle) < target:
+                left = middle + 1
+            else:
+                right = middle
+        if left > lo and target - self._mass(state, left - 1) < self._mass(state, left) - target:
+            left -= 1
+        return left
+
+
+STRATEGIES = {strategy.name: strategy for strategy in (
+    BinarySearch(),
+    PriorSearch('author', [author_prior]),
+    PriorSearch('history', [history_prior]),
+    PriorSearch('adaptive', [author_prior, history_prior]),
+)}
+
+
+def get_strategy(name):
+    try:
+        return STRATEGIES[name]
+    except KeyError:
+        raise ValueError(f'Unknown comparison strategy: {name!r}') from None
@@ -0,0 +1,52 @@
+"""Response compression negotiated from Accept-Encoding.
+
+gzip is always available; brotli is used instead when the optional
+``brotli`` package is installed and the client accepts it. The package is
+only imported by the first response compressed with it, so processes that
+never send one (and every process at start-up) do without loading it.
+"""
+import gzip
+from functools import lru_cache
+from importlib import import_module
+from importlib.util import find_spec
+
+MIN_SIZE = 500
+
+
+@lru_cache(maxsize=None)
+def has_brotli():
+    """Whether the brotli package is installed, found without importing it."""
+    return find_spec('brotli') is not None
+
+
+def load_brotli():
+    """The brotli module, or None when it is not installed."""
+    return import_module('brotli') if has_brotli() else None
+
+
+def encodings():
+    """Content encodings this process can produce, preferred first."""
+    return (['br'] if has_brotli() else []) + ['gzip']
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return load_brotli().compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def compress_response(response, accept_encodings, min_size=MIN_SIZE):
+    """Compress ``response`` in place for a client sending ``accept_encodings``; small bodies are left alone."""
+    response.vary.add('Accept-Encoding')
+    if response.direct_passthrough or 'Content-Encoding' in response.headers or response.status_code < 200 \
+            or response.status_code in (204, 304):
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    encoding = next((encoding for encoding in encodings() if accept_encodings[encoding]), None)
+    if encoding is None:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
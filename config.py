@@ -0,0 +1,75 @@
+"""Settings read from the environment into ``app.config`` by ``create_app``."""
+import os
+
+
+def load_config(app):
+    uri = os.getenv("DATABASE_URL")  # or other relevant config var
+    if uri and uri.startswith("postgres://"):
+        uri = uri.replace("postgres://", "postgresql://", 1)
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri or 'sqlite:///literatus.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'hannah_arendt_is_great')
+    app.config['GOOGLE_BOOKS_API_URL'] = os.environ.get('GOOGLE_BOOKS_API_URL', 'https://www.googleapis.com/books/v1/volumes')
+    app.config['GOOGLE_BOOKS_CONNECT_TIMEOUT'] = float(os.environ.get('GOOGLE_BOOKS_CONNECT_TIMEOUT', 2))
+    app.config['GOOGLE_BOOKS_READ_TIMEOUT'] = float(os.environ.get('GOOGLE_BOOKS_READ_TIMEOUT', 3))
+    app.config['GOOGLE_BOOKS_POOL_SIZE'] = int(os.environ.get('GOOGLE_BOOKS_POOL_SIZE', 10))
+    app.config['BOOK_LOOKUP_CACHE_SIZE'] = int(os.environ.get('BOOK_LOOKUP_CACHE_SIZE', 2048))
+    app.config['BOOK_LOOKUP_CACHE_TTL'] = int(os.environ.get('BOOK_LOOKUP_CACHE_TTL', 600))
+    app.config['CATALOG_MIN_RESULTS'] = int(os.environ.get('CATALOG_MIN_RESULTS', 3))
+    # 'database' shares ranking sessions between workers; 'memory' keeps them per process, for a single worker only
+    app.config['RANKING_STORE'] = os.environ.get('RANKING_STORE', 'database')
+    app.config['RANKING_SESSION_TTL'] = int(os.environ.get('RANKING_SESSION_TTL', 3600))
+    # Which book to compare against next (see comparison.py), and how many places off a ranking may stop
+    app.config['RANKING_STRATEGY'] = os.environ.get('RANKING_STRATEGY', 'author')
+    app.config['RANKING_TOLERANCE'] = int(os.environ.get('RANKING_TOLERANCE', 0))
+    app.config['USER_SEARCH_PAGE_SIZE'] = int(os.environ.get('USER_SEARCH_PAGE_SIZE', 20))
+    # Cached pages are keyed on the newest user id, so they never miss a registration (see user_search.py)
+    app.config['USER_SEARCH_CACHE_TTL'] = int(os.environ.get('USER_SEARCH_CACHE_TTL', 30))
+    # Werkzeug hash method for new passwords; older hashes are redone at the next login (see passwords.py)
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    # Hashing processes per web process (0 hashes in the request thread), and how many hashes may be
+    # running or queued in it before logins wait up to PASSWORD_HASH_WAIT seconds and then get a 503.
+    # A slot per request thread (gunicorn.conf.py's WEB_THREADS), so logins arriving together on one worker
+    # queue for the pool instead of turning each other away; set it lower to keep threads free for page loads
+    # during a login storm. The wait covers several scrypt hashes (~0.1s each), so under a lowered limit a
+    # login takes the slot a finishing one frees rather than getting a 503
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 1))
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING',
+                                                                 os.environ.get('WEB_THREADS', 4)))
+    app.config['PASSWORD_HASH_WAIT'] = float(os.environ.get('PASSWORD_HASH_WAIT', 1.0))
+    # Logged-in users resolved per worker; a change reaches other workers within the TTL
+    app.config['IDENTITY_CACHE_SIZE'] = int(os.environ.get('IDENTITY_CACHE_SIZE', 1024))
+    app.config['IDENTITY_CACHE_TTL'] = int(os.environ.get('IDENTITY_CACHE_TTL', 30))
+    app.config['PROFILE_FRAGMENT_CACHE_SIZE'] = int(os.environ.get('PROFILE_FRAGMENT_CACHE_SIZE', 256))
+    # Output of `flask assets-build`, and where it keeps what it downloads (see asset_build.py)
+    app.config['ASSETS_DIR'] = os.environ.get('ASSETS_DIR', os.path.join(app.static_folder, 'dist'))
+    app.config['ASSETS_SOURCES_DIR'] = os.environ.get('ASSETS_SOURCES_DIR', os.path.join(app.instance_path, 'asset-sources'))
+    app.config['ASSETS_MAX_AGE'] = int(os.environ.get('ASSETS_MAX_AGE', 365 * 24 * 3600))
+    # Activity feed (see feed.py): users with more followers than FEED_FANOUT_LIMIT have their activity read by
+    # their followers' feeds instead of copied into them; timelines are trimmed to about FEED_TIMELINE_SIZE
+    # entries every FEED_TRIM_INTERVAL seconds, and a new follow copies the FEED_BACKFILL latest activities
+    app.config['FEED_PAGE_SIZE'] = int(os.environ.get('FEED_PAGE_SIZE', 20))
+    app.config['FEED_FANOUT_LIMIT'] = int(os.environ.get('FEED_FANOUT_LIMIT', 5000))
+    app.config['FEED_TIMELINE_SIZE'] = int(os.environ.get('FEED_TIMELINE_SIZE', 500))
+    app.config['FEED_TRIM_INTERVAL'] = int(os.environ.get('FEED_TRIM_INTERVAL', 3600))
+    app.config['FEED_BACKFILL'] = int(os.environ.get('FEED_BACKFILL', 50))
+    app.config['LEADERBOARD_SIZE'] = int(os.environ.get('LEADERBOARD_SIZE', 50))
+    # Book similarity lists (see recommendation_build.py): neighbors kept per book, readers two books need in
+    # common to be compared and the shrinkage applied to few, and multiplications per block of the build
+    app.config['RECOMMENDATIONS_NEIGHBORS'] = int(os.environ.get('RECOMMENDATIONS_NEIGHBORS', 20))
+    app.config['RECOMMENDATIONS_MIN_COMMON'] = int(os.environ.get('RECOMMENDATIONS_MIN_COMMON', 2))
+    app.config['RECOMMENDATIONS_SHRINKAGE'] = float(os.environ.get('RECOMMENDATIONS_SHRINKAGE', 10))
+    app.config['RECOMMENDATIONS_BLOCK_PRODUCTS'] = int(os.environ.get('RECOMMENDATIONS_BLOCK_PRODUCTS', 20_000_000))
+    # Seconds between rebuilds by the build_recommendations job, which queues its own next run; 0 runs it once
+    app.config['RECOMMENDATIONS_INTERVAL'] = int(os.environ.get('RECOMMENDATIONS_INTERVAL', 24 * 3600))
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['SLOW_REQUEST_SECONDS'] = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))
+    # Background job threads per web process; 0 leaves the queue to `flask jobs-work`, which also runs the
+    # kinds web processes never take (build_recommendations)
+    app.config['JOBS_WORKERS'] = int(os.environ.get('JOBS_WORKERS', 1))
+    app.config['JOBS_MAX_ATTEMPTS'] = int(os.environ.get('JOBS_MAX_ATTEMPTS', 5))
+    # Google Books calls per second (and burst) allowed to background jobs, per process
+    app.config['JOBS_GOOGLE_RATE'] = float(os.environ.get('JOBS_GOOGLE_RATE', 1))
+    app.config['JOBS_GOOGLE_BURST'] = int(os.environ.get('JOBS_GOOGLE_BURST', 5))
@@ -0,0 +1,55 @@
+"""Job handlers that fill in book metadata from Google Books in the background.
+
+Metadata is kept once per distinct book on its ``CatalogBook`` entry, so
+however many users add the same book Google is asked about it once (then
+again after ``REFRESH_AFTER``).
+"""
+from datetime import datetime, timedelta
+
+from catalog import catalog_key, record_book
+from jobs import enqueue
+from models import db, Book, CatalogBook
+from shelves import update_entry_link
+
+REFRESH_AFTER = timedelta(days=30)
+BACKFILL_BATCH = 200
+
+
+def enrich_book(book_id, lookup_volume):
+    """Fetch metadata for a book's catalog entry if it is missing or old, and fill in the book's link.
+
+    ``lookup_volume(title, author)`` returns a ``parse_volume_details`` dict or None.
+    """
+    book = db.session.get(Book, book_id)
+    if book is None:
+        return  # deleted since it was queued
+
+    entry = CatalogBook.query.filter_by(key=catalog_key(book.title, book.author)).first()
+    if entry is None:
+        entry = record_book(book.title, book.author, book.google_books_url, times_added=0)
+    if entry.enriched_at is None or entry.enriched_at < datetime.utcnow() - REFRESH_AFTER:
+        volume = lookup_volume(entry.title, entry.author)
+        if volume is not None:
+            entry.isbn = volume['isbn']
+            entry.cover_url = volume['cover_url']
+            entry.canonical_author = volume['author'][:200]
+            entry.google_books_url = entry.google_books_url or volume['google_books_url'] or None
+        entry.enriched_at = datetime.utcnow()
+
+    if not book.google_books_url and entry.google_books_url:
+        book.google_books_url = entry.google_books_url
+        # Without a new shelf version, so it does not restart a ranking of the book just added
+        update_entry_link(book.user_id, book.sentiment, book.id, book.google_books_url)
+
+
+def backfill_google_urls(after_id=0, user_id=None):
+    """Queue ``enrich_book`` for the next batch of books with no Google Books link, then continue after it."""
+    query = db.session.query(Book.id).filter(db.or_(Book.google_books_url.is_(None), Book.google_books_url == ''),
+                                             Book.id > after_id)
+    if user_id is not None:
+        query = query.filter(Book.user_id == user_id)
+    book_ids = [book_id for (book_id,) in query.order_by(Book.id).limit(BACKFILL_BATCH)]
+    for book_id in book_ids:
+        enqueue('enrich_book', {'book_id': book_id})
+    if len(book_ids) == BACKFILL_BATCH:
+        enqueue('backfill_google_urls', {'after_id': book_ids[-1], 'user_id': user_id})
@@ -0,0 +1,100 @@
+"""Shared objects, created unbound at import and set up for an app by ``create_app``.
+
+Flask extensions follow the usual ``init_app`` pattern. The app's own
+services depend on its config, so ``init_services`` builds them into
+``app.extensions['literatus']``; the names below are proxies to the current
+app's instances, so views use them like plain module globals.
+"""
+import threading
+
+from flask import current_app
+from flask_login import LoginManager
+from werkzeug.local import LocalProxy
+
+from book_lookup import BookLookup
+from identity import IdentityCache
+from instrumentation import Metrics
+from jobs import JobQueue, RetryLater, TokenBucket
+from models import db
+from profile_cache import ProfileCache
+from ranking import make_store
+from upstream import CircuitOpen, GoogleBooksClient
+from user_search import UserSearch
+
+login_manager = LoginManager()
+metrics = Metrics()
+job_queue = JobQueue()
+
+
+class GoogleBooks:
+    """Google Books access for one app.
+
+    The pooled client, and with it ``requests``, is only created on first
+    use: most searches are answered from the local catalog, so many workers
+    never need it.
+    """
+
+    def __init__(self, config, observer=None):
+        self.config = config
+        self.observer = observer
+        self.job_rate = TokenBucket(config['JOBS_GOOGLE_RATE'], burst=config['JOBS_GOOGLE_BURST'])
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = GoogleBooksClient(self.config['GOOGLE_BOOKS_API_URL'],
+                                                     connect_timeout=self.config['GOOGLE_BOOKS_CONNECT_TIMEOUT'],
+                                                     read_timeout=self.config['GOOGLE_BOOKS_READ_TIMEOUT'],
+                                                     pool_size=self.config['GOOGLE_BOOKS_POOL_SIZE'],
+                                                     observer=self.observer)
+        return self._client
+
+    def search(self, query):
+        return self.client.search(query)
+
+    def lookup_volume(self, title, author):
+        """``volume()`` for background jobs, held to ``JOBS_GOOGLE_RATE``.
+
+        While the circuit is open the job is put off until it may close, with
+        ``RetryLater``, instead of spending a token and one of its attempts.
+        """
+        wait = self.client.breaker.retry_after()
+        if wait:
+            raise RetryLater(wait)
+        self.job_rate.acquire()
+        try:
+            return self.client.volume(title, author)
+        except CircuitOpen as exc:  # opened while this waited for a token
+            raise RetryLater(exc.retry_after) from exc
+
+
+def init_services(app):
+    config = app.config
+    google_books = GoogleBooks(config, observer=metrics.observe_upstream if metrics.enabled else None)
+    app.extensions['literatus'] = {
+        'google_books': google_books,
+        'book_lookup': BookLookup(google_books.search, maxsize=config['BOOK_LOOKUP_CACHE_SIZE'],
+                                  ttl=config['BOOK_LOOKUP_CACHE_TTL']),
+        'ranking_store': make_store(config['RANKING_STORE'], config['RANKING_SESSION_TTL']),
+        'user_search': UserSearch(page_size=config['USER_SEARCH_PAGE_SIZE'], ttl=config['USER_SEARCH_CACHE_TTL']),
+        'profile_cache': ProfileCache(maxsize=config['PROFILE_FRAGMENT_CACHE_SIZE']),
+        'identities': IdentityCache(maxsize=config['IDENTITY_CACHE_SIZE'], ttl=config['IDENTITY_CACHE_TTL']),
+    }
+    app.extensions['literatus']['identities'].watch(db.session)
+    return app.extensions['literatus']
+
+
+def _service(name):
+    return LocalProxy(lambda: current_app.extensions['literatus'][name])
+
+
+google_books = _service('google_books')
+book_lookup = _service('book_lookup')
+ranking_store = _service('ranking_store')
+user_search = _service('user_search')
+profile_cache = _service('profile_cache')
+identities = _service('identities')
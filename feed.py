@@ -0,0 +1,133 @@
+"""Follows and the activity feed: what the people a user follows have ranked.
+
+Ranking a book records an ``Activity`` ("ranked Dune as #3 beloved") in the
+transaction that places it, and queues a ``fan_out_activity`` job that copies
+it into every follower's timeline with one INSERT ... SELECT over their
+``Follow`` rows. Reading a feed is then one indexed query, paginated on the
+activity id, however many people the reader follows.
+
+Copying costs a row per follower, so an account with more than
+``FEED_FANOUT_LIMIT`` followers is switched to ``fan_out_on_read`` for good
+(switching back and forth would leave gaps): its activity is written once
+and each follower's feed query reads it from the activity table alongside
+the timeline. Following someone copies their last ``FEED_BACKFILL``
+activities into the new follower's timeline; unfollowing drops them again.
+
+Timelines are kept to about ``FEED_TIMELINE_SIZE`` entries each by the
+``trim_timelines`` job, which queues its own next run
+``FEED_TRIM_INTERVAL`` seconds out; start it with
+`flask jobs-enqueue trim_timelines`.
+"""
+import importlib
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, literal, select, union_all
+
+from jobs import PENDING, enqueue
+from models import db, Activity, Book, Follow, Job, TimelineEntry, User
+
+# Ranking.state['mode'] -> the verb its activity is recorded with
+VERBS = {'rate': 'ranked', 'rerank': 'reranked'}
+
+FeedItem = namedtuple('FeedItem', 'id username profile_image verb title author sentiment rank created_at')
+
+
+def is_following(follower_id, followee_id):
+    return db.session.query(Follow.follower_id).filter_by(follower_id=follower_id, followee_id=followee_id) \
+        .first() is not None
+
+
+def follow(follower_id, followee_id):
+    """Start following, and fill the follower's timeline with the followee's recent activity. The caller commits."""
+    # INSERT ... ON CONFLICT DO NOTHING, so a double click does not copy the backfill twice
+    statement = importlib.import_module(f'sqlalchemy.dialects.{db.engine.dialect.name}').insert(Follow.__table__) \
+        .values(follower_id=follower_id, followee_id=followee_id, created_at=datetime.utcnow()) \
+        .on_conflict_do_nothing()
+    if not db.session.execute(statement).rowcount:
+        return False
+    recent = select(literal(follower_id), Activity.id, Activity.actor_id) \
+        .where(Activity.actor_id == followee_id, Activity.fanned_out) \
+        .order_by(Activity.id.desc()).limit(current_app.config['FEED_BACKFILL'])
+    db.session.execute(TimelineEntry.__table__.insert().from_select(['user_id', 'activity_id', 'actor_id'], recent))
+    return True
+
+
+def unfollow(follower_id, followee_id):
+    """Stop following and take the followee's activity out of the follower's timeline. The caller commits."""
+    Follow.query.filter_by(follower_id=follower_id, followee_id=followee_id).delete()
+    TimelineEntry.query.filter_by(user_id=follower_id, actor_id=followee_id).delete()
+
+
+def record_ranking(book, verb):
+    """Record that ``book`` was just ranked at its current spot, and queue the fan-out. The caller commits."""
+    above = db.session.query(func.count(Book.id)).filter(
+        Book.user_id == book.user_id, Book.sentiment == book.sentiment, Book.position < book.position).scalar()
+    activity = Activity(actor_id=book.user_id, verb=verb, title=book.title, author=book.author,
+                        sentiment=book.sentiment, rank=above + 1, fanned_out=False, created_at=datetime.utcnow())
+    db.session.add(activity)
+    db.session.flush()
+    enqueue('fan_out_activity', {'activity_id': activity.id})
+    return activity
+
+
+def fan_out_activity(activity_id):
+    """Job handler: copy an activity into its actor's followers' timelines, unless they read it on demand."""
+    activity = db.session.get(Activity, activity_id)
+    if activity is None or activity.fanned_out:
+        return 0
+    actor = db.session.get(User, activity.actor_id)
+    if not actor.fan_out_on_read:
+        limit = current_app.config['FEED_FANOUT_LIMIT']
+        if db.session.query(Follow.follower_id).filter_by(followee_id=actor.id).limit(limit + 1).count() > limit:
+            actor.fan_out_on_read = True
+    if actor.fan_out_on_read:
+        return 0
+    followers = select(Follow.follower_id, literal(activity.id), literal(actor.id)) \
+        .where(Follow.followee_id == actor.id)
+    copied = db.session.execute(TimelineEntry.__table__.insert().from_select(
+        ['user_id', 'activity_id', 'actor_id'], followers)).rowcount
+    activity.fanned_out = True
+    return copied
+
+
+def trim_timelines():
+    """Job handler: cut every timeline to its newest ``FEED_TIMELINE_SIZE`` entries, then queue the next trim."""
+    newest_first = func.row_number().over(partition_by=TimelineEntry.user_id,
+                                          order_by=TimelineEntry.activity_id.desc())
+    ranked = select(TimelineEntry.user_id, TimelineEntry.activity_id, newest_first.label('place')).subquery()
+    overflow = select(ranked.c.user_id, ranked.c.activity_id) \
+        .where(ranked.c.place > current_app.config['FEED_TIMELINE_SIZE'])
+    trimmed = TimelineEntry.query.filter(db.tuple_(TimelineEntry.user_id, TimelineEntry.activity_id).in_(overflow)) \
+        .delete(synchronize_session=False)
+    interval = current_app.config['FEED_TRIM_INTERVAL']
+    if interval and not db.session.query(Job.id).filter_by(kind='trim_timelines', status=PENDING).first():
+        enqueue('trim_timelines', delay=interval)
+    return trimmed
+
+
+def read_feed(user_id, before=None, limit=20):
+    """(newest ``FeedItem`` first, cursor for the next page or None) for ``user_id``'s feed.
+
+    ``before`` is the cursor: only activities with a lower id are returned.
+    """
+    pushed = select(TimelineEntry.activity_id.label('id')).where(TimelineEntry.user_id == user_id)
+    # Read through ix_activity_actor, one range per followed account that is read on demand
+    read_on_demand = select(Follow.followee_id).join(User, User.id == Follow.followee_id) \
+        .where(Follow.follower_id == user_id, User.fan_out_on_read)
+    pulled = select(Activity.id).where(Activity.actor_id.in_(read_on_demand), Activity.fanned_out == db.false())
+    if before is not None:
+        pushed = pushed.where(TimelineEntry.activity_id < before)
+        pulled = pulled.where(Activity.id < before)
+    # Each side stops at a page too, so the merge never looks at more than two pages of ids
+    pushed = pushed.order_by(TimelineEntry.activity_id.desc()).limit(limit + 1).subquery()
+    pulled = pulled.order_by(Activity.id.desc()).limit(limit + 1).subquery()
+    ids = union_all(select(pushed.c.id), select(pulled.c.id))
+
+    rows = db.session.query(Activity.id, User.username, User.profile_image, Activity.verb, Activity.title,
+                            Activity.author, Activity.sentiment, Activity.rank, Activity.created_at) \
+        .join(User, User.id == Activity.actor_id).filter(Activity.id.in_(ids)) \
+        .order_by(Activity.id.desc()).limit(limit + 1).all()
+    items = [FeedItem(*row) for row in rows[:limit]]
+    return items, items[-1].id if len(rows) > limit else None
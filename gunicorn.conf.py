@@ -0,0 +1,28 @@
+"""Gunicorn settings for the Procfile's web process.
+
+The app is built once in the master (``preload_app``) and the workers are
+forked from it, so imports, compiled templates and mapper configuration are
+shared copy-on-write instead of being redone by every worker.
+"""
+import gc
+import os
+
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Threads per worker, so a login waiting on its password hash (see passwords.py) does not hold up page loads
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+
+def when_ready(server):
+    from app import warm
+    warm(server.app.wsgi())
+    # Park everything loaded so far where the collector never touches it, so
+    # collections in the workers do not write to (and un-share) those pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from models import db
+    with server.app.wsgi().app_context():
+        # Connections opened in the master belong to it, not the workers
+        db.engine.dispose(close=False)
@@ -0,0 +1,105 @@
+"""The logged-in user for each request, without a query per request.
+
+Flask-Login keeps ``"<id>:<session_version>"`` in the session cookie (see
+``User.get_id``). ``IdentityCache`` resolves it to a ``SessionUser``, a
+read-only projection of the columns pages use, and never loads ``books`` or
+``password_hash``. Resolved users are kept in a short-lived per-worker LRU.
+A cached entry only matches its own session version, and bumping a user's
+``session_version`` ends every session that still carries the old one. In
+this worker that happens as soon as the change is committed, since a cache
+``watch``ing the session forgets every user a commit wrote one of
+``WATCHED_COLUMNS`` for; other workers notice once their entry expires,
+after at most ``ttl`` seconds.
+"""
+from itertools import chain
+
+from flask_login import UserMixin
+from sqlalchemy import event, inspect
+
+from cache import TTLCache
+from models import db, User
+
+# What a SessionUser is built from, plus the password: a commit changing any of them makes a cached one stale
+WATCHED_COLUMNS = ('username', 'profile_image', 'session_version', 'password_hash')
+_CHANGED = 'identity_changed_user_ids'
+
+
+def session_id(user_id, session_version):
+    return f'{user_id}:{session_version}'
+
+
+def parse_session_id(value):
+    """(user id, session version), or None. Sessions from before versions existed count as version 0."""
+    user_id, _, version = value.partition(':')
+    try:
+        return int(user_id), int(version or 0)
+    except ValueError:
+        return None
+
+
+class SessionUser(UserMixin):
+    """What a request knows about the user it is made by."""
+
+    def __init__(self, id, username, profile_image, session_version):
+        self.id = id
+        self.username = username
+        self.profile_image = profile_image
+        self.session_version = session_version
+
+    def get_id(self):
+        return session_id(self.id, self.session_version)
+
+    def __repr__(self):
+        return f'<SessionUser {self.id} {self.username!r}>'
+
+
+class IdentityCache:
+    def __init__(self, maxsize=1024, ttl=30):
+        self._users = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def load(self, value):
+        """The ``SessionUser`` for a session's user id, or None if it is unknown or out of date."""
+        parsed = parse_session_id(value)
+        if parsed is None:
+            return None
+        user_id, version = parsed
+        user = self._users.get(user_id)
+        if user is None or user.session_version != version:
+            row = db.session.query(User.id, User.username, User.profile_image, User.session_version) \
+                .filter_by(id=user_id, session_version=version).first()
+            if row is None:
+                return None
+            user = SessionUser(*row)
+            self._users.set(user_id, user)
+        return user
+
+    def invalidate(self, user_id):
+        """Forget a user after their password or profile changes."""
+        self._users.pop(user_id)
+
+    def watch(self, session):
+        """Invalidate the users each commit on ``session`` changed."""
+        event.listen(session, 'after_commit', self._forget_changed)
+
+    def _forget_changed(self, session):
+        for user_id in session.info.get(_CHANGED, ()):
+            self.invalidate(user_id)
+
+    def clear(self):
+        self._users.clear()
+
+
+@event.listens_for(db.session, 'after_flush')
+def _note_changed(session, flush_context):
+    changed = session.info.setdefault(_CHANGED, set())
+    for user in chain(session.dirty, session.deleted):
+        if isinstance(user, User) and (user in session.deleted or any(
+                inspect(user).attrs[column].history.has_changes() for column in WATCHED_COLUMNS)):
+            changed.add(user.id)
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _reset_changed(session, transaction):
+    # After the commit listeners have run, or on rollback; savepoints leave the outer transaction's list alone
+    if transaction.parent is None:
+        session.info.pop(_CHANGED, None)
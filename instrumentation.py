@@ -0,0 +1,186 @@
+"""Request, SQL and upstream timing exposed on /metrics in Prometheus text format.
+
+Nothing is hooked up unless ``METRICS_ENABLED`` is set, so a disabled
+``Metrics`` costs nothing per request. When enabled it records:
+
+- ``literatus_request_seconds``: latency histogram per route, method and status
+- ``literatus_request_sql_statements`` / ``_sql_seconds``: SQL work per request,
+  from SQLAlchemy engine events
+- ``literatus_upstream_seconds``: Google Books call latency per outcome
+
+and logs requests slower than ``SLOW_REQUEST_SECONDS`` or running the same
+statement ``N_PLUS_ONE_THRESHOLD`` times or more, with the queries involved.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from flask import Response, abort, g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, [("le", bound)])} {bucket_count}')
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, [("le", "+Inf")])} {count}')
+                lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {total}')
+                lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {count}')
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time."""
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge', f'{self.name} {self.read()}']
+
+
+class _RequestSQL:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+
+class Metrics:
+    def __init__(self, app=None, db=None):
+        self.enabled = False
+        self.request_seconds = Histogram('literatus_request_seconds', 'Request latency.',
+                                         labels=('route', 'method', 'status'))
+        self.request_sql_statements = Histogram('literatus_request_sql_statements', 'SQL statements per request.',
+                                                labels=('route',), buckets=COUNT_BUCKETS)
+        self.request_sql_seconds = Histogram('literatus_request_sql_seconds', 'SQL time per request.',
+                                             labels=('route',))
+        self.upstream_seconds = Histogram('literatus_upstream_seconds', 'Google Books call latency.',
+                                          labels=('outcome',))
+        self._metrics = [self.request_seconds, self.request_sql_statements, self.request_sql_seconds,
+                         self.upstream_seconds]
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('METRICS_ENABLED', False)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('SLOW_REQUEST_SECONDS', 1.0)
+        app.config.setdefault('N_PLUS_ONE_THRESHOLD', 10)
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        self.enabled = True
+        self.slow_request_seconds = app.config['SLOW_REQUEST_SECONDS']
+        self.n_plus_one_threshold = app.config['N_PLUS_ONE_THRESHOLD']
+        self.token = app.config['METRICS_TOKEN']
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def add_gauge(self, name, help, read):
+        self._metrics.append(Gauge(name, help, read))
+
+    def observe_upstream(self, seconds, outcome):
+        self.upstream_seconds.observe(seconds, outcome)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+    def _metrics_view(self):
+        if self.token and request.headers.get('Authorization') != f'Bearer {self.token}':
+            abort(403)
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+    def _before_request(self):
+        g._metrics_started = time.perf_counter()
+        g._metrics_sql = _RequestSQL()
+
+    def _after_request(self, response):
+        g._metrics_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        started = g.pop('_metrics_started', None)
+        sql = g.pop('_metrics_sql', None)
+        if started is None or request.endpoint == 'metrics':
+            return
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = g.pop('_metrics_status', 500)
+
+        self.request_seconds.observe(elapsed, route, request.method, status)
+        self.request_sql_statements.observe(sql.count, route)
+        self.request_sql_seconds.observe(sql.seconds, route)
+
+        if elapsed >= self.slow_request_seconds:
+            logger.warning('Slow request %s %s: %.3fs, %d SQL statements in %.3fs; most frequent: %s',
+                           request.method, route, elapsed, sql.count, sql.seconds,
+                           [(' '.join(statement.split()), times) for statement, times in sql.statements.most_common(3)])
+        if sql.statements:
+            statement, times = sql.statements.most_common(1)[0]
+            if times >= self.n_plus_one_threshold:
+                logger.warning('Possible N+1 in %s %s: statement ran %d times: %s',
+                               request.method, route, times, ' '.join(statement.split()))
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['_metrics_started'].pop()
+        if not has_request_context():
+            return
+        sql = g.get('_metrics_sql')
+        if sql is not None:
+            sql.count += 1
+            sql.seconds += time.perf_counter() - started
+            sql.statements[statement] += 1
@@ -0,0 +1,213 @@
+"""Background job queue backed by the ``job`` table; no broker needed.
+
+Requests only ``enqueue`` a row in their own transaction, so deferred work
+never adds to their latency and survives restarts. Workers, either threads in
+the web process (``JOBS_WORKERS``) or a dedicated ``flask jobs-work``
+process, claim due jobs with a compare-and-set UPDATE, so any number of them
+can share the table. Kinds registered with ``web=False`` are heavy enough to
+be kept off the web processes' threads and are only run by `flask jobs-work`.
+A handler's writes are committed together with its job's completion. A failing job is retried with exponential backoff until
+``max_attempts``, then kept as ``failed`` for inspection; a handler that
+cannot run yet raises ``RetryLater`` to be put off without using up an
+attempt. A job whose worker died is picked up again once its lease runs out.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+FAILED = 'failed'
+
+
+class RetryLater(Exception):
+    """Raised by a handler to run its job again ``delay`` seconds from now, without counting the attempt."""
+
+    def __init__(self, delay):
+        super().__init__(f'retry in {delay:.0f}s')
+        self.delay = delay
+
+
+class TokenBucket:
+    """Lets ``rate`` calls per second through on average, in bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _wait_time(self):
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Block until a call is allowed."""
+        while True:
+            wait = self._wait_time()
+            if not wait:
+                return
+            self._sleep(wait)
+
+
+def enqueue(kind, payload=None, delay=0):
+    """Queue a job to run ``delay`` seconds from now. The caller commits."""
+    now = datetime.utcnow()
+    job = Job(kind=kind, payload=json.dumps(payload or {}), status=PENDING, attempts=0,
+              run_at=now + timedelta(seconds=delay), created_at=now)
+    db.session.add(job)
+    return job
+
+
+class JobQueue:
+    def __init__(self, app=None, workers=1, poll_interval=1.0, max_attempts=5, lease=300, backoff=5):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.backoff = backoff
+        self.handlers = {}
+        self.worker_only = set()
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+        self._threads = []
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_WORKERS', self.workers)
+        app.config.setdefault('JOBS_MAX_ATTEMPTS', self.max_attempts)
+        self.workers = app.config['JOBS_WORKERS']
+        self.max_attempts = app.config['JOBS_MAX_ATTEMPTS']
+        self.app = app
+        if self.workers:
+            # Started from the first request so each forked server worker gets its own threads
+            app.before_request(self._ensure_started)
+
+    def register(self, kind, handler, web=True):
+        """Run ``handler(**payload)`` for jobs of ``kind``; in web processes too unless ``web`` is False."""
+        self.handlers[kind] = handler
+        if not web:
+            self.worker_only.add(kind)
+        return handler
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def depth(self, status=PENDING):
+        return db.session.query(db.func.count(Job.id)).filter(Job.status == status).scalar()
+
+    def claim(self, skip=()):
+        """Take the oldest due job not of a kind in ``skip``, or None. Safe to call from any number of workers."""
+        now = datetime.utcnow()
+        due = db.or_(db.and_(Job.status == PENDING, Job.run_at <= now),
+                     db.and_(Job.status == RUNNING, Job.locked_until < now))
+        candidates = db.session.query(Job.id).filter(due)
+        if skip:
+            candidates = candidates.filter(Job.kind.notin_(sorted(skip)))
+        candidates = candidates.order_by(Job.run_at, Job.id).limit(5).all()
+        for (job_id,) in candidates:
+            claimed = Job.query.filter(Job.id == job_id, due).update(
+                {'status': RUNNING, 'locked_until': now + timedelta(seconds=self.lease),
+                 'attempts': Job.attempts + 1}, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return db.session.get(Job, job_id)
+        return None
+
+    def run(self, job):
+        handler = self.handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise LookupError(f'No handler registered for {job.kind!r} jobs')
+            handler(**json.loads(job.payload))
+        except RetryLater as exc:
+            db.session.rollback()
+            job = db.session.get(Job, job.id)
+            job.status = PENDING
+            job.attempts -= 1
+            job.locked_until = None
+            job.run_at = datetime.utcnow() + timedelta(seconds=exc.delay)
+            self._count('deferred')
+            logger.info('Job %s (%s) put off for %.0fs', job.id, job.kind, exc.delay)
+        except Exception as exc:
+            db.session.rollback()
+            job = db.session.get(Job, job.id)
+            job.last_error = f'{type(exc).__name__}: {exc}'
+            job.locked_until = None
+            if job.attempts >= self.max_attempts:
+                job.status = FAILED
+                self._count('failed')
+                logger.exception('Job %s (%s) failed for good after %d attempts', job.id, job.kind, job.attempts)
+            else:
+                delay = self.backoff * 2 ** (job.attempts - 1) * random.uniform(0.8, 1.2)
+                job.status = PENDING
+                job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+                self._count('retried')
+                logger.warning('Job %s (%s) failed, retrying in %.0fs: %s', job.id, job.kind, delay, exc)
+        else:
+            db.session.delete(job)
+            self._count('completed')
+        db.session.commit()
+
+    def run_one(self, skip=()):
+        """Run the next due job, if any. Returns whether one ran."""
+        job = self.claim(skip)
+        if job is None:
+            return False
+        self.run(job)
+        return True
+
+    def work(self, burst=False, web=False):
+        """Process jobs until ``stop()`` is called, or until none are due when ``burst`` is set.
+
+        ``web`` workers run in a web process and leave the ``worker_only`` kinds alone.
+        """
+        skip = self.worker_only if web else ()
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    ran = self.run_one(skip)
+            except Exception:
+                logger.exception('Job worker error')
+                ran = False
+            if not ran:
+                if burst:
+                    return
+                self._stop.wait(self.poll_interval)
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if not self._threads:
+                self._threads = [threading.Thread(target=self.work, kwargs={'web': True}, name=f'jobs-worker-{i}',
+                                                  daemon=True) for i in range(self.workers)]
+                for thread in self._threads:
+                    thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
@@ -0,0 +1,138 @@
+"""Site-wide ratings of every book, kept up to date as shelves change.
+
+``BookAggregate`` holds, per book (by ``catalog_key``), how many rated
+shelves it is on, the sum of its ratings there and how many of those are
+beloved shelves, plus a ``score`` to rank by: the average rating pulled
+towards ``PRIOR_RATING`` as if ``PRIOR_WEIGHT`` more readers had given it
+that, so one reader's 10 does not top the board.
+
+``refresh_shelf`` already rewrites a shelf's ratings in the transaction of
+every change, so it hands the old and new ratings to ``record_shelf_change``,
+which applies the difference with one upsert of relative increments: work
+proportional to the shelf, not to the data, and concurrent changes to the
+same book add up instead of overwriting each other. The leaderboard and a
+book's ratings are then single indexed reads. The migration that adds the
+table fills it from the shelf summaries, and `flask leaderboard-rebuild`
+recomputes everything from them again, for repair.
+"""
+import importlib
+import json
+from collections import namedtuple
+
+from catalog import catalog_key
+from models import db, BookAggregate, CatalogBook, Shelf
+
+# Every book starts out as if PRIOR_WEIGHT readers had rated it PRIOR_RATING
+# (the middle of the tolerated shelf); changing either needs a rebuild
+PRIOR_RATING = 5.75
+PRIOR_WEIGHT = 5
+
+BEST_SHELF = 'beloved'
+INSERT_BATCH = 1000
+
+BookRating = namedtuple('BookRating', 'key title author readers beloved average score')
+
+
+def _score(rating_sum, readers):
+    return (rating_sum + PRIOR_RATING * PRIOR_WEIGHT) / (readers + PRIOR_WEIGHT)
+
+
+def shelf_deltas(sentiment, old_entries, new_entries):
+    """{key: [title, author, rating change, readers change, beloved change]} between two versions of a shelf."""
+    # A book with the same title, author and rating before and after cancels out; skip it before the key lookup
+    unchanged = {(book_id, title, author, rating) for book_id, title, author, _, rating in old_entries} \
+        & {(book_id, title, author, rating) for book_id, title, author, _, rating in new_entries}
+    deltas = {}
+    for entries, sign in ((old_entries, -1), (new_entries, 1)):
+        for book_id, title, author, _, rating in entries:
+            if (book_id, title, author, rating) in unchanged:
+                continue
+            delta = deltas.setdefault(catalog_key(title, author), [title, author, 0, 0, 0])
+            delta[2] += sign * rating
+            delta[3] += sign
+            delta[4] += sign * (sentiment == BEST_SHELF)
+    # Books whose rating did not move need no write; most of them on an edit near the bottom of a shelf
+    return {key: delta for key, delta in deltas.items() if any(delta[3:]) or round(delta[2], 6)}
+
+
+def apply_deltas(deltas):
+    """Add ``shelf_deltas`` output to the aggregates in one statement. The caller commits."""
+    if not deltas:
+        return
+    table = BookAggregate.__table__
+    # SQLite's and Postgres's INSERT ... ON CONFLICT; the dialect module is only imported where it is used
+    statement = importlib.import_module(f'sqlalchemy.dialects.{db.engine.dialect.name}').insert(table)
+    added = statement.excluded
+    statement = statement.on_conflict_do_update(index_elements=[table.c.key], set_={
+        'rating_sum': table.c.rating_sum + added.rating_sum,
+        'readers': table.c.readers + added.readers,
+        'beloved': table.c.beloved + added.beloved,
+        'score': (table.c.rating_sum + added.rating_sum + PRIOR_RATING * PRIOR_WEIGHT)
+        / (table.c.readers + added.readers + PRIOR_WEIGHT),
+    })
+    # Rows in key order, so concurrent changes to the same books lock them in the same order instead of
+    # deadlocking on Postgres
+    db.session.execute(statement, [
+        {'key': key, 'title': title, 'author': author, 'rating_sum': rating_sum, 'readers': readers,
+         'beloved': beloved, 'score': _score(rating_sum, readers)}
+        for key, (title, author, rating_sum, readers, beloved) in sorted(deltas.items())])
+    # Books nobody has on a shelf any more leave the board, and so does a change to a book the aggregates
+    # never counted (missed by a rebuild), which would otherwise be published as a row of bare deltas
+    BookAggregate.query.filter(BookAggregate.key.in_(list(deltas)), BookAggregate.readers <= 0) \
+        .delete(synchronize_session=False)
+
+
+def record_shelf_change(sentiment, old_entries, new_entries):
+    """Called by ``refresh_shelf`` with a shelf's entries before and after a change. The caller commits."""
+    apply_deltas(shelf_deltas(sentiment, old_entries, new_entries))
+
+
+def aggregate_rows(shelves):
+    """``BookAggregate`` rows for every book on ``shelves``, an iterable of (sentiment, entries JSON)."""
+    totals = {}
+    for sentiment, entries in shelves:
+        for key, delta in shelf_deltas(sentiment, [], json.loads(entries)).items():
+            total = totals.get(key)
+            if total is None:
+                totals[key] = delta
+            else:
+                for i in (2, 3, 4):
+                    total[i] += delta[i]
+    return [{'key': key, 'title': title, 'author': author, 'rating_sum': rating_sum, 'readers': readers,
+             'beloved': beloved, 'score': _score(rating_sum, readers)}
+            for key, (title, author, rating_sum, readers, beloved) in totals.items()]
+
+
+def rebuild_aggregates():
+    """Recompute every aggregate from the shelf summaries. Returns the number of books."""
+    # Take the write lock before reading the shelves, so that a change committed during the rebuild
+    # waits and is then applied on top of it instead of being lost
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text('LOCK TABLE book_aggregate IN EXCLUSIVE MODE'))
+    BookAggregate.query.delete()
+    rows = aggregate_rows(db.session.query(Shelf.sentiment, Shelf.entries).yield_per(1000))
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.session.bulk_insert_mappings(BookAggregate, rows[start:start + INSERT_BATCH])
+    db.session.commit()
+    return len(rows)
+
+
+def _rating(row):
+    return BookRating(row.key, row.title, row.author, row.readers, row.beloved,
+                      round(row.rating_sum / max(row.readers, 1), 1), round(row.score, 2))
+
+
+def top_books(limit=50):
+    """The ``limit`` best-scored books, best first."""
+    rows = BookAggregate.query.order_by(BookAggregate.score.desc(), BookAggregate.key.desc()).limit(limit)
+    return [_rating(row) for row in rows]
+
+
+def book_details(catalog_book_id):
+    """(``CatalogBook``, ``BookRating`` or None when it is on nobody's rated shelves), or None for an unknown id."""
+    row = db.session.query(CatalogBook, BookAggregate).outerjoin(BookAggregate, BookAggregate.key == CatalogBook.key) \
+        .filter(CatalogBook.id == catalog_book_id).first()
+    if row is None:
+        return None
+    book, aggregate = row
+    return book, _rating(aggregate) if aggregate is not None else None
@@ -0,0 +1,181 @@
+"""Bulk import and export of a user's library as CSV.
+
+Imports accept our own export, a Goodreads library export or any CSV with
+``title`` and ``author`` columns. The file is streamed twice and never held in
+memory: the first pass only counts books per (shelf, score) so the second can
+give every book its final position as it goes, best score first, after the
+books already on the shelf. Rows are written with ``bulk_insert_mappings`` in
+chunks of ``CHUNK_SIZE``, one transaction per chunk.
+
+Exports stream the shelves in order, ``EXPORT_BATCH`` rows at a time.
+"""
+import csv
+import io
+from collections import Counter, namedtuple
+from functools import partial
+
+from catalog import record_books
+from models import db, Book
+from ordering import GAP
+from shelves import SENTIMENTS, commit_shelf_change, rating_for, refresh_shelf
+
+CHUNK_SIZE = 1000
+EXPORT_BATCH = 1000
+EXPORT_FIELDS = ('title', 'author', 'sentiment', 'rank', 'rating', 'google_books_url')
+
+# Goodreads "My Rating" (0 = read but unrated) -> shelf
+GOODREADS_SENTIMENTS = {5: 'beloved', 4: 'beloved', 3: 'tolerated', 2: 'disliked', 1: 'disliked', 0: 'tolerated'}
+# Goodreads shelves for books that have not been read
+UNREAD_SHELVES = {'to-read', 'currently-reading'}
+
+ImportRow = namedtuple('ImportRow', 'title author sentiment score google_books_url')
+ImportResult = namedtuple('ImportResult', 'imported shelves')
+
+_TITLE_LENGTH = Book.title.type.length
+_AUTHOR_LENGTH = Book.author.type.length
+
+
+class LibraryFormatError(ValueError):
+    pass
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _isbn(value):
+    # Goodreads writes ISBNs as ="0140449264" so spreadsheets keep the leading zeros
+    return (value or '').strip().strip('="')
+
+
+def _goodreads_row(record):
+    if record.get('Exclusive Shelf', 'read').strip() in UNREAD_SHELVES:
+        return None
+    stars = int(_number(record.get('My Rating')))
+    isbn = _isbn(record.get('ISBN13')) or _isbn(record.get('ISBN'))
+    return (record.get('Title'), record.get('Author'), GOODREADS_SENTIMENTS.get(stars, 'tolerated'), stars,
+            f'https://books.google.com/books?vid=ISBN{isbn}' if isbn else None)
+
+
+def _generic_row(record):
+    record = {(name or '').strip().lower(): value for name, value in record.items()}
+    score = _number(record.get('rating'))
+    sentiment = (record.get('sentiment') or '').strip().lower()
+    if sentiment not in SENTIMENTS:
+        # Without a shelf the rating is read as Goodreads-style stars
+        sentiment = GOODREADS_SENTIMENTS.get(round(score), 'tolerated')
+    return record.get('title'), record.get('author'), sentiment, score, record.get('google_books_url') or None
+
+
+def _row_parser(fieldnames):
+    fields = {(name or '').strip().lower() for name in fieldnames or ()}
+    if 'exclusive shelf' in fields or 'my rating' in fields:
+        return _goodreads_row
+    if {'title', 'author'} <= fields:
+        return _generic_row
+    raise LibraryFormatError('The file needs at least "title" and "author" columns.')
+
+
+def read_library(stream):
+    """Yield an ``ImportRow`` for every importable row of a CSV file opened in binary mode.
+
+    Rows without a title or author, and Goodreads books not read yet, are skipped.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    try:
+        parse = _row_parser(reader.fieldnames)
+        for record in reader:
+            row = parse(record)
+            if row is None:
+                continue
+            title, author, sentiment, score, google_books_url = row
+            title, author = (title or '').strip(), (author or '').strip()
+            if title and author:
+                yield ImportRow(title[:_TITLE_LENGTH], author[:_AUTHOR_LENGTH], sentiment, score, google_books_url)
+    except (csv.Error, UnicodeDecodeError) as exc:
+        raise LibraryFormatError(f'Could not read line {reader.line_num}: {exc}') from exc
+    finally:
+        # Leave the caller's stream open so it can be read again
+        text.detach()
+
+
+def _starts(buckets):
+    """Index on its shelf of the first book in each (sentiment, score) bucket, best score first."""
+    starts = {}
+    placed = Counter()
+    for sentiment, score in sorted(buckets, key=lambda bucket: -bucket[1]):
+        starts[sentiment, score] = placed[sentiment]
+        placed[sentiment] += buckets[sentiment, score]
+    return starts
+
+
+def _write(chunk):
+    db.session.bulk_insert_mappings(Book, chunk)
+    record_books((book['title'], book['author'], book['google_books_url']) for book in chunk)
+    db.session.commit()
+
+
+def import_library(user_id, stream, chunk_size=CHUNK_SIZE):
+    """Import a seekable binary CSV stream into the user's shelves. Returns an ``ImportResult``.
+
+    The first pass reads the whole file, so a malformed or mis-encoded file
+    fails before anything is written.
+    """
+    start = stream.tell()
+    buckets = Counter((row.sentiment, row.score) for row in read_library(stream))
+    if not buckets:
+        return ImportResult(0, {})
+    next_index = _starts(buckets)
+
+    # New books go below whatever is already on each shelf
+    bases = dict(db.session.query(Book.sentiment, db.func.max(Book.position))
+                 .filter(Book.user_id == user_id).group_by(Book.sentiment).all())
+
+    stream.seek(start)
+    imported = 0
+    chunk = []
+    for row in read_library(stream):
+        index = next_index[row.sentiment, row.score]
+        next_index[row.sentiment, row.score] += 1
+        chunk.append({'title': row.title, 'author': row.author, 'sentiment': row.sentiment, 'user_id': user_id,
+                      'position': (bases.get(row.sentiment) or 0) + GAP * (index + 1),
+                      'google_books_url': row.google_books_url})
+        if len(chunk) >= chunk_size:
+            _write(chunk)
+            imported += len(chunk)
+            chunk = []
+    if chunk:
+        _write(chunk)
+        imported += len(chunk)
+
+    shelves = Counter()
+    for (sentiment, _), count in buckets.items():
+        shelves[sentiment] += count
+    for sentiment in shelves:
+        commit_shelf_change(partial(refresh_shelf, user_id, sentiment))
+    return ImportResult(imported, dict(shelves))
+
+
+def export_library(user_id):
+    """Yield the user's library as CSV text, one shelf after another, best book first."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for sentiment in SENTIMENTS:
+        total = db.session.query(db.func.count(Book.id)) \
+            .filter(Book.user_id == user_id, Book.sentiment == sentiment).scalar()
+        rows = db.session.query(Book.title, Book.author, Book.google_books_url) \
+            .filter(Book.user_id == user_id, Book.sentiment == sentiment) \
+            .order_by(Book.position, Book.id).yield_per(EXPORT_BATCH)
+        for index, (title, author, google_books_url) in enumerate(rows):
+            writer.writerow((title, author, sentiment, index + 1, rating_for(sentiment, index, total),
+                             google_books_url or ''))
+            if (index + 1) % EXPORT_BATCH == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    yield buffer.getvalue()
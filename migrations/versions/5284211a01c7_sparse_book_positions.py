@@ -0,0 +1,43 @@
+"""Spread book positions GAP apart for single-row reordering
+
+Revision ID: 5284211a01c7
+Revises: 86dbe538e422
+Create Date: 2026-10-18 11:02:47.530912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5284211a01c7'
+down_revision = '86dbe538e422'
+branch_labels = None
+depends_on = None
+
+GAP = 1024
+
+
+def _renumber(spacing):
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        "SELECT id, user_id, sentiment FROM book ORDER BY user_id, sentiment, position, id"
+    )).fetchall()
+
+    updates = []
+    shelf, index = None, 0
+    for book_id, user_id, sentiment in rows:
+        if (user_id, sentiment) != shelf:
+            shelf, index = (user_id, sentiment), 0
+        index += 1
+        updates.append({'book_id': book_id, 'position': index * spacing})
+    if updates:
+        bind.execute(sa.text("UPDATE book SET position = :position WHERE id = :book_id"), updates)
+
+
+def upgrade():
+    _renumber(GAP)
+
+
+def downgrade():
+    _renumber(1)
@@ -0,0 +1,91 @@
+"""Adding local book catalog with full-text index
+
+Revision ID: 86dbe538e422
+Revises: af93dc82f6cf
+Create Date: 2026-10-18 10:12:31.118240
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '86dbe538e422'
+down_revision = 'af93dc82f6cf'
+branch_labels = None
+depends_on = None
+
+# The full-text index and catalog key as of this revision; models.py and
+# catalog.py may move on, this migration must not.
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_book_fts USING fts5("
+    "title, author, content='catalog_book', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS catalog_book_ai AFTER INSERT ON catalog_book BEGIN "
+    "INSERT INTO catalog_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "CREATE TRIGGER IF NOT EXISTS catalog_book_ad AFTER DELETE ON catalog_book BEGIN "
+    "INSERT INTO catalog_book_fts(catalog_book_fts, rowid, title, author) "
+    "VALUES ('delete', old.id, old.title, old.author); END",
+    "CREATE TRIGGER IF NOT EXISTS catalog_book_au AFTER UPDATE OF title, author ON catalog_book BEGIN "
+    "INSERT INTO catalog_book_fts(catalog_book_fts, rowid, title, author) "
+    "VALUES ('delete', old.id, old.title, old.author); "
+    "INSERT INTO catalog_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+]
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_catalog_book_search_trgm ON catalog_book USING gin (search_text gin_trgm_ops)",
+]
+
+_NON_WORD = re.compile(r'[^\w\s]')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _normalize(value):
+    return _WHITESPACE.sub(' ', _NON_WORD.sub(' ', (value or '').lower())).strip()
+
+
+def catalog_key(title, author):
+    return f'{_normalize(title)}|{_normalize(author)}'
+
+
+def upgrade():
+    op.create_table('catalog_book',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.String(length=320), nullable=False),
+    sa.Column('title', sa.String(length=200), nullable=False),
+    sa.Column('author', sa.String(length=100), nullable=False),
+    sa.Column('google_books_url', sa.Text(), nullable=True),
+    sa.Column('search_text', sa.Text(), nullable=False),
+    sa.Column('times_added', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('key')
+    )
+
+    dialect = op.get_bind().dialect.name
+    statements = {'sqlite': SQLITE_DDL, 'postgresql': POSTGRES_DDL}.get(dialect, [])
+    for statement in statements:
+        op.execute(statement)
+
+    # Seed the catalog from the books users have already added.
+    bind = op.get_bind()
+    entries = {}
+    for title, author, google_books_url in bind.execute(sa.text("SELECT title, author, google_books_url FROM book")):
+        entry = entries.setdefault(catalog_key(title, author), {
+            'key': catalog_key(title, author), 'title': title, 'author': author, 'google_books_url': None,
+            'search_text': catalog_key(title, author).replace('|', ' '), 'times_added': 0,
+        })
+        entry['google_books_url'] = entry['google_books_url'] or google_books_url
+        entry['times_added'] += 1
+    if entries:
+        catalog_book = sa.table('catalog_book', *[sa.column(name) for name in
+                                                  ('key', 'title', 'author', 'google_books_url',
+                                                   'search_text', 'times_added')])
+        op.bulk_insert(catalog_book, list(entries.values()))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS catalog_book_fts")
+    op.drop_table('catalog_book')
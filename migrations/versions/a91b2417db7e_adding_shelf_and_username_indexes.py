@@ -0,0 +1,42 @@
+"""Adding shelf and username indexes
+
+Revision ID: a91b2417db7e
+Revises: 9024ed3db35f
+Create Date: 2026-10-18 12:20:14.660182
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a91b2417db7e'
+down_revision = '9024ed3db35f'
+branch_labels = None
+depends_on = None
+
+# Substring search on usernames, as of this revision (models.USER_POSTGRES_DDL may move on)
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    'CREATE INDEX IF NOT EXISTS ix_user_username_trgm ON "user" USING gin (lower(username) gin_trgm_ops)',
+]
+
+
+def upgrade():
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.create_index('ix_book_user_sentiment_position', ['user_id', 'sentiment', 'position'],
+                              unique=False, postgresql_include=['title', 'author', 'google_books_url'])
+
+    op.create_index('ix_user_username_lower', 'user', [sa.text('lower(username)')], unique=False)
+    if op.get_bind().dialect.name == 'postgresql':
+        for statement in POSTGRES_DDL:
+            op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_user_username_trgm')
+    op.drop_index('ix_user_username_lower', table_name='user')
+
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.drop_index('ix_book_user_sentiment_position')
@@ -0,0 +1,46 @@
+"""Rewriting profile images to local avatars
+
+Revision ID: c41f8a9e2d17
+Revises: 3b6e0d52c7a4
+Create Date: 2026-10-18 15:41:09.552130
+
+"""
+from urllib.parse import quote
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41f8a9e2d17'
+down_revision = '3b6e0d52c7a4'
+branch_labels = None
+depends_on = None
+
+DICEBEAR_PREFIX = 'https://api.dicebear.com/6.x/initials/svg?seed='
+
+user = sa.table('user', sa.column('id', sa.Integer), sa.column('username', sa.String),
+                sa.column('profile_image', sa.Text))
+
+
+def avatar_path(username):
+    """avatars.avatar_path as it was when the avatars moved in-app."""
+    return f"/avatar/{quote(username, safe='')}.svg"
+
+
+def _rewrite(matches, new_value):
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(user.c.id, user.c.username, user.c.profile_image)).fetchall()
+    for user_id, username, profile_image in rows:
+        if matches(profile_image or '', username):
+            connection.execute(user.update().where(user.c.id == user_id).values(profile_image=new_value(username)))
+
+
+def upgrade():
+    _rewrite(lambda image, username: image.startswith(DICEBEAR_PREFIX),
+             avatar_path)
+
+
+def downgrade():
+    _rewrite(lambda image, username: image == avatar_path(username),
+             lambda username: DICEBEAR_PREFIX + username)
@@ -0,0 +1,241 @@
+from flask_login import UserMixin
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+
+from passwords import hasher
+
+db = SQLAlchemy()
+
+
+class User(UserMixin, db.Model):
+    __table_args__ = (
+        # Prefix search on usernames: lower(username) >= :q AND lower(username) < :q_end
+        db.Index('ix_user_username_lower', db.func.lower(db.text('username'))),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password_hash = db.Column(db.Text)
+    profile_image = db.Column(db.Text)
+    # Part of the session cookie's user id; bumping it logs the user out everywhere (see identity.py)
+    session_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Set once the user has more followers than FEED_FANOUT_LIMIT: their activity is then read by each
+    # follower's feed instead of being copied into every follower's timeline (see feed.py)
+    fan_out_on_read = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    books = db.relationship('Book', backref='user', lazy=True)
+
+    def get_id(self):
+        return f'{self.id}:{self.session_version or 0}'
+
+    def set_password(self, password):
+        if self.password_hash is not None:
+            # A new password ends the sessions made with the old one
+            self.session_version = (self.session_version or 0) + 1
+        self.password_hash = hasher.hash(password)
+
+    def check_password(self, password):
+        """Whether ``password`` is right.
+
+        A right password stored under an old cost policy is hashed again under
+        the current one; the caller commits.
+        """
+        if not hasher.verify(self.password_hash, password):
+            return False
+        if hasher.needs_rehash(self.password_hash):
+            # Same password, so the sessions made with it stay valid
+            self.password_hash = hasher.hash(password)
+        return True
+
+    def _shelf_books(self, sentiment):
+        return Book.query.filter_by(user_id=self.id, sentiment=sentiment).order_by(Book.position).all()
+
+    @property
+    def beloved_books(self):
+        return self._shelf_books('beloved')
+
+    @property
+    def tolerated_books(self):
+        return self._shelf_books('tolerated')
+
+    @property
+    def disliked_books(self):
+        return self._shelf_books('disliked')
+
+
+class Book(db.Model):
+    __table_args__ = (
+        # Every shelf read and write filters on user and sentiment and orders by position;
+        # on Postgres the index also carries the displayed columns for index-only scans.
+        db.Index('ix_book_user_sentiment_position', 'user_id', 'sentiment', 'position',
+                 postgresql_include=['title', 'author', 'google_books_url']),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    author = db.Column(db.String(100), nullable=False)
+    sentiment = db.Column(db.String(20), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    google_books_url = db.Column(db.Text, nullable=True)  # New field for Google Books URL
+
+
+class Shelf(db.Model):
+    """Materialized view of one of a user's shelves: its books in order with their ratings.
+
+    ``entries`` is a JSON list of [id, title, author, google_books_url, rating];
+    ``version`` goes up every time the shelf changes.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    sentiment = db.Column(db.String(20), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    book_count = db.Column(db.Integer, nullable=False, default=0)
+    entries = db.Column(db.Text, nullable=False, default='[]')
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+
+class CatalogBook(db.Model):
+    """One row per distinct book any user has added, keyed by normalized title/author."""
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(320), unique=True, nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    author = db.Column(db.String(100), nullable=False)
+    google_books_url = db.Column(db.Text, nullable=True)
+    search_text = db.Column(db.Text, nullable=False)
+    times_added = db.Column(db.Integer, nullable=False, default=0)
+    # Filled in the background from Google Books by the enrich_book job
+    isbn = db.Column(db.String(13), nullable=True)
+    cover_url = db.Column(db.Text, nullable=True)
+    canonical_author = db.Column(db.String(200), nullable=True)
+    enriched_at = db.Column(db.DateTime, nullable=True)
+
+
+class BookSimilarity(db.Model):
+    """The books most like one catalog book, as of the last `flask recommendations-build`.
+
+    ``neighbors`` is a JSON list of [catalog_book_id, similarity], most similar first.
+    """
+    catalog_book_id = db.Column(db.Integer, db.ForeignKey('catalog_book.id'), primary_key=True)
+    neighbors = db.Column(db.Text, nullable=False)
+    built_at = db.Column(db.DateTime, nullable=False)
+
+
+class BookAggregate(db.Model):
+    """Ratings of one book across every user's rated shelves, kept up to date by leaderboard.py."""
+    __table_args__ = (
+        # The leaderboard reads this index backwards, best first
+        db.Index('ix_book_aggregate_score', 'score', 'key'),
+    )
+
+    key = db.Column(db.String(320), primary_key=True)  # catalog_key(title, author)
+    title = db.Column(db.String(200), nullable=False)
+    author = db.Column(db.String(100), nullable=False)
+    readers = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Float, nullable=False, default=0)
+    beloved = db.Column(db.Integer, nullable=False, default=0)
+    score = db.Column(db.Float, nullable=False)
+
+
+class Follow(db.Model):
+    """``follower_id`` sees what ``followee_id`` does in their feed."""
+    __table_args__ = (
+        # Fan-out reads a user's followers
+        db.Index('ix_follow_followee', 'followee_id', 'follower_id'),
+    )
+
+    follower_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    followee_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+
+class Activity(db.Model):
+    """Something a user did that shows up in their followers' feeds, such as ranking a book.
+
+    ``fanned_out`` is set once it has been copied into the followers' timelines.
+    """
+    __table_args__ = (
+        # Feeds read the newest activity that was not fanned out of each followed user, and
+        # following someone copies their newest activity that was
+        db.Index('ix_activity_actor', 'actor_id', 'fanned_out', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    actor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    verb = db.Column(db.String(20), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    author = db.Column(db.String(100), nullable=False)
+    sentiment = db.Column(db.String(20), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    fanned_out = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+
+class TimelineEntry(db.Model):
+    """An activity copied into one follower's feed; each user keeps about FEED_TIMELINE_SIZE of them."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id'), primary_key=True)
+    actor_id = db.Column(db.Integer, nullable=False)  # so unfollowing can drop the entries without a join
+
+
+# Substring matches on usernames need a trigram index; Postgres only.
+USER_POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    'CREATE INDEX IF NOT EXISTS ix_user_username_trgm ON "user" USING gin (lower(username) gin_trgm_ops)',
+]
+
+for _statement in USER_POSTGRES_DDL:
+    event.listen(User.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+
+
+# Full-text index over the catalog: an external-content FTS5 table kept in
+# sync by triggers on SQLite, a trigram index on Postgres. The migration that
+# introduces the catalog issues its own copy of these statements.
+CATALOG_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_book_fts USING fts5("
+    "title, author, content='catalog_book', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS catalog_book_ai AFTER INSERT ON catalog_book BEGIN "
+    "INSERT INTO catalog_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "CREATE TRIGGER IF NOT EXISTS catalog_book_ad AFTER DELETE ON catalog_book BEGIN "
+    "INSERT INTO catalog_book_fts(catalog_book_fts, rowid, title, author) "
+    "VALUES ('delete', old.id, old.title, old.author); END",
+    "CREATE TRIGGER IF NOT EXISTS catalog_book_au AFTER UPDATE OF title, author ON catalog_book BEGIN "
+    "INSERT INTO catalog_book_fts(catalog_book_fts, rowid, title, author) "
+    "VALUES ('delete', old.id, old.title, old.author); "
+    "INSERT INTO catalog_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+]
+
+CATALOG_POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_catalog_book_search_trgm ON catalog_book USING gin (search_text gin_trgm_ops)",
+]
+
+for _statement in CATALOG_SQLITE_DDL:
+    event.listen(CatalogBook.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+for _statement in CATALOG_POSTGRES_DDL:
+    event.listen(CatalogBook.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+event.listen(CatalogBook.__table__, 'before_drop',
+             DDL("DROP TABLE IF EXISTS catalog_book_fts").execute_if(dialect='sqlite'))
+
+
+class RankingSession(db.Model):
+    """Server-side state of an in-progress ranking, for the database ranking store."""
+    token = db.Column(db.String(64), primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class Job(db.Model):
+    """A unit of deferred work for the background job queue (see jobs.py)."""
+    __table_args__ = (
+        # Workers claim the oldest due job of a given status
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,125 @@
+"""Sparse position keys for books on a shelf.
+
+Positions are spaced ``GAP`` apart instead of being dense 1..n ranks. Placing
+a book between two neighbours takes the midpoint of their keys, so inserting,
+reranking or deleting a book writes only that book's row. Only when a gap is
+exhausted (after about log2(GAP) placements into the same spot) is the whole
+shelf respaced, in one bulk update.
+"""
+from models import db, Book
+
+GAP = 1024
+
+
+def key_between(before, after):
+    """A position strictly between ``before`` and ``after`` (None = end of shelf), or None if there is no room."""
+    if before is None and after is None:
+        return GAP
+    if before is None:
+        return after - GAP
+    if after is None:
+        return before + GAP
+    if after - before < 2:
+        return None
+    return (before + after) // 2
+
+
+def keys_between(before, after, count):
+    """``count`` evenly spread positions between two neighbours, or None if there is no room."""
+    if before is None and after is None:
+        before = 0
+    if before is None:
+        before = after - GAP * (count + 1)
+    if after is None:
+        after = before + GAP * (count + 1)
+    step = (after - before) // (count + 1)
+    if step < 1:
+        return None
+    return [before + step * (i + 1) for i in range(count)]
+
+
+def merge_positions(shelf, new_ids, placements):
+    """Position updates that slot ``new_ids`` into an ordered shelf.
+
+    ``shelf`` is the existing shelf as ordered (id, position) pairs and
+    ``placements[i]`` the index in it before which ``new_ids[i]`` goes;
+    placements are non-decreasing. Existing books keep their positions
+    unless some gap is too narrow, in which case the merged shelf is
+    respaced. Returns mappings for ``bulk_update_mappings``.
+    """
+    gaps = {}
+    for book_id, placement in zip(new_ids, placements):
+        gaps.setdefault(placement, []).append(book_id)
+
+    mappings = []
+    for placement, book_ids in gaps.items():
+        before = shelf[placement - 1][1] if placement > 0 else None
+        after = shelf[placement][1] if placement < len(shelf) else None
+        positions = keys_between(before, after, len(book_ids))
+        if positions is None:
+            break
+        mappings += [{'id': book_id, 'position': position} for book_id, position in zip(book_ids, positions)]
+    else:
+        return mappings
+
+    merged = []
+    for index, (book_id, _) in enumerate(shelf):
+        merged += gaps.get(index, [])
+        merged.append(book_id)
+    merged += gaps.get(len(shelf), [])
+    return [{'id': book_id, 'position': (index + 1) * GAP} for index, book_id in enumerate(merged)]
+
+
+def _shelf(book):
+    return db.session.query(Book.position).filter(Book.user_id == book.user_id,
+                                                  Book.sentiment == book.sentiment,
+                                                  Book.id != book.id)
+
+
+def _neighbours(book, anchor, above):
+    """Positions of the free slot directly above or below ``anchor``, ignoring ``book`` itself."""
+    if above:
+        lower = _shelf(book).filter(Book.position < anchor.position).order_by(Book.position.desc()).first()
+        return (lower[0] if lower else None), anchor.position
+    upper = _shelf(book).filter(Book.position > anchor.position).order_by(Book.position).first()
+    return anchor.position, (upper[0] if upper else None)
+
+
+def rebalance(user_id, sentiment):
+    """Respace a whole shelf ``GAP`` apart, keeping its order. The caller commits."""
+    db.session.flush()
+    rows = db.session.query(Book.id).filter_by(user_id=user_id, sentiment=sentiment) \
+        .order_by(Book.position, Book.id).all()
+    db.session.bulk_update_mappings(Book, [{'id': book_id, 'position': (index + 1) * GAP}
+                                           for index, (book_id,) in enumerate(rows)])
+    db.session.expire_all()
+
+
+def place_book(book, anchor, above):
+    """Move ``book`` directly above (better than) or below ``anchor`` on its shelf.
+
+    Returns False when the book already sits there. The caller commits.
+    """
+    before, after = _neighbours(book, anchor, above)
+    if (before is None or before < book.position) and (after is None or book.position < after):
+        return False
+
+    position = key_between(before, after)
+    if position is None:
+        rebalance(book.user_id, book.sentiment)
+        before, after = _neighbours(book, anchor, above)
+        position = key_between(before, after)
+    book.position = position
+    return True
+
+
+def prepend_position(user_id, sentiment):
+    """Position for a book placed above everything on the shelf."""
+    first = db.session.query(db.func.min(Book.position)).filter_by(user_id=user_id, sentiment=sentiment).scalar()
+    return key_between(None, first)
+
+
+def append_position(user_id, sentiment):
+    """Position for a book placed below everything on the shelf."""
+    last = db.session.query(db.func.max(Book.position)).filter_by(user_id=user_id, sentiment=sentiment).scalar()
+    return key_between(last, None)
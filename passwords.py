@@ -0,0 +1,104 @@
+"""Password hashing off the request threads, with a bounded queue.
+
+Hashing is meant to be slow, so a burst of logins or registrations could
+otherwise take every web thread and stall ordinary page loads behind it.
+``hasher`` runs it in a small process pool of its own
+(``PASSWORD_HASH_WORKERS`` per web process; 0 hashes in the request thread).
+At most ``PASSWORD_HASH_MAX_PENDING`` hashes are in flight or queued. A
+request that cannot get a slot within ``PASSWORD_HASH_WAIT`` seconds gets
+``HashingBusy``, which the views answer with a quick 503 and ``Retry-After``,
+so a login storm gets slower logins rather than a stalled site. Code that
+runs in multiprocessing workers of its own should hash inline instead, since
+multiprocessing waits for a worker's child processes before letting it exit.
+
+``PASSWORD_HASH_METHOD`` is the cost policy, in Werkzeug's
+``generate_password_hash`` format. A stored hash made under another policy
+still verifies, and is redone under the current one at the next successful
+login (see ``User.check_password``).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    """Too many passwords are being hashed in this process to take another one now."""
+
+
+def normalize_method(method):
+    """``method`` with Werkzeug's defaults filled in, as it is written at the start of a stored hash."""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        return ':'.join([name, *args] + ['32768', '8', '1'][len(args):])
+    if name == 'pbkdf2':
+        return ':'.join([name, *args] + ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)][len(args):])
+    return method
+
+
+class PasswordHasher:
+    def __init__(self, app=None, method='scrypt', workers=0, max_pending=4, wait=2.0):
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', self.method)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', self.workers)
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        app.config.setdefault('PASSWORD_HASH_WAIT', self.wait)
+        self.method = normalize_method(app.config['PASSWORD_HASH_METHOD'])
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.max_pending = app.config['PASSWORD_HASH_MAX_PENDING']
+        self.wait = app.config['PASSWORD_HASH_WAIT']
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    @property
+    def pool(self):
+        # Created on first use in each process: a pool built in the gunicorn
+        # master would not survive the fork into the workers
+        if self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool_pid != os.getpid():
+                    # Spawned, not forked: a forked child would hold copies of the worker's client
+                    # sockets, keeping connections the server has closed open from the client's side
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(timeout=self.wait):
+            raise HashingBusy()
+        try:
+            if not self.workers:
+                return function(*args)
+            return self.pool.submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Whether ``password_hash`` was made under a different cost policy than the current one."""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown()
+        self._pool = self._pool_pid = None
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,75 @@
+"""Conditional GET and per-shelf fragment caching for profile pages.
+
+A profile page is fully determined by the versions of the user's three
+shelves and the times they last changed, who is looking at it (and whether
+they follow the user) and the templates themselves, so those make up its
+ETag. A repeat view whose ``If-None-Match`` still matches is answered 304
+after one small query for the shelf versions.
+
+When the page does have to be rendered, each shelf section is looked up in an
+in-process LRU keyed by the shelf's version and change time, so the sections
+that did not change are reused as-is. Anything that changes a shelf bumps its
+version through ``refresh_shelf``, or for a book's new link just its change
+time through ``update_entry_link``, which is what invalidates both layers.
+"""
+import hashlib
+
+from flask import current_app, make_response, render_template
+from markupsafe import Markup
+
+from cache import TTLCache
+from shelves import read_shelf
+
+TEMPLATES = ('layout.html', 'profile.html', '_shelf_section.html')
+
+
+class ProfileCache:
+    def __init__(self, maxsize=256, ttl=3600):
+        self._fragments = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._templates_digest = None
+
+    def clear(self):
+        self._fragments.clear()
+
+    def templates_digest(self):
+        """Digest of the profile templates, so a deploy that changes them also changes every ETag."""
+        if self._templates_digest is None:
+            digest = hashlib.sha1()
+            for name in TEMPLATES:
+                source, _, _ = current_app.jinja_loader.get_source(current_app.jinja_env, name)
+                digest.update(source.encode())
+            self._templates_digest = digest.hexdigest()[:12]
+        return self._templates_digest
+
+    def etag(self, user_id, states, viewer_id, following=False):
+        versions = ','.join(f'{sentiment}={state.version}@{state.updated_at.isoformat()}'
+                            for sentiment, state in sorted(states.items()))
+        key = f'{self.templates_digest()}|{user_id}|{versions}|{viewer_id}|{int(following)}'
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def section(self, user_id, sentiment, state, start, is_own_profile):
+        """(rendered section, its first entry or None) for one shelf, from the cache when possible."""
+        key = (user_id, sentiment, state.version if state else 0, state.updated_at if state else None, start,
+               is_own_profile)
+        cached = self._fragments.get(key)
+        if cached is None:
+            books = read_shelf(user_id, sentiment, start) if state else []
+            html = Markup(render_template('_shelf_section.html', sentiment=sentiment, books=books,
+                                          is_own_profile=is_own_profile))
+            cached = (html, books[0] if books else None)
+            self._fragments.set(key, cached)
+        return cached
+
+
+def set_validators(response, etag, last_modified):
+    """Profiles are private and must be revalidated on every view."""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag, last_modified):
+    return set_validators(make_response('', 304), etag, last_modified)
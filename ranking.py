@@ -0,0 +1,352 @@
+"""Server-side state for the compare-two-books ranking flows.
+
+Rating a new book and reranking an existing one are both a search over the
+rest of the shelf, probing the books a strategy from comparison.py picks.
+Instead of round-tripping the list of candidate ids through the signed
+session cookie, the cookie only carries a token; the search itself is kept
+server-side as the shelf version it started from plus the ``lo``/``hi``
+bounds, and each step fetches just the one book it needs.
+
+``DatabaseRankingStore``, the default, lets any worker pick up the next
+step; its writes are flushed with the rest of the step and committed by the
+view. ``MemoryRankingStore`` keeps states in a per-process LRU, which only
+works with a single worker.
+"""
+import json
+import secrets
+from datetime import datetime, timedelta
+
+from flask import session
+
+from cache import TTLCache
+from comparison import get_strategy
+from models import db, Book, RankingSession, Shelf
+from ordering import merge_positions
+from shelves import ShelfConflict, refresh_shelf, shelf_version
+
+SESSION_KEY = 'ranking_token'
+
+
+class MemoryRankingStore:
+    def __init__(self, ttl=3600, maxsize=10000):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, token):
+        state = self._cache.get(token)
+        return dict(state) if state is not None else None
+
+    def put(self, token, state):
+        self._cache.set(token, dict(state))
+
+    def delete(self, token):
+        self._cache.pop(token)
+
+
+class DatabaseRankingStore:
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+
+    def get(self, token):
+        row = db.session.get(RankingSession, token)
+        if row is None or row.expires_at <= datetime.utcnow():
+            return None
+        return json.loads(row.payload)
+
+    def put(self, token, state):
+        now = datetime.utcnow()
+        RankingSession.query.filter(RankingSession.expires_at <= now).delete()
+        db.session.merge(RankingSession(token=token, payload=json.dumps(state),
+                                        expires_at=now + timedelta(seconds=self.ttl)))
+        db.session.flush()
+
+    def delete(self, token):
+        RankingSession.query.filter_by(token=token).delete()
+
+
+def make_store(backend, ttl):
+    if backend == 'database':
+        return DatabaseRankingStore(ttl=ttl)
+    if backend == 'memory':
+        return MemoryRankingStore(ttl=ttl)
+    raise ValueError(f'Unknown ranking store backend: {backend!r}')
+
+
+def _others(book):
+    return Book.query.filter(Book.user_id == book.user_id, Book.sentiment == book.sentiment, Book.id != book.id)
+
+
+def book_at(book, index):
+    """The book at ``index`` on ``book``'s shelf, not counting ``book`` itself."""
+    return _others(book).order_by(Book.position, Book.id).offset(index).limit(1).first()
+
+
+def _shelf_authors(book):
+    """(id, author) for the rest of ``book``'s shelf in order, read from the shelf summary."""
+    entries = db.session.query(Shelf.entries).filter_by(user_id=book.user_id, sentiment=book.sentiment).scalar()
+    return [(entry[0], entry[2]) for entry in json.loads(entries or '[]') if entry[0] != book.id]
+
+
+def probe_index(state):
+    return (state['lo'] + state['hi']) // 2
+
+
+class Ranking:
+    """One ranking of ``book`` against the rest of its shelf, probing as its strategy directs.
+
+    The search ends once the book's spot is known to within ``tolerance``
+    places; it then goes in the middle of what is left.
+    """
+
+    def __init__(self, store, token, state):
+        self.store = store
+        self.token = token
+        self.state = state
+
+    @classmethod
+    def start(cls, store, book, mode, strategy='binary', tolerance=0):
+        """Begin ranking ``book``; returns None when there is nothing to compare it with."""
+        ranking = cls(store, secrets.token_urlsafe(24), {'mode': mode, 'book_id': book.id,
+                                                         'strategy': get_strategy(strategy).name,
+                                                         'tolerance': tolerance})
+        ranking.compared_book = ranking.restart(book)
+        if not ranking.state['size']:
+            return None
+        session[SESSION_KEY] = ranking.token
+        return ranking
+
+    @classmethod
+    def resume(cls, store, mode):
+        token = session.get(SESSION_KEY)
+        state = store.get(token) if token else None
+        if state is None or state['mode'] != mode:
+            return None
+        if 'strategy' not in state:
+            # Started before strategies existed: carry on bisecting
+            state.update(strategy='binary', tolerance=0, size=state['hi'], next=probe_index(state))
+        return cls(store, token, state)
+
+    @property
+    def strategy(self):
+        return get_strategy(self.state['strategy'])
+
+    @property
+    def done(self):
+        state = self.state
+        # However wide the band, ask at least once
+        return state['hi'] - state['lo'] <= min(state['tolerance'], max(state['size'] - 1, 0))
+
+    def restart(self, book):
+        """Start the search over, e.g. because the shelf changed underneath it.
+
+        The version is read before the shelf, so a change committed in between
+        makes the final ``refresh_shelf`` fail rather than go unnoticed.
+        """
+        self.state['version'] = shelf_version(book.user_id, book.sentiment)
+        self.state['lo'] = 0
+        self.state['hi'] = self.state['size'] = _others(book).count()
+        self.strategy.begin(self.state, lambda: _shelf_authors(book), book)
+        return self.probe(book)
+
+    def is_stale(self, book):
+        return shelf_version(book.user_id, book.sentiment) != self.state['version']
+
+    def probe(self, book):
+        """Book to compare against next; its id is remembered so replayed forms can be spotted."""
+        if self.done:
+            return None
+        compared_book = book_at(book, self.state['next'])
+        self.state['probe_id'] = compared_book.id
+        self.store.put(self.token, self.state)
+        return compared_book
+
+    def current_probe(self):
+        return db.session.get(Book, self.state['probe_id'])
+
+    def record(self, preferred):
+        """Narrow the search after a comparison. Returns True once the position is found."""
+        self.strategy.record(self.state, preferred)
+        return self.done
+
+    def placement(self, book):
+        """(anchor, above) for ``place_book`` once the search is done.
+
+        Pass ``self.state['version']`` to ``refresh_shelf`` with it: the spot
+        is only right for the shelf as it was compared against.
+        """
+        index = probe_index(self.state)
+        anchor = book_at(book, index)
+        if anchor is None:
+            return book_at(book, index - 1), False
+        return anchor, True
+
+    def finish(self):
+        self.store.delete(self.token)
+        session.pop(SESSION_KEY, None)
+
+
+class BatchRanking:
+    """Ranks several new books for one shelf in a single guided pass.
+
+    The new books are first sorted among themselves by binary insertion, then
+    merged into the shelf best-first: since every later book ranks at or
+    below the previous one, each binary search over the shelf starts where
+    the previous book landed. All final positions are written in one bulk
+    update, instead of one insert-and-renumber per book.
+    """
+
+    MODE = 'batch'
+
+    def __init__(self, store, token, state):
+        self.store = store
+        self.token = token
+        self.state = state
+
+    @classmethod
+    def start(cls, store, books):
+        first = books[0]
+        ranking = cls(store, secrets.token_urlsafe(24), {
+            'mode': cls.MODE,
+            'user_id': first.user_id,
+            'sentiment': first.sentiment,
+            'book_ids': [book.id for book in books],
+            'phase': 'sort',
+            'sorted': [first.id],
+            'pending': [book.id for book in books[1:]],
+            'placements': [],
+            'lo': 0,
+            'hi': 1,
+            'version': shelf_version(first.user_id, first.sentiment),
+        })
+        if not ranking.state['pending']:
+            ranking._begin_merge()
+        ranking._settle()
+        session[SESSION_KEY] = ranking.token
+        return ranking
+
+    @classmethod
+    def resume(cls, store):
+        token = session.get(SESSION_KEY)
+        state = store.get(token) if token else None
+        if state is None or state['mode'] != cls.MODE:
+            return None
+        return cls(store, token, state)
+
+    @property
+    def done(self):
+        return self.state['phase'] == 'merge' and len(self.state['placements']) == len(self.state['sorted'])
+
+    @property
+    def progress(self):
+        """(books placed so far, books in the batch)."""
+        state = self.state
+        placed = len(state['placements']) if state['phase'] == 'merge' else 0
+        return placed, len(state['book_ids'])
+
+    def _shelf(self):
+        return db.session.query(Book.id, Book.position).filter(
+            Book.user_id == self.state['user_id'],
+            Book.sentiment == self.state['sentiment'],
+            Book.id.notin_(self.state['book_ids']),
+        ).order_by(Book.position, Book.id)
+
+    def _begin_merge(self):
+        state = self.state
+        state['phase'] = 'merge'
+        state['placements'] = []
+        state['version'] = shelf_version(state['user_id'], state['sentiment'])
+        state['lo'] = 0
+        state['hi'] = state['size'] = self._shelf().count()
+
+    def _settle(self):
+        """Record every placement that needs no question, then save the state."""
+        state = self.state
+        while state['phase'] == 'merge' and not self.done and state['lo'] >= state['hi']:
+            state['placements'].append(state['lo'])
+        self.store.put(self.token, state)
+
+    def refresh(self):
+        """Catch up with changes made to the shelf since the last question was asked.
+
+        Batch books deleted meanwhile are dropped, and a merge whose shelf
+        changed starts over. Returns True if the question to ask changed.
+        """
+        state = self.state
+        kept = {book_id for book_id, in db.session.query(Book.id).filter(Book.id.in_(state['book_ids']))}
+        changed = len(kept) < len(state['book_ids'])
+        if changed:
+            state['book_ids'] = [book_id for book_id in state['book_ids'] if book_id in kept]
+            state['sorted'] = [book_id for book_id in state['sorted'] if book_id in kept]
+            if state['phase'] == 'sort':
+                # The books sorted so far are still in order; search for the next one's spot afresh
+                state['pending'] = [book_id for book_id in state['pending'] if book_id in kept]
+                if not state['sorted'] and state['pending']:
+                    state['sorted'].append(state['pending'].pop(0))
+                state['lo'], state['hi'] = 0, len(state['sorted'])
+                if not state['pending']:
+                    self._begin_merge()
+        if state['phase'] == 'merge' and (changed or shelf_version(state['user_id'], state['sentiment'])
+                                          != state['version']):
+            self._begin_merge()
+            changed = True
+        if changed:
+            self._settle()
+        return changed
+
+    def question(self):
+        """(new book, book to compare it with) for the next comparison."""
+        state = self.state
+        index = probe_index(state)
+        if state['phase'] == 'sort':
+            return db.session.get(Book, state['pending'][0]), db.session.get(Book, state['sorted'][index])
+        subject = db.session.get(Book, state['sorted'][len(state['placements'])])
+        compared_id = self._shelf().offset(index).limit(1).first()[0]
+        return subject, db.session.get(Book, compared_id)
+
+    def record(self, preferred):
+        """Apply the answer to the current question; ``preferred`` means the new book won."""
+        state = self.state
+        if state['phase'] == 'merge' and shelf_version(state['user_id'], state['sentiment']) != state['version']:
+            self._begin_merge()
+            self._settle()
+            return False
+
+        index = probe_index(state)
+        if preferred:
+            state['hi'] = index
+        else:
+            state['lo'] = index + 1
+
+        if state['lo'] >= state['hi']:
+            if state['phase'] == 'sort':
+                state['sorted'].insert(state['lo'], state['pending'].pop(0))
+                if state['pending']:
+                    state['lo'], state['hi'] = 0, len(state['sorted'])
+                else:
+                    self._begin_merge()
+            else:
+                state['placements'].append(state['lo'])
+                state['hi'] = state['size']
+        self._settle()
+        return True
+
+    def save_positions(self):
+        """Write every new book's final position in one bulk update and commit.
+
+        Returns False, with the merge started over, if the shelf changed since
+        the merge began.
+        """
+        mappings = merge_positions(self._shelf().all(), self.state['sorted'], self.state['placements'])
+        db.session.bulk_update_mappings(Book, mappings)
+        try:
+            refresh_shelf(self.state['user_id'], self.state['sentiment'], self.state['version'])
+            db.session.commit()
+        except ShelfConflict:
+            db.session.rollback()
+            self._begin_merge()
+            self._settle()
+            return False
+        return True
+
+    def finish(self):
+        self.store.delete(self.token)
+        session.pop(SESSION_KEY, None)
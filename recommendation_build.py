@@ -0,0 +1,162 @@
+"""``flask recommendations-build``: the ``BookSimilarity`` lists recommendations.py serves.
+
+Ratings are read from the shelf summaries into a sparse reader × book
+matrix, books matched to the catalog by ``catalog_key``, each rating stored
+as its distance from ``NEUTRAL_RATING``. Two books are as similar as the
+cosine of their columns, shrunk towards zero when few readers rated both
+(two readers in common prove little), and only books with a positive
+similarity are kept, the ``RECOMMENDATIONS_NEIGHBORS`` best for each book.
+
+Comparing every book with every other is one sparse product, computed with
+SciPy for a block of books at a time: blocks are sized so that each makes
+about ``RECOMMENDATIONS_BLOCK_PRODUCTS`` multiplications, which bounds
+memory however popular the books in it, and the best neighbors of every
+book in a block are picked with one sort over the block's non-zero entries.
+Nothing is done per reader pair, so the cost grows with the ratings rather
+than with the square of the readers.
+
+Books added before the catalog existed need `flask catalog-backfill` first.
+"""
+import importlib
+import json
+from array import array
+from datetime import datetime
+
+import numpy as np
+from scipy import sparse
+
+from catalog import catalog_key
+from models import db, BookSimilarity, CatalogBook, Shelf
+from recommendations import NEUTRAL_RATING
+
+INSERT_BATCH = 1000
+
+
+def load_ratings():
+    """(reader ids, catalog book ids, ratings) arrays with one entry per shelved book that is in the catalog."""
+    catalog = dict(db.session.query(CatalogBook.key, CatalogBook.id))
+    matched = {}  # (title, author) -> catalog id: popular books are on many shelves, normalize them once
+    readers, books, ratings = array('q'), array('q'), array('f')
+    for user_id, entries in db.session.query(Shelf.user_id, Shelf.entries).yield_per(1000):
+        for _, title, author, _, rating in json.loads(entries):
+            book_id = matched.get((title, author), 0)
+            if book_id == 0:
+                book_id = matched[title, author] = catalog.get(catalog_key(title, author))
+            if book_id is not None:
+                readers.append(user_id)
+                books.append(book_id)
+                ratings.append(rating)
+    return np.frombuffer(readers, np.int64), np.frombuffer(books, np.int64), np.frombuffer(ratings, np.float32)
+
+
+def rating_matrix(readers, books, ratings):
+    """(CSR reader × book matrix of ratings minus ``NEUTRAL_RATING``, catalog book id of each column).
+
+    A book shelved twice by the same reader counts once; neutral ratings say
+    nothing either way and are left out.
+    """
+    reader_ids, rows = np.unique(readers, return_inverse=True)
+    book_ids, columns = np.unique(books, return_inverse=True)
+    _, first = np.unique(rows * len(book_ids) + columns, return_index=True)
+    matrix = sparse.csr_matrix((ratings[first] - NEUTRAL_RATING, (rows[first], columns[first])),
+                               shape=(len(reader_ids), len(book_ids)), dtype=np.float32)
+    matrix.eliminate_zeros()
+    return matrix, book_ids
+
+
+def _blocks(work, budget):
+    """(start, stop) ranges of rows whose ``work`` adds up to about ``budget``; at least one row each."""
+    total = np.cumsum(work)
+    start = 0
+    while start < len(work):
+        done = total[start - 1] if start else 0
+        stop = max(int(np.searchsorted(total, done + budget, side='right')), start + 1)
+        yield start, stop
+        start = stop
+
+
+def top_neighbors(matrix, k=20, min_common=2, shrinkage=10, block_products=20_000_000):
+    """Yield (column, neighbor columns, similarities) for every column of ``matrix`` with a positive neighbor.
+
+    Similarity is the cosine of two columns times ``common / (common + shrinkage)``,
+    where ``common`` is how many rows have both; pairs with fewer than
+    ``min_common`` are skipped. Neighbors come most similar first, ``k`` at most.
+    """
+    books = matrix.T.tocsr()  # book × reader
+    readers = matrix.tocsr()
+    norms = np.sqrt(np.asarray(books.multiply(books).sum(axis=1)).ravel())
+    rated, rated_by = books.copy(), readers.copy()
+    rated.data[:] = 1
+    rated_by.data[:] = 1
+    # Multiplications a book's row of the product takes: the ratings of everyone who rated it
+    work = rated @ np.diff(readers.indptr).astype(np.float64)
+
+    for start, stop in _blocks(work, block_products):
+        common = rated[start:stop] @ rated_by
+        common.data = np.where(common.data >= min_common, common.data / (common.data + shrinkage), 0)
+        common.eliminate_zeros()
+        scores = (books[start:stop] @ readers).multiply(common).tocsr()
+
+        rows = np.repeat(np.arange(stop - start), np.diff(scores.indptr))
+        columns = scores.indices
+        similarities = scores.data / (norms[start + rows] * norms[columns])
+        keep = (similarities > 0) & (columns != start + rows)
+        rows, columns, similarities = rows[keep], columns[keep], similarities[keep]
+
+        # Best first within each row, then cut every row at k
+        order = np.lexsort((-similarities, rows))
+        rows, columns, similarities = rows[order], columns[order], similarities[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        top = rank < k
+        rows, columns, similarities = rows[top], columns[top], similarities[top]
+
+        bounds = np.flatnonzero(np.diff(rows)) + 1
+        for row, row_columns, row_similarities in zip(rows[np.r_[0, bounds]] if len(rows) else [],
+                                                      np.split(columns, bounds), np.split(similarities, bounds)):
+            yield start + int(row), row_columns, row_similarities
+
+
+def replace_lists(rows):
+    """Write ``BookSimilarity`` rows over the ones their books had, in one statement, and commit."""
+    if not rows:
+        return
+    table = BookSimilarity.__table__
+    # SQLite's and Postgres's INSERT ... ON CONFLICT, as in leaderboard.apply_deltas
+    statement = importlib.import_module(f'sqlalchemy.dialects.{db.engine.dialect.name}').insert(table)
+    statement = statement.on_conflict_do_update(index_elements=[table.c.catalog_book_id], set_={
+        'neighbors': statement.excluded.neighbors,
+        'built_at': statement.excluded.built_at,
+    })
+    db.session.execute(statement, rows)
+    db.session.commit()
+
+
+def build_similarities(config):
+    """Replace every ``BookSimilarity`` row with freshly computed lists, and commit. Returns the number of books listed.
+
+    Each batch of lists overwrites its books' old ones in a short transaction
+    of its own, and the lists of books left with no neighbors are deleted
+    last, so readers always find a complete list and writers are never held
+    up by the build.
+    """
+    matrix, book_ids = rating_matrix(*load_ratings())
+    db.session.commit()  # let go of the snapshot the ratings were read in before the long computation
+    built_at = datetime.utcnow()
+    rows = []
+    count = 0
+    neighbors = top_neighbors(matrix, k=config['RECOMMENDATIONS_NEIGHBORS'],
+                              min_common=config['RECOMMENDATIONS_MIN_COMMON'],
+                              shrinkage=config['RECOMMENDATIONS_SHRINKAGE'],
+                              block_products=config['RECOMMENDATIONS_BLOCK_PRODUCTS'])
+    for column, columns, similarities in neighbors:
+        rows.append({'catalog_book_id': int(book_ids[column]), 'built_at': built_at,
+                     'neighbors': json.dumps(list(zip(book_ids[columns].tolist(),
+                                                      np.round(similarities.astype(np.float64), 4).tolist())))})
+        if len(rows) == INSERT_BATCH:
+            replace_lists(rows)
+            count += len(rows)
+            rows = []
+    replace_lists(rows)
+    BookSimilarity.query.filter(BookSimilarity.built_at < built_at).delete(synchronize_session=False)
+    db.session.commit()
+    return count + len(rows)
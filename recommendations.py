@@ -0,0 +1,84 @@
+"""Book suggestions served from the ``BookSimilarity`` lists (see recommendation_build.py).
+
+"Readers who loved this also loved" is one primary-key read of a book's
+list. A reader's suggestions add up the lists of every book on their
+shelves, each weighted by how far the reader's rating of it is from
+``NEUTRAL_RATING``: the neighbors of beloved books rise, those of disliked
+books sink, and books already shelved are left out. Both take a few small
+queries and no matrix work; the lists are rebuilt in the background by the
+``build_recommendations`` job or `flask recommendations-build`.
+"""
+import heapq
+import json
+from collections import defaultdict, namedtuple
+
+from flask import current_app
+
+from catalog import catalog_key
+from jobs import PENDING, enqueue
+from models import db, BookSimilarity, CatalogBook, Job
+from shelves import RATING_BANDS
+
+# Ratings above this count for a book, ratings below it against: the middle of the tolerated band
+NEUTRAL_RATING = sum(RATING_BANDS['tolerated']) / 2
+
+Suggestion = namedtuple('Suggestion', 'id title author google_books_url cover_url score')
+
+
+def catalog_ids(entries):
+    """{catalog_key: catalog book id} for the ``ShelfEntry`` objects that are in the catalog."""
+    keys = {catalog_key(entry.title, entry.author) for entry in entries}
+    if not keys:
+        return {}
+    return dict(db.session.query(CatalogBook.key, CatalogBook.id).filter(CatalogBook.key.in_(keys)))
+
+
+def _suggestions(scored):
+    """``Suggestion`` for each (score, catalog book id), in the given order."""
+    if not scored:
+        return []
+    books = {book.id: book for book in db.session.query(
+        CatalogBook.id, CatalogBook.title, CatalogBook.author, CatalogBook.google_books_url,
+        CatalogBook.cover_url).filter(CatalogBook.id.in_([book_id for _, book_id in scored]))}
+    return [Suggestion(*books[book_id], round(score, 4)) for score, book_id in scored if book_id in books]
+
+
+def similar_books(catalog_book_id, limit=10):
+    """The books readers who loved ``catalog_book_id`` also loved, most similar first."""
+    neighbors = db.session.query(BookSimilarity.neighbors).filter_by(catalog_book_id=catalog_book_id).scalar()
+    if not neighbors:
+        return []
+    return _suggestions([(similarity, book_id) for book_id, similarity in json.loads(neighbors)[:limit]])
+
+
+def suggest(shelves, limit=10):
+    """Books for the reader whose ``read_shelves`` are ``shelves``, best first."""
+    entries = [entry for sentiment_entries in shelves.values() for entry in sentiment_entries]
+    ids = catalog_ids(entries)
+    weights = {}
+    for entry in entries:
+        book_id = ids.get(catalog_key(entry.title, entry.author))
+        if book_id is not None:
+            weights[book_id] = entry.rating - NEUTRAL_RATING
+    if not weights:
+        return []
+
+    scores = defaultdict(float)
+    rows = db.session.query(BookSimilarity.catalog_book_id, BookSimilarity.neighbors) \
+        .filter(BookSimilarity.catalog_book_id.in_(list(weights)))
+    for book_id, neighbors in rows:
+        weight = weights[book_id]
+        for similar_id, similarity in json.loads(neighbors):
+            if similar_id not in weights:
+                scores[similar_id] += weight * similarity
+    return _suggestions(heapq.nlargest(limit, ((score, book_id) for book_id, score in scores.items() if score > 0)))
+
+
+def build_recommendations():
+    """Job handler: rebuild every list, then queue the next rebuild ``RECOMMENDATIONS_INTERVAL`` seconds out."""
+    # Imported here so web processes never load NumPy or SciPy
+    from recommendation_build import build_similarities
+    build_similarities(current_app.config)
+    interval = current_app.config['RECOMMENDATIONS_INTERVAL']
+    if interval and not db.session.query(Job.id).filter_by(kind='build_recommendations', status=PENDING).first():
+        enqueue('build_recommendations', delay=interval)
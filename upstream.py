@@ -0,0 +1,203 @@
+"""Pooled, timeout-bounded clients for the Google Books volumes API.
+
+``GoogleBooksClient`` keeps a keep-alive connection pool in a
+``requests.Session`` and bounds every call with connect/read deadlines, so a
+slow Google can no longer pin a sync gunicorn worker. A shared
+``CircuitBreaker`` fails fast once upstream keeps erroring; callers catch
+``UpstreamUnavailable`` and fall back to cached or empty results.
+
+``AsyncGoogleBooksClient`` is the asyncio flavour for async workers and
+batch jobs that multiplex many lookups over one pool; it needs ``httpx``.
+"""
+import threading
+import time
+
+from book_lookup import parse_volume_details, parse_volumes
+
+
+class UpstreamUnavailable(Exception):
+    pass
+
+
+class CircuitOpen(UpstreamUnavailable):
+    """Refused without asking upstream; ``retry_after`` is how many seconds until a call may be let through."""
+
+    def __init__(self, retry_after):
+        super().__init__('Google Books circuit is open')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures.
+
+    While open every call is refused until ``reset_timeout`` has passed, then
+    a single trial call is let through (half-open); its outcome closes or
+    re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def retry_after(self):
+        """Seconds until ``allow`` would let a call through, 0 if it would now. Changes nothing."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0
+            if self.state == self.OPEN:
+                return max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+            return self.reset_timeout  # half-open: the trial call has not come back yet
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+
+
+def _is_upstream_failure(status_code):
+    return status_code == 429 or status_code >= 500
+
+
+def _observe(observer, seconds, outcome):
+    if observer is not None:
+        observer(seconds, outcome)
+
+
+def _handle_response(client, response, seconds):
+    """Shared by both clients: feed the breaker and return the decoded body ({} for a client error)."""
+    if _is_upstream_failure(response.status_code):
+        _observe(client.observer, seconds, 'error')
+        client.breaker.record_failure()
+        raise UpstreamUnavailable(f'Google Books returned {response.status_code}')
+    _observe(client.observer, seconds, 'ok')
+    client.breaker.record_success()
+    if response.status_code != 200:
+        return {}
+    return response.json()
+
+
+def volume_query(title, author):
+    return f'intitle:"{title}" inauthor:"{author}"'
+
+
+class GoogleBooksClient:
+    def __init__(self, base_url, connect_timeout=2.0, read_timeout=3.0, pool_size=10,
+                 retries=1, max_results=5, breaker=None, observer=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_results = max_results
+        self.breaker = breaker or CircuitBreaker()
+        self.observer = observer
+        self._exceptions = requests.RequestException
+
+        # Only connection failures are retried: a read timeout already spent
+        # the caller's budget and a retry would double it.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=Retry(total=retries, connect=retries, read=0, status=0,
+                                                backoff_factor=0.1, allowed_methods=['GET']))
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _get(self, query, max_results):
+        if not self.breaker.allow():
+            _observe(self.observer, 0.0, 'rejected')
+            raise CircuitOpen(self.breaker.retry_after())
+        started = time.perf_counter()
+        try:
+            response = self.session.get(self.base_url, params={'q': query, 'maxResults': max_results},
+                                        timeout=self.timeout)
+        except self._exceptions as exc:
+            _observe(self.observer, time.perf_counter() - started, 'error')
+            self.breaker.record_failure()
+            raise UpstreamUnavailable(str(exc)) from exc
+        return _handle_response(self, response, time.perf_counter() - started)
+
+    def search(self, query):
+        return parse_volumes(self._get(query, self.max_results))
+
+    def volume(self, title, author):
+        """Details of the best match for one book, or None."""
+        volumes = parse_volume_details(self._get(volume_query(title, author), 1))
+        return volumes[0] if volumes else None
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncGoogleBooksClient:
+    def __init__(self, base_url, connect_timeout=2.0, read_timeout=3.0, max_connections=100,
+                 max_keepalive=20, retries=1, max_results=5, breaker=None, observer=None):
+        try:
+            import httpx
+        except ImportError as exc:
+            raise RuntimeError('AsyncGoogleBooksClient requires httpx (pip install httpx)') from exc
+
+        self.base_url = base_url
+        self.max_results = max_results
+        self.breaker = breaker or CircuitBreaker()
+        self.observer = observer
+        self._exceptions = httpx.HTTPError
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            transport=httpx.AsyncHTTPTransport(retries=retries),
+        )
+
+    async def _get(self, query, max_results):
+        if not self.breaker.allow():
+            _observe(self.observer, 0.0, 'rejected')
+            raise CircuitOpen(self.breaker.retry_after())
+        started = time.perf_counter()
+        try:
+            response = await self.client.get(self.base_url, params={'q': query, 'maxResults': max_results})
+        except self._exceptions as exc:
+            _observe(self.observer, time.perf_counter() - started, 'error')
+            self.breaker.record_failure()
+            raise UpstreamUnavailable(str(exc)) from exc
+        return _handle_response(self, response, time.perf_counter() - started)
+
+    async def search(self, query):
+        return parse_volumes(await self._get(query, self.max_results))
+
+    async def volume(self, title, author):
+        volumes = parse_volume_details(await self._get(volume_query(title, author), 1))
+        return volumes[0] if volumes else None
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
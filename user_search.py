@@ -0,0 +1,94 @@
+"""Username search for /search_users.
+
+Usernames starting with the query come first, served by the
+``lower(username)`` index as a range scan; names that merely contain it
+follow, on Postgres only and for queries of at least ``SUBSTRING_MIN_LENGTH``
+characters: that is where the trigram index can answer a ``LIKE '%term%'``,
+which is a scan of every user anywhere else. Results are keyset-paginated on
+(tier, lower(username), id) and only ``id``, ``username`` and
+``profile_image`` are loaded, so the first page costs the same however many
+users match.
+
+Pages are cached for ``ttl`` seconds under the highest user id. Usernames and
+profile images never change once a user exists, so a registration, in any
+worker, is what makes a page stale, and it moves every later search to new
+cache entries.
+"""
+import base64
+from collections import namedtuple
+
+from sqlalchemy import and_, func, not_, or_
+
+from cache import TTLCache
+from models import db, User
+
+PREFIX, SUBSTRING = 0, 1
+# pg_trgm can only use its index for patterns of three or more characters
+SUBSTRING_MIN_LENGTH = 3
+
+UserResult = namedtuple('UserResult', 'id username profile_image')
+
+_sort_name = func.lower(User.username)
+
+
+def encode_cursor(tier, name, user_id):
+    return base64.urlsafe_b64encode(f'{tier}:{user_id}:{name}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        tier, user_id, name = base64.urlsafe_b64decode(cursor.encode()).decode().split(':', 2)
+        return int(tier), name, int(user_id)
+    except (ValueError, UnicodeDecodeError):
+        return PREFIX, None, None
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class UserSearch:
+    def __init__(self, page_size=20, ttl=30, maxsize=1024):
+        self.page_size = page_size
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def search(self, query, cursor=None):
+        """Returns (list of UserResult, cursor for the next page or None)."""
+        term = query.strip().lower()
+        if not term:
+            return [], None
+        key = (term, cursor, db.session.query(func.max(User.id)).scalar())
+        page = self._cache.get(key)
+        if page is None:
+            page = self._search(term, cursor)
+            self._cache.set(key, page)
+        return page
+
+    def _tier_query(self, tier, term, after_name, after_id, limit):
+        # Prefix matches as an index range; the upper bound is the last string starting with term
+        is_prefix = and_(_sort_name >= term, _sort_name < term + '\U0010ffff')
+        match = is_prefix if tier == PREFIX else \
+            and_(_sort_name.like(f'%{_escape_like(term)}%', escape='\\'), not_(is_prefix))
+        query = db.session.query(User.id, User.username, User.profile_image, _sort_name).filter(match)
+        if after_name is not None:
+            query = query.filter(or_(_sort_name > after_name, and_(_sort_name == after_name, User.id > after_id)))
+        return query.order_by(_sort_name, User.id).limit(limit).all()
+
+    def _search(self, term, cursor):
+        tier, after_name, after_id = decode_cursor(cursor) if cursor else (PREFIX, None, None)
+        tiers = (PREFIX, SUBSTRING) if db.engine.dialect.name == 'postgresql' \
+            and len(term) >= SUBSTRING_MIN_LENGTH else (PREFIX,)
+        results = []
+        for current_tier in tiers:
+            if current_tier < tier:
+                continue
+            if current_tier > tier:
+                after_name = after_id = None
+            wanted = self.page_size - len(results)
+            rows = self._tier_query(current_tier, term, after_name, after_id, wanted + 1)
+            results += [(current_tier, row) for row in rows]
+            if len(rows) > wanted:
+                results = results[:self.page_size]
+                last_tier, last = results[-1]
+                return [UserResult(*row[:3]) for _, row in results], encode_cursor(last_tier, last[3], last[0])
+        return [UserResult(*row[:3]) for _, row in results], None
@@ -0,0 +1,490 @@
+"""The HTML pages: accounts, profiles, searching, suggestions, the leaderboard, and adding and ranking books."""
+from flask import (Blueprint, Response, current_app, flash, jsonify, make_response, redirect, render_template,
+                   request, stream_with_context, url_for)
+from flask_login import current_user, login_required, login_user, logout_user
+
+from avatars import avatar_path, render_avatar
+from catalog import merge_results, record_book, search_catalog
+from extensions import book_lookup, identities, login_manager, profile_cache, ranking_store, user_search
+from feed import VERBS, follow, is_following, read_feed, record_ranking, unfollow
+from jobs import enqueue
+from leaderboard import top_books
+from library_io import LibraryFormatError, export_library, import_library
+from models import db, User, Book
+from ordering import GAP, place_book, prepend_position
+from passwords import HashingBusy
+from profile_cache import not_modified, set_validators
+from ranking import BatchRanking, Ranking
+from recommendations import catalog_ids, similar_books, suggest
+from shelves import (SENTIMENTS, ShelfConflict, commit_shelf_change, read_shelves, refresh_shelf, shelf_states,
+                     shelf_version)
+
+main = Blueprint('main', __name__)
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    return identities.load(user_id)
+
+
+@main.app_errorhandler(ShelfConflict)
+def shelf_conflict(error):
+    # commit_shelf_change gave up: the shelf is being changed elsewhere in a tight loop
+    db.session.rollback()
+    flash('Your shelf is being changed somewhere else right now. Please try again.')
+    return redirect(url_for('main.profile', username=current_user.username))
+
+
+@main.app_errorhandler(HashingBusy)
+def hashing_busy(error):
+    # Shed the excess of a login storm quickly instead of tying up more threads
+    db.session.rollback()
+    return 'Too many people are logging in right now. Please try again in a moment.', 503, {'Retry-After': '2'}
+
+
+@main.route('/')
+def home():
+    return render_template('home.html')
+
+
+@main.route('/register', methods=['GET', 'POST'])
+def register():
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+
+        user = User.query.filter_by(username=username).first()
+        if user:
+            flash('Username already exists')
+            return redirect(url_for('main.register'))
+
+        new_user = User(username=username, profile_image=avatar_path(username))
+        new_user.set_password(password)
+        db.session.add(new_user)
+        db.session.commit()
+
+        flash('Registration successful! Please log in.')
+        return redirect(url_for('main.login'))
+    return render_template('register.html')
+
+
+@main.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        user = User.query.filter_by(username=username).first()
+        if user and user.check_password(password):
+            db.session.commit()  # a rehashed password
+            login_user(user)
+            return redirect(url_for('main.profile', username=user.username))
+        flash('Invalid username or password')
+    return render_template('login.html')
+
+
+@main.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    return redirect(url_for('main.home'))
+
+
+@main.route('/profile/<username>')
+@login_required
+def profile(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    is_own_profile = current_user.id == user.id
+    states = shelf_states(user.id)
+    following = not is_own_profile and is_following(current_user.id, user.id)
+    etag = profile_cache.etag(user.id, states, current_user.id, following)
+    last_modified = max((state.updated_at for state in states.values()), default=None)
+    if etag in request.if_none_match:
+        return not_modified(etag, last_modified)
+
+    sections = []
+    favorite = None
+    start = 1
+    for sentiment in SENTIMENTS:
+        state = states.get(sentiment)
+        section, first = profile_cache.section(user.id, sentiment, state, start, is_own_profile)
+        sections.append(section)
+        if sentiment == 'beloved':
+            favorite = first
+        start += state.book_count if state else 0
+
+    response = make_response(render_template('profile.html', user=user, sections=sections, favorite=favorite,
+                                             is_own_profile=is_own_profile, following=following))
+    return set_validators(response, etag, last_modified)
+
+
+@main.app_template_global()
+def avatar_url(user):
+    return user.profile_image or avatar_path(user.username)
+
+
+# A path converter, because servers decode the escaped "/" that a username may contain before routing
+@main.route('/avatar/<path:username>.svg')
+def avatar(username):
+    body, etag = render_avatar(username)
+    response = make_response(body)
+    response.mimetype = 'image/svg+xml'
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['ASSETS_MAX_AGE']
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+
+@main.route('/search_users')
+def search_users():
+    query = request.args.get('query', '')
+    if query:
+        users, next_cursor = user_search.search(query, cursor=request.args.get('cursor'))
+        return render_template('search_users.html', users=users, query=query, next_cursor=next_cursor)
+    return render_template('search_users.html')
+
+
+@main.route('/discover')
+@login_required
+def discover():
+    shelves = read_shelves(current_user.id)
+    favorite = shelves['beloved'][0] if shelves['beloved'] else None
+    also_loved = []
+    if favorite is not None:
+        favorite_id = next(iter(catalog_ids([favorite]).values()), None)
+        also_loved = similar_books(favorite_id) if favorite_id is not None else []
+    return render_template('discover.html', suggestions=suggest(shelves), favorite=favorite, also_loved=also_loved)
+
+
+@main.route('/follow/<username>', methods=['POST'])
+@login_required
+def follow_user(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    if user.id != current_user.id:
+        follow(current_user.id, user.id)
+        db.session.commit()
+    return redirect(url_for('main.profile', username=username))
+
+
+@main.route('/unfollow/<username>', methods=['POST'])
+@login_required
+def unfollow_user(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    unfollow(current_user.id, user.id)
+    db.session.commit()
+    return redirect(url_for('main.profile', username=username))
+
+
+@main.route('/feed')
+@login_required
+def feed():
+    items, next_cursor = read_feed(current_user.id, request.args.get('before', type=int),
+                                   current_app.config['FEED_PAGE_SIZE'])
+    return render_template('feed.html', items=items, next_cursor=next_cursor)
+
+
+@main.route('/leaderboard')
+def leaderboard():
+    return render_template('leaderboard.html', books=top_books(current_app.config['LEADERBOARD_SIZE']))
+
+
+@main.route('/search_books')
+def search_books():
+    query = request.args.get('query', '')
+    if query:
+        books = search_catalog(query)
+        if len(books) < current_app.config['CATALOG_MIN_RESULTS']:
+            books = merge_results(books, book_lookup.search(query))
+        return jsonify(books)
+    return jsonify([])
+
+
+@main.route('/add_book', methods=['POST'])
+@login_required
+def add_book():
+    title = request.form.get('title')
+    author = request.form.get('author')
+    sentiment = request.form.get('sentiment')
+    google_books_url = request.form.get('google_books_url')  # New field
+
+    if not all([title, author, sentiment]):
+        missing_fields = [field for field in ['title', 'author', 'sentiment'] if not request.form.get(field)]
+        flash(f"Error: Missing required fields: {', '.join(missing_fields)}")
+        return redirect(url_for('main.search_books'))
+
+    def add():
+        new_book = Book(
+            title=title,
+            author=author,
+            sentiment=sentiment,
+            user_id=current_user.id,
+            # At the top until its ranking settles; positions above the first book's are negative
+            position=prepend_position(current_user.id, sentiment),
+            google_books_url=google_books_url  # Add the Google Books URL
+        )
+        db.session.add(new_book)
+        record_book(title, author, google_books_url)
+        refresh_shelf(current_user.id, sentiment)
+        db.session.flush()
+        enqueue('enrich_book', {'book_id': new_book.id})
+        return new_book
+
+    new_book = commit_shelf_change(add)
+
+    flash('Book added successfully!')
+    return redirect(url_for('main.rate_new_book', book_id=new_book.id))
+
+
+@main.route('/rate_new_book/<int:book_id>')
+@login_required
+def rate_new_book(book_id):
+    new_book = db.session.get(Book, book_id)
+    if not new_book or new_book.user_id != current_user.id:
+        flash('Book not found.')
+        return redirect(url_for('main.profile', username=current_user.username))
+
+    version = shelf_version(new_book.user_id, new_book.sentiment)
+    ranking = Ranking.start(ranking_store, new_book, 'rate', current_app.config['RANKING_STRATEGY'],
+                            current_app.config['RANKING_TOLERANCE'])
+    if ranking is None:
+        new_book.position = GAP
+        try:
+            refresh_shelf(new_book.user_id, new_book.sentiment, version)
+            record_ranking(new_book, VERBS['rate'])
+            db.session.commit()
+        except ShelfConflict:
+            # Another book landed on the shelf meanwhile: rank against it
+            db.session.rollback()
+            return redirect(url_for('main.rate_new_book', book_id=book_id))
+        flash('Book rating completed!')
+        return redirect(url_for('main.profile', username=current_user.username))
+
+    db.session.commit()  # the ranking state
+    return render_template('rate_new_book.html', new_book=new_book, compared_book=ranking.compared_book)
+
+
+def advance_ranking(ranking, book, compared_book, preference):
+    """Apply one comparison. Returns the next book to compare, or None once the book's spot is found.
+
+    The caller commits the ranking's new state.
+    """
+    if compared_book is None or compared_book.id != ranking.state['probe_id']:
+        # A replayed or out-of-date form, or the book was deleted meanwhile: ask the current question again
+        return ranking.current_probe() or ranking.restart(book)
+    if ranking.is_stale(book):
+        flash('Your shelf changed while you were ranking, so the comparison has started over.')
+        return ranking.restart(book)
+    if ranking.record(preference == 1):
+        return None
+    return ranking.probe(book)
+
+
+def settle_ranking(ranking, book):
+    """Move a book to the spot its finished ranking found, record it in the feed and commit.
+
+    Returns (next book to compare, moved). The next book is None once the
+    book is placed; otherwise the shelf changed since the comparisons were
+    made (another tab or worker got there first) and the search restarted,
+    and the caller commits its new state.
+    """
+    if ranking.state['size'] and place_book(book, *ranking.placement(book)):
+        try:
+            refresh_shelf(book.user_id, book.sentiment, ranking.state['version'])
+            record_ranking(book, VERBS[ranking.state['mode']])
+            ranking.finish()
+            db.session.commit()
+            return None, True
+        except ShelfConflict:
+            db.session.rollback()
+            if db.session.get(Book, ranking.state['book_id']) is None:
+                ranking.finish()  # deleted meanwhile, so there is nothing left to place
+                db.session.commit()
+                return None, False
+            flash('Your shelf changed while you were ranking, so the comparison has started over.')
+            next_book = ranking.restart(book)
+            if next_book is not None:
+                return next_book, False
+    ranking.finish()
+    if ranking.state['mode'] == 'rate':
+        # A new book that beat everything keeps the top spot it was added at, but it was still ranked
+        record_ranking(book, VERBS['rate'])
+    db.session.commit()
+    return None, False
+
+
+@main.route('/compare_books', methods=['POST'])
+@login_required
+def compare_books():
+    ranking = Ranking.resume(ranking_store, 'rate')
+    if ranking is None:
+        flash('Your ranking session has expired. Please rate the book again.')
+        return redirect(url_for('main.profile', username=current_user.username))
+
+    compared_book_id = int(request.form['compared_book_id'])
+    preference = int(request.form['preference'])
+
+    new_book = db.session.get(Book, ranking.state['book_id'])
+    compared_book = db.session.get(Book, compared_book_id)
+
+    if not new_book:
+        flash('Error: Book not found.')
+        return redirect(url_for('main.profile', username=current_user.username))
+
+    next_book = advance_ranking(ranking, new_book, compared_book, preference)
+    if next_book is None:
+        # We've found the position for the new book
+        next_book, _ = settle_ranking(ranking, new_book)
+    if next_book is None:
+        flash('Book rating completed!')
+        return redirect(url_for('main.profile', username=current_user.username))
+
+    db.session.commit()  # the ranking state
+    return render_template('rate_new_book.html', new_book=new_book, compared_book=next_book)
+
+
+def batch_ranking_step(ranking):
+    if not ranking.state['book_ids']:
+        ranking.finish()
+        db.session.commit()
+        flash('The books being ranked were deleted, so there is nothing left to place.')
+        return redirect(url_for('main.profile', username=current_user.username))
+    if ranking.done:
+        if not ranking.save_positions():
+            flash('Your shelf changed while you were ranking, so placing the new books has started over.')
+            return batch_ranking_step(ranking)
+        ranking.finish()
+        db.session.commit()
+        flash(f'{len(ranking.state["book_ids"])} books ranked!')
+        return redirect(url_for('main.profile', username=current_user.username))
+
+    new_book, compared_book = ranking.question()
+    placed, total = ranking.progress
+    db.session.commit()  # the ranking state
+    return render_template('rank_batch.html', new_book=new_book, compared_book=compared_book,
+                           placed=placed, total=total)
+
+
+@main.route('/rank_batch', methods=['POST'])
+@login_required
+def rank_batch():
+    book_ids = request.form.getlist('book_id', type=int)
+    books = Book.query.filter(Book.id.in_(book_ids), Book.user_id == current_user.id).order_by(Book.id).all()
+    if not books:
+        flash('No books selected for ranking.')
+        return redirect(url_for('main.profile', username=current_user.username))
+    if len({book.sentiment for book in books}) > 1:
+        flash('Books ranked together must all be on the same shelf.')
+        return redirect(url_for('main.profile', username=current_user.username))
+
+    return batch_ranking_step(BatchRanking.start(ranking_store, books))
+
+
+@main.route('/rank_batch/compare', methods=['POST'])
+@login_required
+def compare_batch():
+    ranking = BatchRanking.resume(ranking_store)
+    if ranking is None:
+        flash('Your ranking session has expired. Please start again.')
+        return redirect(url_for('main.profile', username=current_user.username))
+
+    compared_book_id = int(request.form['compared_book_id'])
+    preference = int(request.form['preference'])
+
+    # Only apply answers to the question currently being asked; replayed forms just re-ask it
+    if ranking.refresh():
+        flash('Your shelf changed while you were ranking, so placing the new books has started over.')
+    elif not ranking.done and ranking.question()[1].id == compared_book_id:
+        if not ranking.record(preference == 1):
+            flash('Your shelf changed while you were ranking, so placing the new books has started over.')
+    return batch_ranking_step(ranking)
+
+
+@main.route('/delete_book/<int:book_id>', methods=['POST'])
+@login_required
+def delete_book(book_id):
+    book = Book.query.get_or_404(book_id)
+    if book.user_id != current_user.id:
+        flash('You do not have permission to delete this book.')
+        return redirect(url_for('main.profile', username=current_user.username))
+
+    def delete():
+        # Positions are sparse keys, so the rest of the shelf keeps its order untouched
+        db.session.delete(book)
+        refresh_shelf(book.user_id, book.sentiment)
+
+    commit_shelf_change(delete)
+    flash('Book deleted successfully.')
+    return redirect(url_for('main.profile', username=current_user.username))
+
+
+@main.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_books():
+    if request.method == 'POST':
+        upload = request.files.get('library')
+        if not upload or not upload.filename:
+            return render_template('import.html', error='Choose a CSV file to import.'), 400
+        try:
+            result = import_library(current_user.id, upload.stream)
+        except LibraryFormatError as exc:
+            return render_template('import.html', error=f'Could not import {upload.filename}: {exc}'), 400
+        # Books imported without a Google Books link get one in the background
+        enqueue('backfill_google_urls', {'user_id': current_user.id})
+        db.session.commit()
+        flash(f'Imported {result.imported} books. Tick any of them on your profile to rank them against the rest.')
+        return redirect(url_for('main.profile', username=current_user.username))
+    return render_template('import.html')
+
+
+@main.route('/export.csv')
+@login_required
+def export_books():
+    return Response(stream_with_context(export_library(current_user.id)), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={current_user.username}-library.csv'})
+
+
+@main.route('/initiate_rerank/<int:book_id>')
+@login_required
+def initiate_rerank(book_id):
+    book_to_rerank = Book.query.get_or_404(book_id)
+    if book_to_rerank.user_id != current_user.id:
+        flash('You do not have permission to rerank this book.')
+        return redirect(url_for('main.profile', username=current_user.username))
+
+    ranking = Ranking.start(ranking_store, book_to_rerank, 'rerank', current_app.config['RANKING_STRATEGY'],
+                            current_app.config['RANKING_TOLERANCE'])
+    if ranking is None:
+        flash('No other books to compare for reranking.')
+        return redirect(url_for('main.profile', username=current_user.username))
+
+    db.session.commit()  # the ranking state
+    return render_template('rerank_book.html', book_to_rerank=book_to_rerank, compared_book=ranking.compared_book)
+
+
+@main.route('/rerank_book', methods=['POST'])
+@login_required
+def rerank_book():
+    ranking = Ranking.resume(ranking_store, 'rerank')
+    if ranking is None:
+        flash('Your ranking session has expired. Please start the rerank again.')
+        return redirect(url_for('main.profile', username=current_user.username))
+
+    compared_book_id = int(request.form['compared_book_id'])
+    preference = int(request.form['preference'])
+
+    book_to_rerank = Book.query.get_or_404(ranking.state['book_id'])
+    compared_book = db.session.get(Book, compared_book_id)
+
+    next_book = advance_ranking(ranking, book_to_rerank, compared_book, preference)
+    if next_book is None:
+        # We've found the new position for the book
+        next_book, moved = settle_ranking(ranking, book_to_rerank)
+    if next_book is None:
+        if moved:
+            flash('Book reranking completed!')
+        else:
+            flash('Book reranking completed! The book remains in its current position.')
+        return redirect(url_for('main.profile', username=current_user.username))
+
+    db.session.commit()  # the ranking state
+    return render_template('rerank_book.html', book_to_rerank=book_to_rerank, compared_book=next_book)